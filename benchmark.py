@@ -0,0 +1,389 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+import subprocess
+import argparse
+import importlib.util
+from contextlib import contextmanager, nullcontext
+
+from fleet import write_fleet
+from snapshot import is_snapshot_file, read_snapshot
+
+#run in this order, later cases reuse the catalog the first one builds
+CASES = ["catalog", "flatten", "tree", "report", "export", "parquet", "ipconfig", "import", "sql-report"]
+#cases that need PostgreSQL, they run against --dsn or a throwaway instance
+DB_CASES = {"import", "sql-report"}
+#snapshots rendered by the tree case, rendering is per snapshot so a sample is enough
+TREE_SAMPLE = 200
+
+
+class Skipped(Exception):
+    """a case that cannot run here, e.g. no display for the tree"""
+
+
+def timed(work):
+    """(result, seconds) of work()"""
+    started = time.perf_counter()
+    result = work()
+    return result, time.perf_counter() - started
+
+
+def timed_peak(work):
+    """(result, seconds, peak bytes allocated by python) of work()"""
+    tracemalloc.start()
+    try:
+        result, seconds = timed(work)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def result(case, items, seconds, peak=None, **extra):
+    entry = {'case': case, 'items': items, 'seconds': round(seconds, 4),
+             'per_second': round(items / seconds, 1) if seconds else None}
+    if peak is not None:
+        entry['peak_mb'] = round(peak / 1048576, 1)
+    entry.update(extra)
+    return entry
+
+
+def load_viewer():
+    """viewer-without-db.py as a module, its file name is not importable"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "viewer-without-db.py")
+    spec = importlib.util.spec_from_file_location("viewer_without_db", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@contextmanager
+def throwaway_postgres():
+    """yield the dsn of a fresh PostgreSQL cluster in a temp directory, removed afterwards"""
+    initdb = shutil.which("initdb")
+    if initdb is None:
+        try:
+            bindir = subprocess.run(["pg_config", "--bindir"], capture_output=True, text=True, check=True).stdout
+            initdb = os.path.join(bindir.strip(), "initdb")
+        except (OSError, subprocess.CalledProcessError):
+            pass
+    if initdb is None or not os.path.exists(initdb):
+        raise Skipped("no --dsn given and initdb not found")
+    pg_ctl = os.path.join(os.path.dirname(initdb), "pg_ctl")
+    base = tempfile.mkdtemp(prefix="inventory-pg-")
+    data = os.path.join(base, "data")
+    try:
+        subprocess.run([initdb, "-D", data, "-A", "trust", "-U", "postgres", "--no-sync"],
+                       check=True, capture_output=True)
+        #unix socket only, in the temp directory, so it never clashes with a real server
+        subprocess.run([pg_ctl, "-D", data, "-w", "-l", os.path.join(base, "server.log"),
+                        "-o", f"-k {base} -c listen_addresses='' -c fsync=off", "start"],
+                       check=True, capture_output=True)
+        try:
+            yield f"host={base} port=5432 user=postgres dbname=postgres"
+        finally:
+            subprocess.run([pg_ctl, "-D", data, "-m", "immediate", "stop"], capture_output=True)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+@contextmanager
+def scratch_schema(conn):
+    """a schema of its own for the database cases, first on the search path and dropped afterwards
+
+    The inventory tables are created unqualified, so everything a case
+    creates lands here and an existing json_files on the server is never touched.
+    """
+    schema = f"bench_{os.getpid()}"
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        cursor.execute(f"CREATE SCHEMA {schema}")
+        cursor.execute(f"SET search_path TO {schema}, public")
+    conn.commit()
+    try:
+        yield schema
+    finally:
+        conn.rollback()
+        with conn.cursor() as cursor:
+            cursor.execute("SET search_path TO DEFAULT")
+            cursor.execute(f"DROP SCHEMA {schema} CASCADE")
+        conn.commit()
+
+
+class Benchmark:
+    """the benchmark cases over one synthetic fleet directory"""
+
+    def __init__(self, fleet_dir, work_dir, workers=None):
+        self.fleet_dir = fleet_dir
+        self.work_dir = work_dir
+        self.workers = workers
+        self.file_paths = [os.path.join(fleet_dir, name) for name in sorted(os.listdir(fleet_dir))
+                           if is_snapshot_file(name)]
+        self.catalog = None
+
+    def get_catalog(self):
+        if self.catalog is None:
+            from catalog import Catalog
+            self.catalog = Catalog(self.fleet_dir, os.path.join(self.work_dir, "fleet.catalog.sqlite3"))
+            self.catalog.refresh(workers=self.workers)
+        return self.catalog
+
+    def run_catalog(self):
+        from catalog import Catalog
+        path = os.path.join(self.work_dir, "fleet.catalog.sqlite3")
+        if os.path.exists(path):
+            os.remove(path)
+        self.catalog = Catalog(self.fleet_dir, path)
+        (parsed, _), seconds = timed(lambda: self.catalog.refresh(workers=self.workers))
+        _, unchanged_seconds = timed(lambda: self.catalog.refresh(workers=self.workers))
+        return [result("catalog refresh", parsed, seconds),
+                result("catalog refresh, nothing changed", len(self.file_paths), unchanged_seconds)]
+
+    def run_flatten(self):
+        from flatten import flatten
+        from report import build_report_row
+        from xlsx_stream import sheet_cells
+        snapshots = [(os.path.basename(path), read_snapshot(path)[0]) for path in self.file_paths]
+
+        def walk(paths):
+            nodes = 0
+            for _, json_data in snapshots:
+                for _ in flatten(json_data, paths=paths):
+                    nodes += 1
+            return nodes
+
+        nodes, seconds = timed(lambda: walk(True))
+        _, keys_seconds = timed(lambda: walk(False))
+        _, cells_seconds = timed(lambda: [sheet_cells(json_data) for _, json_data in snapshots])
+        _, report_seconds = timed(lambda: [build_report_row(filename, json_data) for filename, json_data in snapshots])
+        return [result("flatten, every node", nodes, seconds),
+                result("flatten, every node without paths", nodes, keys_seconds),
+                result("export cells (sheet_cells)", len(snapshots), cells_seconds),
+                result("report rows (build_report_row)", len(snapshots), report_seconds)]
+
+    def run_tree(self):
+        import tkinter as tk
+        from tkinter import ttk
+        viewer = load_viewer()
+
+        class TreeHarness:
+            populate_tree = viewer.JsonViewerApp.populate_tree
+            expand_node = viewer.JsonViewerApp.expand_node
+
+        try:
+            root = tk.Tk()
+        except tk.TclError as e:
+            raise Skipped(f"no display: {e}")
+        try:
+            root.withdraw()
+            harness = TreeHarness()
+            harness.tree = ttk.Treeview(root)
+            snapshots = [read_snapshot(path)[0] for path in self.file_paths[:TREE_SAMPLE]]
+
+            def render(expand):
+                for json_data in snapshots:
+                    harness.tree.delete(*harness.tree.get_children())
+                    harness.tree_nodes = {}
+                    harness.tree_more = {}
+                    harness.populate_tree('', json_data)
+                    #opening every node is what a user clicking through the whole snapshot costs
+                    while expand and harness.tree_nodes:
+                        harness.expand_node(next(iter(harness.tree_nodes)))
+
+            _, seconds = timed(lambda: render(False))
+            _, expanded_seconds = timed(lambda: render(True))
+        finally:
+            root.destroy()
+        return [result("tree render, top level", len(snapshots), seconds),
+                result("tree render, fully expanded", len(snapshots), expanded_seconds)]
+
+    def run_report(self):
+        import exports
+        catalog = self.get_catalog()
+        path = os.path.join(self.work_dir, "minimal_report.csv")
+
+        def catalog_report():
+            columns, rows = exports.catalog_report(catalog)
+            return exports.write_report(path, columns, rows)
+
+        rows, seconds = timed(catalog_report)
+        entries = [result("minimal report from the catalog (csv)", rows, seconds)]
+
+        from report import python_report
+        df, seconds = timed(lambda: python_report(
+            (os.path.basename(file_path), read_snapshot(file_path)[0]) for file_path in self.file_paths))
+        entries.append(result("minimal report from the files (DataFrame)", len(df), seconds))
+        return entries
+
+    def run_export(self):
+        import exports
+        catalog = self.get_catalog()
+        path = os.path.join(self.work_dir, "export.xlsx")
+        count, seconds, peak = timed_peak(lambda: exports.write_export_xlsx(path, catalog.export_cells()))
+        return [result("excel export from the catalog", count, seconds, peak,
+                       file_mb=round(os.path.getsize(path) / 1048576, 1))]
+
+    def run_parquet(self):
+        import parquet_export
+        out = os.path.join(self.work_dir, "parquet")
+        shutil.rmtree(out, ignore_errors=True)
+        (counts, _), seconds, peak = timed_peak(lambda: parquet_export.write_parquet_tables(
+            out, parquet_export.iter_file_inventories(self.file_paths, self.workers)))
+        return [result("parquet long tables from the files", counts['snapshot'], seconds, peak)]
+
+    def run_ipconfig(self):
+        import ipconfig_parser
+        #one saved `ipconfig /all` output per machine, cycling through the locale fixtures
+        fixtures = [ipconfig_parser.read_output(path) for path in ipconfig_parser.fixture_paths()]
+        texts = [fixtures[index % len(fixtures)] for index in range(len(self.file_paths))]
+        results, seconds = timed(lambda: [ipconfig_parser.parse(text) for text in texts])
+        adapters = sum(len(parsed['Adapters']) for parsed in results)
+        return [result("ipconfig /all outputs parsed", len(texts), seconds, adapters=adapters,
+                       mb_per_second=round(sum(map(len, texts)) / 1048576 / seconds, 1) if seconds else None)]
+
+    def run_import(self, conn):
+        from importer import create_tables, import_files
+        entries = []
+        for storage in ("full", "delta"):
+            #a fresh schema per mode, so the delta run finds no section hashes from the full run
+            with scratch_schema(conn):
+                with conn.cursor() as cursor:
+                    create_tables(cursor)
+                conn.commit()
+                progress, seconds = timed(lambda: import_files(conn, self.file_paths, workers=self.workers,
+                                                               storage=storage))
+            entries.append(result(f"import, {storage} storage", progress.files_done, seconds,
+                                  mb_per_second=round(progress.bytes_done / 1048576 / seconds, 1)))
+        return entries
+
+    def run_sql_report(self, conn):
+        from exports import db_report
+        from importer import create_tables, import_files
+        from report import benchmark
+        snapshots = [(os.path.basename(path), read_snapshot(path)[0]) for path in self.file_paths]
+        with scratch_schema(conn):
+            timings = benchmark(conn, snapshots)
+            #what the viewer, the CLI and exports read: the report_row table the import keeps up to date
+            with conn.cursor() as cursor:
+                create_tables(cursor)
+            conn.commit()
+            import_files(conn, self.file_paths, workers=self.workers)
+            entries = [result("minimal report in SQL", timings['machines'], timings['sql_seconds'],
+                              same_report=timings['same_report']),
+                       result("minimal report in python from the database", timings['machines'],
+                              timings['python_seconds'])]
+            for latest in (False, True):
+                def read_report():
+                    _, rows = db_report(conn, latest)
+                    return sum(1 for _ in rows)
+
+                count, seconds = timed(read_report)
+                conn.rollback()
+                entries.append(result("minimal report from report_row" + (", latest" if latest else ""),
+                                      count, seconds))
+        return entries
+
+    def close(self):
+        if self.catalog is not None:
+            self.catalog.close()
+
+
+def run_cases(bench, cases, dsn=None):
+    """yield result entries, or {'case': ..., 'skipped': reason}"""
+    for case in [case for case in cases if case not in DB_CASES]:
+        try:
+            yield from getattr(bench, "run_" + case.replace("-", "_"))()
+        except (Skipped, ImportError) as e:
+            yield {'case': case, 'skipped': str(e)}
+    db_cases = [case for case in cases if case in DB_CASES]
+    if not db_cases:
+        return
+    try:
+        import psycopg2
+        with (nullcontext(dsn) if dsn else throwaway_postgres()) as dsn:
+            conn = psycopg2.connect(dsn)
+            try:
+                for case in db_cases:
+                    yield from getattr(bench, "run_" + case.replace("-", "_"))(conn)
+            finally:
+                conn.close()
+    except (Skipped, ImportError) as e:
+        for case in db_cases:
+            yield {'case': case, 'skipped': str(e)}
+
+
+def print_result(entry, baseline=None):
+    if 'skipped' in entry:
+        print(f"{entry['case']:<45} skipped: {entry['skipped']}")
+        return
+    line = f"{entry['case']:<45} {entry['items']:>8} in {entry['seconds']:>9.3f}s"
+    if entry['per_second']:
+        line += f" {entry['per_second']:>10.1f}/s"
+    if 'peak_mb' in entry:
+        line += f"  peak {entry['peak_mb']} MB"
+    previous = (baseline or {}).get(entry['case'])
+    if previous and previous.get('seconds') and entry['items'] == previous['items']:
+        line += f"  ({entry['seconds'] / previous['seconds']:.2f}x baseline)"
+    print(line, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark imports, reports, exports and the tree on a synthetic fleet")
+    parser.add_argument("--machines", type=int, default=1000, help="fleet size, 1000 to 500000")
+    parser.add_argument("--device-scale", type=int, default=1, help="multiplies the devices a machine can have")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compact", action="store_true", help="write the fleet in the compact snapshot format")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"comma separated, from {', '.join(CASES)}")
+    parser.add_argument("--fleet-dir", help="reuse or keep the generated fleet here (default: a temp directory)")
+    parser.add_argument("--dsn", default=os.environ.get("INVENTORY_BENCH_DSN", ""),
+                        help="database for the import and sql-report cases, they run in a scratch schema that is "
+                             "dropped afterwards (default: $INVENTORY_BENCH_DSN, else a throwaway cluster via initdb)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results file of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    cases = [case.strip() for case in args.cases.split(",") if case.strip()]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            previous = json.load(file)
+        if previous.get('device_scale') != args.device_scale or previous.get('seed') != args.seed:
+            parser.error("the baseline was run with a different --device-scale or --seed")
+        baseline = {entry['case']: entry for entry in previous['results']}
+
+    work_dir = tempfile.mkdtemp(prefix="inventory-bench-")
+    fleet_dir = args.fleet_dir or os.path.join(work_dir, "fleet")
+    try:
+        if not (os.path.isdir(fleet_dir) and any(is_snapshot_file(name) for name in os.listdir(fleet_dir))):
+            print(f"Generating {args.machines} snapshots in {fleet_dir}", flush=True)
+            _, seconds = timed(lambda: write_fleet(fleet_dir, args.machines, args.seed, args.compact,
+                                                   args.device_scale))
+            print(f"Generated in {seconds:.1f}s", flush=True)
+        bench = Benchmark(fleet_dir, work_dir, args.workers)
+        results = []
+        try:
+            for entry in run_cases(bench, cases, args.dsn):
+                print_result(entry, baseline)
+                results.append(entry)
+        finally:
+            bench.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({'machines': len(bench.file_paths), 'device_scale': args.device_scale, 'seed': args.seed,
+                       'results': results}, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
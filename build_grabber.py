@@ -0,0 +1,62 @@
+import os
+import sys
+import shutil
+import zipapp
+import argparse
+import tempfile
+from modulefinder import ModuleFinder
+
+#grabber.py imports instrument, ipconfig_parser, snapshot and spool from this directory, so the
+#client is a module set rather than one script. This bundles grabber.py with every module of this
+#directory it imports into one grabber.pyz, which is what gets copied to the share or NETLOGON:
+#    python grabber.pyz [grabber.py arguments]
+#Third-party packages are not bundled, the clients need them installed (see CLIENT_REQUIREMENTS).
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#package -> what it is needed for on the clients
+CLIENT_REQUIREMENTS = {
+    'wmi': "every WMI section",
+    'pywin32': "pythoncom and win32com for WMI and the WIA devices",
+    'zstandard': "optional, zstd for --compact files, gzip is used without it",
+}
+
+
+def client_modules(script=os.path.join(HERE, "grabber.py")):
+    """paths of the modules of this directory that script imports, directly or through each other"""
+    finder = ModuleFinder(path=[HERE] + sys.path)
+    finder.run_script(script)
+    paths = set()
+    for module in finder.modules.values():
+        path = module.__file__
+        if path and os.path.dirname(os.path.abspath(path)) == HERE and os.path.abspath(path) != script:
+            paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def build(output, script=os.path.join(HERE, "grabber.py")):
+    """write the grabber.pyz zipapp, returns the bundled module names"""
+    modules = client_modules(script)
+    with tempfile.TemporaryDirectory(prefix="grabber-build-") as staging:
+        for path in modules:
+            shutil.copy2(path, staging)
+        shutil.copy2(script, os.path.join(staging, "grabber.py"))
+        with open(os.path.join(staging, "__main__.py"), "w") as file:
+            file.write("import sys\nimport grabber\n\nsys.exit(grabber.main())\n")
+        zipapp.create_archive(staging, output, interpreter="/usr/bin/env python3")
+    return [os.path.splitext(os.path.basename(path))[0] for path in modules]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bundle grabber.py and its modules into one grabber.pyz")
+    parser.add_argument("--output", default="grabber.pyz")
+    args = parser.parse_args(argv)
+
+    modules = build(args.output)
+    print(f"{args.output}: grabber.py with {', '.join(modules)}")
+    print("clients also need: " + "; ".join(f"{name} ({why})" for name, why in CLIENT_REQUIREMENTS.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from report import build_report_row
+from content_search import content_words, parse_query, words
+from inventory_config import MIN_FILES_FOR_POOL
+from snapshot import is_snapshot_file, parse_snapshot_filename, read_snapshot
+from xlsx_stream import sheet_cells
+
+#bump when the stored summary or export layout changes, every file is parsed again
+CATALOG_VERSION = 1
+
+CATALOG_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS snapshot_file (
+        filename TEXT PRIMARY KEY,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        computer TEXT,
+        domain TEXT,
+        taken_at TEXT,
+        summary TEXT,
+        export_cells TEXT,
+        export_rows INTEGER,
+        error TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS snapshot_file_machine_idx ON snapshot_file (computer, domain, taken_at)",
+    #inverted index for content search, see content_words
+    """
+    CREATE TABLE IF NOT EXISTS search_word (
+        word TEXT NOT NULL,
+        section TEXT NOT NULL,
+        field TEXT NOT NULL,
+        filename TEXT NOT NULL,
+        PRIMARY KEY (word, section, field, filename)
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS search_word_filename_idx ON search_word (filename)",
+]
+
+
+def default_catalog_path(json_dir):
+    """json_files -> json_files.catalog.sqlite3 next to it, the share itself may be read-only"""
+    return os.path.normpath(json_dir) + ".catalog.sqlite3"
+
+
+def catalog_entry(file_path):
+    """parse one snapshot into (values stored for it, its search words)"""
+    filename = os.path.basename(file_path)
+    computer, domain, taken_at = parse_snapshot_filename(filename)
+    header = (computer, domain, taken_at.isoformat() if taken_at else None)
+    try:
+        json_data, _ = read_snapshot(file_path)
+    except Exception as e:
+        return header + (None, None, None, str(e)), set()
+    cells, last_row = sheet_cells(json_data, start_row=0)
+    return header + (json.dumps(build_report_row(filename, json_data)),
+                     json.dumps(cells, separators=(',', ':'), default=str), last_row, None), content_words(json_data)
+
+
+def term_sql(term):
+    """(SELECT filename ... , params) for the snapshots matching one query term"""
+    if term.op == '=':
+        keys = ['=' + term.value]
+    else:
+        keys = words(term.value)
+    if not keys:
+        return "SELECT filename FROM snapshot_file", []
+    selects = []
+    params = []
+    for key in keys:
+        sql = "SELECT filename FROM search_word WHERE word = ?"
+        params.append(key)
+        if term.section:
+            sql += " AND section = ?"
+            params.append(term.section)
+        if term.field:
+            sql += " AND field = ?"
+            params.append(term.field)
+        selects.append(sql)
+    return " INTERSECT ".join(selects), params
+
+
+class Catalog:
+    """SQLite index of a snapshot directory
+
+    refresh() parses only the files whose mtime or size changed since the last
+    run and forgets deleted ones, everything else is answered from the index:
+    the file list, the report summary row and the pre-flattened export cells.
+    """
+
+    def __init__(self, json_dir, path=None):
+        self.json_dir = json_dir
+        self.path = path or default_catalog_path(json_dir)
+        self.conn = sqlite3.connect(self.path)
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS snapshot_file")
+            self.conn.execute("DROP TABLE IF EXISTS search_word")
+            self.conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        for statement in CATALOG_DDL:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def refresh(self, progress_callback=None, batch_size=200, workers=1):
+        """bring the index in line with the directory, returns (parsed, removed)
+
+        workers > 1 (or None for one per CPU) parses changed files in worker processes.
+        """
+        known = {filename: (mtime_ns, size) for filename, mtime_ns, size in
+                 self.conn.execute("SELECT filename, mtime_ns, size FROM snapshot_file")}
+        changed = []
+        with os.scandir(self.json_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_snapshot_file(entry.name):
+                    continue
+                stat = entry.stat()
+                if known.pop(entry.name, None) != (stat.st_mtime_ns, stat.st_size):
+                    changed.append((entry.name, stat.st_mtime_ns, stat.st_size))
+
+        removed = list(known)
+        if removed:
+            self.forget(removed)
+            self.conn.commit()
+
+        executor = None
+        if workers != 1 and len(changed) >= MIN_FILES_FOR_POOL:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            for start in range(0, len(changed), batch_size):
+                batch = changed[start:start + batch_size]
+                paths = [os.path.join(self.json_dir, filename) for filename, _, _ in batch]
+                entries = executor.map(catalog_entry, paths, chunksize=16) if executor else map(catalog_entry, paths)
+                rows = []
+                word_rows = []
+                for (filename, mtime_ns, size), (entry, entry_words) in zip(batch, entries):
+                    rows.append((filename, mtime_ns, size) + entry)
+                    word_rows.extend((word, section, field, filename) for section, field, word in entry_words)
+                self.forget([row[0] for row in rows])
+                self.conn.executemany("INSERT INTO snapshot_file VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self.conn.executemany("INSERT INTO search_word VALUES (?, ?, ?, ?)", word_rows)
+                self.conn.commit()
+                if progress_callback:
+                    progress_callback(start + len(rows), len(changed))
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+        return len(changed), len(removed)
+
+    def forget(self, filenames):
+        params = [(name,) for name in filenames]
+        self.conn.executemany("DELETE FROM search_word WHERE filename = ?", params)
+        self.conn.executemany("DELETE FROM snapshot_file WHERE filename = ?", params)
+
+    def filenames(self, search=""):
+        """indexed filenames containing search (case-insensitive), sorted"""
+        pattern = "%" + search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return [row[0] for row in self.conn.execute(
+            "SELECT filename FROM snapshot_file WHERE filename LIKE ? ESCAPE '\\' ORDER BY filename", (pattern,))]
+
+    def search_contents(self, query):
+        """filenames of the snapshots matching a content_search.py query, sorted"""
+        terms = parse_query(query)
+        if not terms:
+            return self.filenames()
+        selects = []
+        params = []
+        for term in terms:
+            sql, term_params = term_sql(term)
+            selects.append(f"SELECT * FROM ({sql})")
+            params.extend(term_params)
+        return [row[0] for row in self.conn.execute(
+            f"SELECT DISTINCT filename FROM ({' INTERSECT '.join(selects)}) ORDER BY filename", params)]
+
+    def summaries(self, latest=False):
+        """yield the report row of every readable snapshot, or of the newest one per machine"""
+        if latest:
+            #SQLite takes the bare summary column from the row that has max(taken_at)
+            sql = ("SELECT summary, max(taken_at) FROM snapshot_file WHERE summary IS NOT NULL "
+                   "GROUP BY computer, domain ORDER BY computer, domain")
+        else:
+            sql = "SELECT summary FROM snapshot_file WHERE summary IS NOT NULL ORDER BY filename"
+        for summary, *_ in self.conn.execute(sql):
+            yield json.loads(summary)
+
+    def export_cells(self):
+        """yield (filename, cells, last row) in filename order, cell rows start at 0 for every file"""
+        for filename, cells, last_row in self.conn.execute(
+                "SELECT filename, export_cells, export_rows FROM snapshot_file "
+                "WHERE export_cells IS NOT NULL ORDER BY filename"):
+            yield filename, json.loads(cells), last_row
+
+    def errors(self):
+        return self.conn.execute(
+            "SELECT filename, error FROM snapshot_file WHERE error IS NOT NULL ORDER BY filename").fetchall()
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the catalog of a snapshot directory")
+    parser.add_argument("json_dir")
+    parser.add_argument("--catalog", help="catalog file (default: <json_dir>.catalog.sqlite3)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.json_dir, args.catalog)
+    try:
+        parsed, removed = catalog.refresh(lambda done, total: print(f"Parsed {done}/{total} files", flush=True),
+                                          workers=args.workers)
+        print(f"Catalog up to date: {parsed} files parsed, {removed} removed, {len(catalog.errors())} unreadable")
+    finally:
+        catalog.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+import re
+import sys
+import json
+import shlex
+import argparse
+from collections import namedtuple
+
+from inventory_config import add_dsn_argument
+
+#a query is whitespace separated terms, all of which must match:
+#   Disks.Model:samsung      every word of the value appears in the field (case-insensitive),
+#                            a word of digits matches a number with exactly that value (Speed:2666)
+#   NetworkAdapters:intel    ... in any field of the section
+#   Disks.SerialNumber=S3Z   the field has exactly this value
+#   samsung                  the word appears anywhere in the snapshot
+#section and field names are written as they appear in the tree, quote values with spaces:
+#   "OperatingSystem.Caption:windows 11"
+Term = namedtuple('Term', 'section field op value')
+
+TERM_PATTERN = re.compile(r'^([A-Za-z_][\w/-]*)(?:\.(\w+))?([:=])(.*)$', re.S)
+WORD_PATTERN = re.compile(r'\w+')
+
+#json_files.search_text holds the words of every value of a snapshot, it narrows a search down
+#to a few candidate rows before their content is checked. The jsonb_path_ops index answers exact
+#(=) terms directly on full storage rows.
+CONTENT_SEARCH_DDL = [
+    "ALTER TABLE json_files ADD COLUMN IF NOT EXISTS search_text tsvector",
+    "CREATE INDEX IF NOT EXISTS json_files_search_text_idx ON json_files USING gin (search_text)",
+    "CREATE INDEX IF NOT EXISTS json_files_content_path_idx ON json_files USING gin (content jsonb_path_ops)",
+]
+
+
+
+def search_text_sql(content):
+    """SQL expression of the search_text of a content expression, the importer computes it in its INSERT"""
+    return f"""jsonb_to_tsvector('simple', {content}, '["string", "numeric", "boolean"]')"""
+
+
+#for rows written before content search existed
+SEARCH_TEXT_SQL = f"""
+    UPDATE json_files f
+    SET search_text = {search_text_sql("COALESCE(f.content, snapshot_content(f.sections, f.unhashed))")}
+    WHERE f.filename = ANY(%s)
+"""
+
+#the content a search checks, rows stored as deltas have to be put back together first
+CONTENT_SQL = {
+    "full": "f.content",
+    "delta": "COALESCE(f.content, snapshot_content(f.sections, f.unhashed))",
+}
+
+
+def parse_query(text):
+    """list of Terms, raises ValueError for unbalanced quotes"""
+    terms = []
+    for token in shlex.split(text):
+        match = TERM_PATTERN.match(token)
+        if match:
+            section, field, op, value = match.groups()
+            terms.append(Term(section, field, op, value))
+        else:
+            terms.append(Term(None, None, ':', token))
+    return terms
+
+
+def words(text):
+    return [word.lower() for word in WORD_PATTERN.findall(text)]
+
+
+def value_text(value):
+    """a scalar as it is matched, booleans the way json writes them"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def iter_fields(json_data):
+    """yield (section, field, value) for every scalar of a snapshot
+
+    field is the property of a section item (Disks -> Model), or the section
+    name itself for scalar sections like WindowsSID. Values nested deeper
+    count as values of their top-level field.
+    """
+    for section, data in json_data.items():
+        items = data if isinstance(data, list) else [data]
+        for item in items:
+            if isinstance(item, dict):
+                for field, value in item.items():
+                    for scalar in iter_scalars(value):
+                        yield section, field, scalar
+            else:
+                for scalar in iter_scalars(item):
+                    yield section, section, scalar
+
+
+def iter_scalars(value):
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif value is not None:
+            yield value
+
+
+def content_words(json_data):
+    """{(section, field, word)} of a snapshot for the file catalog's inverted index
+
+    word is a lower-case word of the value, or '=' followed by the whole value
+    for exact terms.
+    """
+    entries = set()
+    for section, field, value in iter_fields(json_data):
+        text = value_text(value)
+        entries.add((section, field, '=' + text))
+        for word in words(text):
+            entries.add((section, field, word))
+    return entries
+
+
+def jsonpath_literal(value):
+    return json.dumps(value)
+
+
+def jsonpath_number(text):
+    """text as a jsonpath number, None unless it is a number written the way value_text writes it
+
+    0012345 or 01.5 are not valid jsonpath numbers, and no number is matched
+    by them in the catalog either.
+    """
+    if re.fullmatch(r'-?[0-9]+', text):
+        number = int(text)
+    elif re.fullmatch(r'-?[0-9]+\.[0-9]+', text):
+        number = float(text)
+    else:
+        return None
+    return text if value_text(number) == text else None
+
+
+def term_jsonpath(term):
+    """jsonpath that is true when a snapshot matches a section or field term"""
+    path = f"$.{jsonpath_literal(term.section)}"
+    if term.field:
+        path += f"[*].{jsonpath_literal(term.field)}"
+    else:
+        path += ".**"
+    if term.op == '=':
+        condition = f"@ == {jsonpath_literal(term.value)}"
+        if jsonpath_number(term.value):
+            condition += f" || @ == {term.value}"
+        if term.value in ('true', 'false'):
+            condition += f" || @ == {term.value}"
+    else:
+        #each word on its own, like the catalog's word index. like_regex never matches numbers and
+        #booleans, which the catalog indexes as text, so digits and true/false also compare as values
+        conditions = []
+        for word in words(term.value):
+            condition = f"@ like_regex {jsonpath_literal(word)} flag \"iq\""
+            if jsonpath_number(word) or word in ('true', 'false'):
+                condition = f"({condition} || @ == {word})"
+            conditions.append(condition)
+        condition = " && ".join(conditions) or "true"
+    return f"{path} ? ({condition})"
+
+
+def build_content_query(terms, storage="full"):
+    """(where clause over json_files f, params) matching every term"""
+    content = CONTENT_SQL[storage]
+    clauses = []
+    params = []
+    for term in terms:
+        if words(term.value):
+            clauses.append("f.search_text @@ plainto_tsquery('simple', %s)")
+            params.append(term.value)
+        if term.section:
+            clauses.append(f"{content} @? %s::jsonpath")
+            params.append(term_jsonpath(term))
+    return " AND ".join(clauses) or "true", params
+
+
+def create_content_search(cursor):
+    for statement in CONTENT_SEARCH_DDL:
+        cursor.execute(statement)
+
+
+def update_search_text(cursor, filenames):
+    """recompute search_text for snapshots already in json_files"""
+    cursor.execute(SEARCH_TEXT_SQL, (list(filenames),))
+
+
+def backfill(conn, batch_size=1000, progress_callback=None):
+    """fill search_text for rows imported before content search existed"""
+    with conn.cursor() as cursor:
+        create_content_search(cursor)
+        cursor.execute("SELECT filename FROM json_files WHERE search_text IS NULL ORDER BY filename")
+        filenames = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    for start in range(0, len(filenames), batch_size):
+        with conn.cursor() as cursor:
+            update_search_text(cursor, filenames[start:start + batch_size])
+        conn.commit()
+        if progress_callback:
+            progress_callback(min(start + batch_size, len(filenames)))
+    return len(filenames)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search snapshot contents in PostgreSQL")
+    parser.add_argument("command", choices=["search", "backfill"])
+    parser.add_argument("query", nargs="?", default="", help='e.g. Disks.Model:samsung "OperatingSystem.Caption:windows 11"')
+    add_dsn_argument(parser)
+    parser.add_argument("--storage", choices=sorted(CONTENT_SQL), default="full")
+    args = parser.parse_args(argv)
+
+    from db import connect
+    conn = connect(args.dsn)
+    try:
+        if args.command == "backfill":
+            done = backfill(conn, progress_callback=lambda n: print(f"Indexed {n} snapshots", flush=True))
+            print(f"Backfill finished, {done} snapshots")
+        else:
+            where, params = build_content_query(parse_query(args.query), args.storage)
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT f.filename FROM json_files f WHERE {where} ORDER BY f.filename", params)
+                for (filename,) in cursor:
+                    print(filename)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import time
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from inventory_config import CONNECT_KEYS, load_db_config, resolve_dsn
+
+#errors that mean the connection itself is gone rather than the query being wrong
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def connect(dsn=None):
+    """one connection for a command line tool, dsn as resolve_dsn picks it"""
+    return psycopg2.connect(resolve_dsn(dsn))
+
+
+class QueryMetrics:
+    """count, total and max time per query, shared by every connection in the process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def record(self, name, seconds):
+        with self.lock:
+            count, total, worst = self.stats.get(name, (0, 0.0, 0.0))
+            self.stats[name] = (count + 1, total + seconds, max(worst, seconds))
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def summary(self, limit=15):
+        """slowest queries by total time, one line each"""
+        lines = []
+        for name, (count, total, worst) in sorted(self.snapshot().items(), key=lambda item: -item[1][1])[:limit]:
+            lines.append(f"{total:8.3f}s total {count:6d}x avg {total / count * 1000:8.1f}ms "
+                         f"max {worst * 1000:8.1f}ms  {name}")
+        return "\n".join(lines)
+
+
+query_metrics = QueryMetrics()
+
+
+def query_name(sql):
+    """short label for a statement: its first line, whitespace collapsed"""
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", "replace")
+    return " ".join(str(sql).split())[:80]
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    """cursor that records the time of every execute in query_metrics"""
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            query_metrics.record(query_name(sql), time.perf_counter() - started)
+
+
+class Database:
+    """pool of connections with health checks and reconnects
+
+    connection() hands out a pooled connection and rolls it back when it is
+    returned. run(work) additionally retries work(conn) once on a fresh
+    connection when the server dropped the old one.
+    """
+
+    def __init__(self, config=None):
+        config = config or load_db_config()
+        self.config = config
+        self.max_connections = int(config["max_connections"])
+        self.health_check_after = float(config["health_check_after"])
+        self.connect_params = {key: config[key] for key in CONNECT_KEYS if config.get(key)}
+        self.pool = ThreadedConnectionPool(int(config["min_connections"]), self.max_connections,
+                                           cursor_factory=TimedCursor, **self.connect_params)
+        #the pool raises when it is empty, this makes callers wait for a free connection instead
+        self.available = threading.BoundedSemaphore(self.max_connections)
+        self.last_used = {}
+        self.metrics = query_metrics
+
+    def is_healthy(self, conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        self.available.acquire()
+        try:
+            conn = self.pool.getconn()
+            idle = time.monotonic() - self.last_used.get(id(conn), 0)
+            if conn.closed or (idle > self.health_check_after and not self.is_healthy(conn)):
+                self.pool.putconn(conn, close=True)
+                conn = self.pool.getconn()
+        except Exception:
+            self.available.release()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        """return a connection, dead ones are closed and replaced on the next getconn"""
+        try:
+            close = bool(conn.closed)
+            if not close:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+            if close:
+                self.last_used.pop(id(conn), None)
+            else:
+                self.last_used[id(conn)] = time.monotonic()
+            self.pool.putconn(conn, close=close)
+        finally:
+            self.available.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def run(self, work, retries=1):
+        """work(conn) on a pooled connection, retried on a new one if the server dropped it"""
+        for attempt in range(retries + 1):
+            conn = self.getconn()
+            try:
+                return work(conn)
+            except CONNECTION_ERRORS:
+                #a cancelled or timed out query is an OperationalError too, but leaves the connection open
+                if not conn.closed or attempt == retries:
+                    raise
+            finally:
+                self.putconn(conn)
+
+    def close(self):
+        self.pool.closeall()
@@ -0,0 +1,182 @@
+import json
+import hashlib
+
+from content_search import search_text_sql
+from snapshot import parse_snapshot_filename
+from snapshot_diff import IGNORED_FIELDS
+
+#delta storage keeps each top-level section (CPU, Motherboard, Disks, ...) once per distinct
+#content in snapshot_section, json_files.sections maps section name -> hash for a snapshot.
+#The fields snapshot_diff.py ignores are kept out of the stored sections, json_files.unhashed
+#holds them per snapshot along with the metadata sections, see hash_sections.
+#json_files.content is NULL for those rows, json_snapshots gives the reconstructed content.
+#json_snapshots.version is the row's xmin, it changes whenever the snapshot is re-imported.
+DELTA_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS snapshot_section (
+        hash TEXT PRIMARY KEY,
+        content JSONB NOT NULL
+    )
+    """,
+    "ALTER TABLE json_files ALTER COLUMN content DROP NOT NULL",
+    "ALTER TABLE json_files ADD COLUMN IF NOT EXISTS sections JSONB",
+    "ALTER TABLE json_files ADD COLUMN IF NOT EXISTS changed_sections TEXT[]",
+    "ALTER TABLE json_files ADD COLUMN IF NOT EXISTS unhashed JSONB",
+    """
+    CREATE OR REPLACE FUNCTION with_unhashed_fields(content JSONB, fields JSONB) RETURNS JSONB AS $$
+        SELECT CASE WHEN jsonb_typeof(content) = 'array' AND jsonb_typeof(fields) = 'array' THEN
+            (SELECT COALESCE(jsonb_agg(CASE WHEN jsonb_typeof(t.item) = 'object'
+                                            THEN t.item || COALESCE(fields -> (t.position::int - 1), '{}'::jsonb)
+                                            ELSE t.item END ORDER BY t.position), '[]'::jsonb)
+             FROM jsonb_array_elements(content) WITH ORDINALITY t(item, position))
+        ELSE content END
+    $$ LANGUAGE SQL IMMUTABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION snapshot_content(sections JSONB, unhashed JSONB) RETURNS JSONB AS $$
+        SELECT COALESCE(jsonb_object_agg(s.key, with_unhashed_fields(sec.content, unhashed -> s.key)), '{}'::jsonb)
+            || COALESCE((SELECT jsonb_object_agg(u.key, u.value) FROM jsonb_each(unhashed) u
+                         WHERE NOT sections ? u.key), '{}'::jsonb)
+        FROM jsonb_each_text(sections) s JOIN snapshot_section sec ON sec.hash = s.value
+    $$ LANGUAGE SQL STABLE
+    """,
+    """
+    CREATE OR REPLACE VIEW json_snapshots AS
+        SELECT id, filename, COALESCE(content, snapshot_content(sections, unhashed)) AS content,
+               xmin::text AS version
+        FROM json_files
+    """,
+]
+
+def create_delta_tables(cursor):
+    for statement in DELTA_DDL:
+        cursor.execute(statement)
+
+
+def stable_section(value):
+    """(section without the IGNORED_FIELDS of its items, [those fields of each item] or None if it had none)"""
+    if not isinstance(value, list):
+        return value, None
+    stable = []
+    fields = []
+    for item in value:
+        if isinstance(item, dict) and not IGNORED_FIELDS.isdisjoint(item):
+            stable.append({field: v for field, v in item.items() if field not in IGNORED_FIELDS})
+            fields.append({field: v for field, v in item.items() if field in IGNORED_FIELDS})
+        else:
+            stable.append(item)
+            fields.append({})
+    return stable, (fields if any(fields) else None)
+
+
+def hash_sections(json_data):
+    """({section: (sha256 of its canonical json, canonical json)}, unhashed json or None) for a snapshot
+
+    Sections are hashed and stored without the fields snapshot_diff.py
+    ignores (DHCP leases, free memory, clocks, ...), they differ on every run
+    and would store the section again each time. unhashed keeps them per
+    snapshot as {section: [fields of each item]}, with the metadata sections
+    (grabber.py's _collection timings) whole, so snapshot_content() returns
+    the snapshot as it was read. Neither shows up in changed_sections.
+    """
+    sections = {}
+    unhashed = {}
+    for name, value in json_data.items():
+        if name.startswith('_'):
+            unhashed[name] = value
+            continue
+        value, fields = stable_section(value)
+        if fields is not None:
+            unhashed[name] = fields
+        text = json.dumps(value, sort_keys=True, separators=(',', ':'))
+        sections[name] = (hashlib.sha256(text.encode('utf-8')).hexdigest(), text)
+    return sections, (json.dumps(unhashed, separators=(',', ':')) if unhashed else None)
+
+
+def machine_prefix(filename):
+    computer, domain, _ = parse_snapshot_filename(filename)
+    return f"{computer}_{domain}_"
+
+
+def section_hashes(cursor, filename, sections):
+    """{section: hash} of a stored snapshot, full rows are hashed from their content"""
+    if sections is not None:
+        return sections
+    cursor.execute("SELECT content FROM json_files WHERE filename = %s", (filename,))
+    row = cursor.fetchone()
+    return {name: h for name, (h, _) in hash_sections(row[0] or {})[0].items()} if row else {}
+
+
+def update_changed_sections(cursor, filenames):
+    """recompute changed_sections of just written snapshots and of the snapshot after each of them
+
+    A snapshot is compared with its machine's previous one whatever that was
+    stored as, and with nothing (every section changed) when it is the first.
+    Importing an older file moves the predecessor of the next snapshot, so
+    that one is recomputed as well. Only delta rows carry changed_sections.
+    """
+    from psycopg2.extras import execute_values
+    written = set(filenames)
+    machines = {}
+    for filename in sorted(written):
+        prefix = machine_prefix(filename)
+        first, last = machines.get(prefix, (filename, filename))
+        machines[prefix] = (min(first, filename), max(last, filename))
+    if not machines:
+        return
+    #each machine's rows from the snapshot before its first written file to the one after its last,
+    #timestamps sort as text so those are the closest smaller and larger filenames
+    rows = execute_values(cursor, """
+        SELECT b.prefix, f.filename, f.sections
+        FROM (VALUES %s) b(prefix, first_name, last_name)
+        JOIN LATERAL (
+            SELECT filename, sections FROM json_files
+            WHERE filename >= COALESCE((SELECT max(filename) FROM json_files WHERE filename < b.first_name),
+                                       b.first_name)
+              AND filename <= COALESCE((SELECT min(filename) FROM json_files WHERE filename > b.last_name),
+                                       b.last_name)
+        ) f ON true
+        ORDER BY b.prefix, f.filename
+    """, [(prefix, first, last) for prefix, (first, last) in machines.items()], fetch=True)
+
+    updates = []
+    previous = {}
+    for prefix, filename, sections in rows:
+        if machine_prefix(filename) != prefix:
+            continue
+        before = previous.get(prefix)
+        if sections is not None and (filename in written or (before and before[0] in written)):
+            old = section_hashes(cursor, *before) if before else {}
+            updates.append((filename, sorted(name for name in set(sections) | set(old)
+                                             if sections.get(name) != old.get(name))))
+        previous[prefix] = (filename, sections)
+    if updates:
+        execute_values(cursor, """
+            UPDATE json_files SET changed_sections = v.changed
+            FROM (VALUES %s) v(filename, changed) WHERE json_files.filename = v.filename
+        """, updates, template="(%s, %s::text[])")
+
+
+def write_delta_batch(cursor, batch):
+    """store [(filename, hash_sections() result)], only sections with unseen hashes are sent"""
+    #imported here so the section hashing can be used and tested without psycopg2
+    from psycopg2.extras import Json, execute_values
+    hashes = {h: text for _, (sections, _) in batch for h, text in sections.values()}
+    cursor.execute("SELECT hash FROM snapshot_section WHERE hash = ANY(%s)", (list(hashes),))
+    for (known,) in cursor.fetchall():
+        del hashes[known]
+    if hashes:
+        execute_values(cursor, "INSERT INTO snapshot_section (hash, content) VALUES %s ON CONFLICT (hash) DO NOTHING",
+                       list(hashes.items()), template="(%s, %s::jsonb)")
+
+    rows = [(filename, Json({name: h for name, (h, _) in sections.items()}), unhashed)
+            for filename, (sections, unhashed) in batch]
+    #the sections of the batch are in snapshot_section already, so search_text is built in the same INSERT
+    execute_values(cursor, f"""
+        INSERT INTO json_files (filename, content, sections, unhashed, search_text)
+        SELECT v.filename, NULL, v.sections, v.unhashed, {search_text_sql("snapshot_content(v.sections, v.unhashed)")}
+        FROM (VALUES %s) v(filename, sections, unhashed)
+        ON CONFLICT (filename) DO UPDATE SET content = NULL, sections = EXCLUDED.sections,
+            unhashed = EXCLUDED.unhashed, search_text = EXCLUDED.search_text
+    """, rows, template="(%s, %s::jsonb, %s::jsonb)")
+    update_changed_sections(cursor, [filename for filename, _ in batch])
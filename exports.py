@@ -0,0 +1,159 @@
+import os
+import csv
+
+from openpyxl import Workbook
+
+import instrument
+from report import BASE_COLUMNS
+from report_rows import REPORT_ROWS_SQL, fill_missing, filled_columns
+from xlsx_stream import StreamingSheet, sheet_cells
+
+#rows fetched per round-trip by server-side cursors, and files between progress updates
+EXPORT_BATCH_SIZE = 200
+#rows per parquet row group of the report
+PARQUET_BATCH_ROWS = 10000
+REPORT_FORMATS = ("xlsx", "csv", "parquet")
+
+
+def db_export_cells(conn, batch_size=EXPORT_BATCH_SIZE):
+    """yield (filename, cells, last row) for every snapshot in the database, like Catalog.export_cells"""
+    with conn.cursor(name="export_json_files") as cursor:
+        cursor.execute("SELECT filename, content FROM json_snapshots ORDER BY filename")
+        while True:
+            with instrument.span("export.fetch"):
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for filename, json_data in rows:
+                cells, last_row = sheet_cells(json_data, start_row=0)
+                yield filename, cells, last_row
+
+
+@instrument.timed("export.excel")
+def write_export_xlsx(path, snapshots, progress=None, check_cancelled=None):
+    """write the "JSON Data" export of (filename, cells, last row) items, returns the number of files
+
+    A write-only workbook keeps memory flat however big the fleet is.
+    """
+    wb = Workbook(write_only=True)
+    ws = StreamingSheet(wb, "JSON Data")
+    row_num = 1
+    count = 0
+    for count, (filename, cells, last_row) in enumerate(snapshots, 1):
+        if check_cancelled:
+            check_cancelled()
+        # file name in the first column
+        ws.cell(row=row_num, column=1, value=f"File: {filename}")
+        for row, column, value in cells:
+            ws.cell(row=row_num + 1 + row, column=column, value=value)
+        row_num += 2 + last_row
+        if progress and count % EXPORT_BATCH_SIZE == 0:
+            progress(f"{count} files written")
+    ws.close()
+    if progress:
+        progress("Saving workbook")
+    wb.save(path)
+    return count
+
+
+def report_columns(filled):
+    """the report's columns: base columns plus every filled one, sorted like finish_report"""
+    return sorted(set(BASE_COLUMNS) | set(filled))
+
+
+def db_report(conn, latest=False, batch_size=EXPORT_BATCH_SIZE):
+    """(columns, row iterator) of the minimal report, read from the materialized report_row table
+
+    latest keeps only the newest snapshot of each machine. Snapshots imported
+    before report_row existed get their rows first, after that the report is
+    one pass for the filled columns and one streamed read in index order.
+    """
+    with conn.cursor() as cursor:
+        fill_missing(cursor)
+        columns = report_columns(filled_columns(cursor, latest))
+    conn.commit()
+
+    def rows():
+        with conn.cursor(name="report_rows") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(REPORT_ROWS_SQL[latest])
+            for (row,) in cursor:
+                yield [row.get(name) for name in columns]
+
+    return columns, rows()
+
+
+def catalog_report(catalog, latest=False):
+    """(columns, row iterator) of the minimal report from a file catalog's summary rows"""
+    filled = set()
+    for summary in catalog.summaries(latest):
+        filled.update(name for name, value in summary.items() if value is not None)
+    columns = report_columns(filled)
+
+    def rows():
+        for summary in catalog.summaries(latest):
+            yield [summary.get(name) for name in columns]
+
+    return columns, rows()
+
+
+def report_format(path, fmt=None):
+    """the output format, from fmt or the file extension"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"unknown report format '{fmt}', expected one of {', '.join(REPORT_FORMATS)}")
+    return fmt
+
+
+@instrument.timed("report.write")
+def write_report(path, columns, rows, fmt=None, check_cancelled=None):
+    """stream report rows to xlsx, csv or parquet, returns the number of rows"""
+    fmt = report_format(path, fmt)
+    count = 0
+    if fmt == "csv":
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns)
+            for count, row in enumerate(rows, 1):
+                if check_cancelled and count % EXPORT_BATCH_SIZE == 0:
+                    check_cancelled()
+                writer.writerow(row)
+    elif fmt == "xlsx":
+        wb = Workbook(write_only=True)
+        ws = StreamingSheet(wb, "Sheet1", header=columns)
+        for count, row in enumerate(rows, 1):
+            if check_cancelled and count % EXPORT_BATCH_SIZE == 0:
+                check_cancelled()
+            ws.append(row)
+        ws.close()
+        wb.save(path)
+    else:
+        count = write_report_parquet(path, columns, rows, check_cancelled)
+    return count
+
+
+def write_report_parquet(path, columns, rows, check_cancelled=None):
+    #optional dependency, only needed for parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.string()) for name in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            count += 1
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                if check_cancelled:
+                    check_cancelled()
+                writer.write_table(report_table(pa, batch, schema))
+                batch = []
+        if batch:
+            writer.write_table(report_table(pa, batch, schema))
+    return count
+
+
+def report_table(pa, rows, schema):
+    columns = [pa.array(list(column), type=pa.string()) for column in zip(*rows)]
+    return pa.Table.from_arrays(columns, schema=schema)
@@ -0,0 +1,205 @@
+import queue
+import threading
+
+import psycopg2
+from psycopg2 import errors
+
+from content_search import build_content_query, parse_query
+
+PAGE_SIZE = 200
+
+#trigram index answers substring searches, the lower() prefix index is the fallback when pg_trgm is missing
+TRIGRAM_INDEX_DDL = "CREATE INDEX IF NOT EXISTS json_files_filename_trgm_idx ON json_files USING gin (filename gin_trgm_ops)"
+PREFIX_INDEX_DDL = "CREATE INDEX IF NOT EXISTS json_files_filename_prefix_idx ON json_files (lower(filename) text_pattern_ops)"
+
+
+def create_search_indexes(conn):
+    """create the filename indexes, returns True if trigram search is available"""
+    with conn.cursor() as cursor:
+        cursor.execute(PREFIX_INDEX_DDL)
+    conn.commit()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(TRIGRAM_INDEX_DDL)
+        conn.commit()
+        return True
+    except psycopg2.Error as e:
+        print(f"Trigram search not available, using prefix search: {e}")
+        conn.rollback()
+        return False
+
+
+def escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class FileSearch:
+    """pages filenames matching a search term on a background thread
+
+    A content search matches a content_search.py query against the snapshots
+    instead of the term against the filenames.
+
+    Only one query runs at a time on the search connection, which is taken
+    from the pool for the life of the search thread. Starting a new
+    search cancels the query in flight and drops any page that belongs to an
+    older search, on_page(generation, filenames, exhausted, backward) is only
+    called for the current one.
+
+    Pages continue after the last filename delivered, or with backward before
+    the first one. A list that only keeps a window of the matches reports the
+    rows it dropped with dropped_before()/dropped_after(), so that paging
+    back towards them fetches them again.
+    """
+
+    def __init__(self, db, on_page, trigram=True, page_size=PAGE_SIZE, storage="full"):
+        self.db = db
+        self.on_page = on_page
+        self.trigram = trigram
+        self.page_size = page_size
+        self.storage = storage
+        self.conn = None
+        self.generation = 0
+        self.term = ''
+        self.content = False
+        self.first_filename = ''
+        self.last_filename = ''
+        self.exhausted = True
+        #no matches before first_filename
+        self.at_start = True
+        self.running = None
+        self.pending = False
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def search(self, term, content=False):
+        """start a new search from the first page"""
+        with self.lock:
+            self.generation += 1
+            self.term = term
+            self.content = content
+            self.first_filename = ''
+            self.last_filename = ''
+            self.exhausted = False
+            self.at_start = True
+            self.pending = True
+            generation = self.generation
+            running = self.running
+        if running is not None and self.conn is not None and not self.conn.closed:
+            self.conn.cancel()
+        self.requests.put((generation, False))
+
+    def next_page(self):
+        """ask for the page after the last one delivered"""
+        with self.lock:
+            if self.exhausted or self.pending:
+                return
+            self.pending = True
+            generation = self.generation
+        self.requests.put((generation, False))
+
+    def previous_page(self):
+        """ask for the page before the first filename still listed"""
+        with self.lock:
+            if self.at_start or self.pending:
+                return
+            self.pending = True
+            generation = self.generation
+        self.requests.put((generation, True))
+
+    def dropped_before(self, first_filename):
+        """the list dropped the rows before first_filename"""
+        with self.lock:
+            self.first_filename = first_filename
+            self.at_start = False
+
+    def dropped_after(self, last_filename):
+        """the list dropped the rows after last_filename"""
+        with self.lock:
+            self.last_filename = last_filename
+            self.exhausted = False
+
+    def close(self):
+        self.requests.put(None)
+
+    def build_query(self, term, last_filename, content=False, backward=False):
+        """the page after last_filename, or with backward the page before it in descending order"""
+        after, order = ("<", " DESC") if backward else (">", "")
+        if content and term:
+            try:
+                where, params = build_content_query(parse_query(term), self.storage)
+            except ValueError:
+                #unbalanced quote while the query is still being typed
+                where, params = "false", []
+            return (f"SELECT f.filename FROM json_files f WHERE {where} AND f.filename {after} %s "
+                    f"ORDER BY f.filename{order} LIMIT %s", params + [last_filename, self.page_size])
+        if not term:
+            return (f"SELECT filename FROM json_files WHERE filename {after} %s ORDER BY filename{order} LIMIT %s",
+                    (last_filename, self.page_size))
+        if self.trigram:
+            return (f"SELECT filename FROM json_files WHERE filename ILIKE %s AND filename {after} %s "
+                    f"ORDER BY filename{order} LIMIT %s",
+                    (f"%{escape_like(term)}%", last_filename, self.page_size))
+        return (f"SELECT filename FROM json_files WHERE lower(filename) LIKE %s AND filename {after} %s "
+                f"ORDER BY filename{order} LIMIT %s",
+                (f"{escape_like(term.lower())}%", last_filename, self.page_size))
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            generation, backward = request
+            with self.lock:
+                #skip requests that a newer search has already replaced
+                if generation != self.generation:
+                    continue
+                term, content = self.term, self.content
+                bound = self.first_filename if backward else self.last_filename
+                self.running = generation
+            try:
+                if self.conn is not None and self.conn.closed:
+                    #server dropped it, hand it back so the pool replaces it
+                    self.db.putconn(self.conn)
+                    self.conn = None
+                if self.conn is None:
+                    self.conn = self.db.getconn()
+                sql, params = self.build_query(term, bound, content, backward)
+                with self.conn.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    filenames = [row[0] for row in cursor.fetchall()]
+                if backward:
+                    filenames.reverse()
+                self.conn.rollback()
+            except errors.QueryCanceled:
+                self.conn.rollback()
+                with self.lock:
+                    self.running = None
+                    #the cancel was meant for an older query, run this one again
+                    if generation == self.generation:
+                        self.requests.put(request)
+                continue
+            except psycopg2.Error as e:
+                print(f"Error searching files: {e}")
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.rollback()
+                filenames = []
+            with self.lock:
+                self.running = None
+                if generation != self.generation:
+                    continue
+                self.pending = False
+                if backward:
+                    self.at_start = len(filenames) < self.page_size
+                    if filenames:
+                        self.first_filename = filenames[0]
+                else:
+                    self.exhausted = len(filenames) < self.page_size
+                    if filenames:
+                        self.last_filename = filenames[-1]
+                exhausted = self.exhausted
+            self.on_page(generation, filenames, exhausted, backward)
+        if self.conn is not None:
+            self.db.putconn(self.conn)
@@ -0,0 +1,117 @@
+import sys
+from itertools import islice
+
+#paths kept in the intern table, snapshots share a handful of shapes so this is only a guard
+#against files with unique keys growing it without bound
+MAX_INTERNED_PATHS = 65536
+#"Item n" labels built once, longer lists format the rest on demand
+CACHED_ITEM_LABELS = 1024
+
+#parent path -> {key: child path}
+_paths = {}
+_path_count = 0
+_item_labels = [f"Item {idx}" for idx in range(CACHED_ITEM_LABELS)]
+
+
+def child_paths(parent):
+    """the intern table of parent's children, {key: parent + (key,)}"""
+    table = _paths.get(parent)
+    if table is None:
+        table = {}
+        if _path_count < MAX_INTERNED_PATHS:
+            _paths[parent] = table
+    return table
+
+
+def child_path(table, parent, key):
+    """parent + (key,) from its intern table, the same tuple object every time"""
+    global _path_count
+    path = table.get(key)
+    if path is None:
+        if isinstance(key, str):
+            key = sys.intern(key)
+        path = parent + (key,)
+        if _path_count < MAX_INTERNED_PATHS:
+            table[key] = path
+            _path_count += 1
+    return path
+
+
+def label(key):
+    """how a path key is shown: dict keys as they are, list indexes as "Item n" """
+    if isinstance(key, int):
+        return _item_labels[key] if key < CACHED_ITEM_LABELS else f"Item {key}"
+    return str(key)
+
+
+def children(json_data, start=0, stop=None):
+    """(key, value) of the children of a dict or list, key is the list index for lists"""
+    if isinstance(json_data, dict):
+        return islice(json_data.items(), start, stop)
+    if isinstance(json_data, list):
+        return enumerate(json_data[start:stop], start)
+    return iter(())
+
+
+def flatten(json_data, max_depth=None, paths=True):
+    """yield (path, depth, value) for every node of a snapshot, parents before their children
+
+    path is the tuple of dict keys and list indexes leading to the node, () for
+    json_data itself, and depth is len(path). Containers are yielded too, with
+    their children following them. Nodes below max_depth are not visited, the
+    value of a node at max_depth is whatever it holds.
+
+    The walk keeps its own stack of iterators, so nesting depth is not limited
+    by the recursion limit, and paths are interned: the records of two
+    snapshots with the same shape share their path tuples.
+
+    With paths=False the records are (key, depth, value) instead, key being the
+    node's own dict key or list index (None for json_data). The export cells,
+    the report rows and the tree only need that, and skip building the paths.
+    """
+    if paths:
+        return _path_records(json_data, max_depth)
+    return _key_records(json_data, max_depth)
+
+
+def _path_records(json_data, max_depth):
+    yield (), 0, json_data
+    if not isinstance(json_data, (dict, list)) or max_depth == 0:
+        return
+    stack = [((), child_paths(()), children(json_data))]
+    while stack:
+        parent, paths, items = stack[-1]
+        depth = len(parent) + 1
+        for key, value in items:
+            path = paths.get(key) or child_path(paths, parent, key)
+            yield path, depth, value
+            if value and depth != max_depth and isinstance(value, (dict, list)):
+                stack.append((path, child_paths(path), children(value)))
+                break
+        else:
+            stack.pop()
+
+
+def _key_records(json_data, max_depth):
+    yield None, 0, json_data
+    if not isinstance(json_data, (dict, list)) or max_depth == 0:
+        return
+    stack = [iter(json_data.items()) if isinstance(json_data, dict) else enumerate(json_data)]
+    push = stack.append
+    depth = 1
+    while stack:
+        for key, value in stack[-1]:
+            yield key, depth, value
+            if value and depth != max_depth:
+                #exact type checks, json.loads only builds plain dicts and lists
+                if value.__class__ is dict:
+                    push(iter(value.items()))
+                    depth += 1
+                    break
+                if value.__class__ is list:
+                    push(enumerate(value))
+                    depth += 1
+                    break
+        else:
+            stack.pop()
+            depth -= 1
@@ -0,0 +1,83 @@
+import os
+import random
+from datetime import datetime, timedelta
+
+from snapshot import COMPACT_EXTENSION, TIMESTAMP_FORMAT, write_snapshot
+
+CPU_NAMES = [
+    "Intel(R) Core(TM) i5-8500 CPU @ 3.00GHz",
+    "Intel(R) Core(TM) i7-10700 CPU @ 2.90GHz",
+    "AMD Ryzen 5 PRO 4650G with Radeon Graphics",
+]
+BOARDS = [("Dell Inc.", "0V8F20"), ("LENOVO", "3132"), ("HP", "8767")]
+MEMORY_VENDORS = ["Samsung", "SK Hynix", "Micron", "Kingston"]
+DISK_MODELS = ["Samsung SSD 860 EVO 500GB", "ST1000DM010-2EP102", "KINGSTON SA400S37240G", "WDC WD10EZEX-08WN4A0"]
+PRINTER_DRIVERS = ["HP Universal Printing PCL 6", "Microsoft Print To PDF", "Kyocera TASKalfa 3253ci KX"]
+OS_CAPTIONS = ["Microsoft Windows 10 Pro", "Microsoft Windows 11 Pro"]
+
+
+def synthetic_snapshot(rng, index, taken_at, device_scale=1):
+    """one grabber.py-shaped snapshot, returns (filename, json_data)
+
+    device_scale multiplies the most memory modules, printers and disks a
+    machine can have, for fleets of print servers and storage boxes.
+    """
+    computer = f"PC{index:06d}"
+    domain = "corp.example.com"
+    board = rng.choice(BOARDS)
+    data = {
+        'CPU': [{'Name': rng.choice(CPU_NAMES), 'SocketDesignation': 'U3E1', 'Manufacturer': 'GenuineIntel',
+                 'NumberOfCores': rng.choice([4, 6, 8]), 'NumberOfLogicalProcessors': 12, 'MaxClockSpeed': 3000}],
+        'Motherboard': [{'Manufacturer': board[0], 'Product': board[1], 'SerialNumber': f"BSN{index:08d}"}],
+        'MemoryModules': [
+            {'Manufacturer': rng.choice(MEMORY_VENDORS), 'Capacity': str(rng.choice([4, 8, 16]) * 1024 ** 3),
+             'Speed': 2666, 'BankLabel': f"BANK {slot}", 'DeviceLocator': f"DIMM{slot}",
+             'SerialNumber': f"{rng.getrandbits(32):08X}", 'PartNumber': 'M378A1K43CB2-CTD'}
+            for slot in range(rng.randint(1, 4 * device_scale))
+        ],
+        'Printers': [
+            {'DeviceID': f"Printer {i}", 'DriverName': rng.choice(PRINTER_DRIVERS), 'Local': i == 0,
+             'Network': i > 0, 'PortName': f"IP_10.0.0.{i}", 'PrinterStatus': rng.choice(['Online', 'Offline'])}
+            for i in range(rng.randint(0, 5 * device_scale))
+        ],
+        'WIADevices': "No WIA devices found",
+        'DVD/CD-ROM': [{'Caption': 'HL-DT-ST DVD+-RW GU90N', 'Id': 'D:'}] if rng.random() < 0.3 else [],
+        'Disks': [
+            {'Model': rng.choice(DISK_MODELS), 'Size': str(rng.choice([240, 500, 1000]) * 1000 ** 3),
+             'SerialNumber': f"S{rng.getrandbits(40):010X}", 'InterfaceType': 'IDE', 'MediaType': 'Fixed hard disk media'}
+            for _ in range(rng.randint(1, 3 * device_scale))
+        ],
+        'OperatingSystem': [{'Caption': rng.choice(OS_CAPTIONS), 'Version': '10.0.19045', 'BuildNumber': '19045',
+                             'OSArchitecture': '64-bit', 'InstallDate': '20230115083012.000000+060'}],
+        'BIOS': [{'Manufacturer': board[0], 'SMBIOSBIOSVersion': '1.22.0'}],
+        'NetworkAdapters': [
+            {'Name': 'Ethernet adapter Ethernet', 'Description': 'Intel(R) Ethernet Connection (7) I219-LM',
+             'MACAddress': '-'.join(f"{rng.getrandbits(8):02X}" for _ in range(6)),
+             'IPv4': f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+             'DefaultGateway': '10.0.0.1'}
+        ],
+        'WindowsSID': f"4C4C4544-{index:04d}-1234-8056-B4C04F4A3732",
+        'LoggedInUsersHistory': ['Public', 'Default', f"user{index}"],
+    }
+    return f"{computer}_{domain}_{taken_at.strftime(TIMESTAMP_FORMAT)}.json", data
+
+
+def generate_fleet(machines, seed=0, taken_at=None, device_scale=1):
+    """yield (filename, json_data) for a synthetic fleet, deterministic for a seed"""
+    rng = random.Random(seed)
+    taken_at = taken_at or datetime(2024, 1, 1, 8, 0, 0)
+    for index in range(machines):
+        yield synthetic_snapshot(rng, index, taken_at + timedelta(seconds=index % 3600), device_scale)
+
+
+def write_fleet(directory, machines, seed=0, compact=False, device_scale=1):
+    """write a synthetic fleet as snapshot files into directory, returns their paths"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for filename, data in generate_fleet(machines, seed, device_scale=device_scale):
+        if compact:
+            filename = os.path.splitext(filename)[0] + COMPACT_EXTENSION
+        path = os.path.join(directory, filename)
+        write_snapshot(path, data, compact=compact)
+        paths.append(path)
+    return paths
@@ -1,183 +1,324 @@
-import wmi
-import json
-import os as os_module
-import shutil
-from datetime import datetime
-import win32com.client
+import os
+import sys
+import time
+import argparse
+import queue
+import threading
 import subprocess
+from datetime import datetime
+
+#modules of this directory, grabber.py is deployed with them: build_grabber.py bundles the set into one grabber.pyz
+import instrument
+import ipconfig_parser
+from snapshot import COMPACT_EXTENSION, CODEC_NAMES, write_snapshot
+from spool import DEFAULT_SPOOL_DIR, Spool, Uploader
+
+PATH_ADDR = r'//*path*'
+
+#seconds a collector may take before its section is recorded as timed out
+DEFAULT_TIMEOUT = 60
+
+#properties fetched per WMI class, the query becomes SELECT <these> FROM <class>.
+#covers what the report, the normalized tables and the change history read,
+#--full (or GRABBER_FULL=1) collects every property instead.
+PROJECTIONS = {
+    'Win32_ComputerSystem': ['Name', 'Domain'],
+    'Win32_Processor': ['DeviceID', 'Name', 'SocketDesignation', 'Manufacturer', 'NumberOfCores',
+                        'NumberOfLogicalProcessors', 'MaxClockSpeed'],
+    'Win32_BaseBoard': ['Manufacturer', 'Product', 'SerialNumber', 'Version'],
+    'Win32_PhysicalMemory': ['Manufacturer', 'Capacity', 'Speed', 'BankLabel', 'DeviceLocator', 'SerialNumber',
+                             'PartNumber'],
+    'Win32_Printer': ['DeviceID', 'DriverName', 'Local', 'Network', 'PortName', 'PrinterStatus'],
+    'Win32_CDROMDrive': ['Caption', 'Id', 'DeviceID'],
+    'Win32_DiskDrive': ['Model', 'Size', 'SerialNumber', 'InterfaceType', 'MediaType'],
+    'Win32_OperatingSystem': ['Caption', 'Version', 'BuildNumber', 'OSArchitecture', 'InstallDate', 'SerialNumber'],
+    'Win32_BIOS': ['Manufacturer', 'SMBIOSBIOSVersion', 'SerialNumber', 'ReleaseDate'],
+}
+
+#section name -> (collector function, timeout), filled by @collector in the order sections are written
+COLLECTORS = {}
+
+
+def collector(section, timeout=DEFAULT_TIMEOUT):
+    def register(func):
+        COLLECTORS[section] = (func, timeout)
+        return func
+    return register
+
+
+def default_wmi():
+    #COM has to be initialised on every thread that talks to WMI
+    import pythoncom
+    import wmi
+    pythoncom.CoInitialize()
+    return wmi.WMI()
+
 
-c = wmi.WMI()
-system_info = c.Win32_ComputerSystem()[0]
-computer_name = system_info.Name
-domain_name = system_info.Domain if system_info.Domain else "Workgroup"
-timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+def default_com_dispatch(name):
+    import pythoncom
+    import win32com.client
+    pythoncom.CoInitialize()
+    return win32com.client.Dispatch(name)
 
-filename = f"{computer_name}_{domain_name}_{timestamp}.json"
-wmi_info = {}
 
-def safe_wmi_object_to_dict(wmi_object):
+def default_run_command(command):
+    return subprocess.check_output(command, shell=True)
+
+
+class Backends:
+    """everything the collectors talk to, replace the factories with fakes to run on Linux"""
+
+    def __init__(self, wmi_factory=default_wmi, com_dispatch=default_com_dispatch,
+                 run_command=default_run_command, users_directory=r'C:\Users', full=False):
+        self.wmi_factory = wmi_factory
+        self.full = full
+        self.com_dispatch = com_dispatch
+        self.run_command = run_command
+        self.users_directory = users_directory
+        self.local = threading.local()
+
+    def wmi(self):
+        """WMI connection of the calling thread"""
+        if not hasattr(self.local, 'wmi'):
+            self.local.wmi = self.wmi_factory()
+        return self.local.wmi
+
+    def instances(self, class_name):
+        """instances of a WMI class and the properties to read from them"""
+        wmi_class = getattr(self.wmi(), class_name)
+        props = None if self.full else PROJECTIONS.get(class_name)
+        with instrument.span(f"wmi.{class_name}"):
+            if props:
+                #the wmi module turns a field list into SELECT prop1, prop2 FROM class
+                return wmi_class(props), props
+            return wmi_class(), None
+
+
+def safe_wmi_object_to_dict(wmi_object, props=None):
     result = {}
-    for prop in wmi_object.properties:
+    for prop in props or wmi_object.properties:
         try:
             result[prop] = getattr(wmi_object, prop, None)
         except Exception as e:
             result[prop] = f"Error retrieving property: {str(e)}"
     return result
 
+
+def wmi_class_collector(section, class_name, timeout=DEFAULT_TIMEOUT):
+    """register a collector that dumps every instance of a WMI class"""
+    def collect(backends):
+        instances, props = backends.instances(class_name)
+        return [safe_wmi_object_to_dict(obj, props) for obj in instances]
+    collect.__name__ = f"collect_{class_name}"
+    return collector(section, timeout)(collect)
+
+
 #CPU details
-cpu_info = []
-for cpu in c.Win32_Processor():
-    cpu_info.append(safe_wmi_object_to_dict(cpu))
-wmi_info['CPU'] = cpu_info
+wmi_class_collector('CPU', 'Win32_Processor')
 
 #motherboard details
-motherboard_info = []
-for board in c.Win32_BaseBoard():
-    motherboard_info.append(safe_wmi_object_to_dict(board))
-wmi_info['Motherboard'] = motherboard_info
+wmi_class_collector('Motherboard', 'Win32_BaseBoard')
 
 #memory module details
-memory_info = []
-for mem in c.Win32_PhysicalMemory():
-    memory_info.append(safe_wmi_object_to_dict(mem))
-wmi_info['MemoryModules'] = memory_info
-
-#printers
-printer_info = []
-for printer in c.Win32_Printer():
-    printer_info.append({
-        'DeviceID': printer.DeviceID,
-        'DriverName': printer.DriverName,
-        'Local': printer.Local,
-        'Network': printer.Network,
-        'PortName': printer.PortName,
-        'PrinterStatus': 'Online' if printer.PrinterStatus == 3 else 'Offline'
-    })
-wmi_info['Printers'] = printer_info
+wmi_class_collector('MemoryModules', 'Win32_PhysicalMemory')
 
-#imaging devices from WIA
-wia_service = win32com.client.Dispatch("WIA.DeviceManager")
-wia_devices_info = []
 
-for device in wia_service.DeviceInfos:
-    wia_devices_info.append({
-        'DeviceID': device.DeviceID,
-        'Type': device.Type,
-        'Name': device.Properties('Name').Value,
-        'Description': device.Properties('Description').Value
-    })
+#printers, offline network printers are the usual reason for a slow run
+@collector('Printers', timeout=30)
+def collect_printers(backends):
+    printer_info = []
+    printers, _ = backends.instances('Win32_Printer')
+    for printer in printers:
+        printer_info.append({
+            'DeviceID': printer.DeviceID,
+            'DriverName': printer.DriverName,
+            'Local': printer.Local,
+            'Network': printer.Network,
+            'PortName': printer.PortName,
+            'PrinterStatus': 'Online' if printer.PrinterStatus == 3 else 'Offline'
+        })
+    return printer_info
+
+
+#imaging devices from WIA
+@collector('WIADevices', timeout=30)
+def collect_wia_devices(backends):
+    wia_service = backends.com_dispatch("WIA.DeviceManager")
+    wia_devices_info = []
+    for device in wia_service.DeviceInfos:
+        wia_devices_info.append({
+            'DeviceID': device.DeviceID,
+            'Type': device.Type,
+            'Name': device.Properties('Name').Value,
+            'Description': device.Properties('Description').Value
+        })
+    return wia_devices_info if wia_devices_info else "No WIA devices found"
 
-wmi_info['WIADevices'] = wia_devices_info if wia_devices_info else "No WIA devices found"
 
 #DVD/CD-ROM
-dvd_info = []
-for dvd in c.Win32_CDROMDrive():
-    dvd_info.append(safe_wmi_object_to_dict(dvd))
-wmi_info['DVD/CD-ROM'] = dvd_info
+wmi_class_collector('DVD/CD-ROM', 'Win32_CDROMDrive')
 
 #disk drives
-disk_info = []
-for disk in c.Win32_DiskDrive():
-    disk_info.append(safe_wmi_object_to_dict(disk))
-wmi_info['Disks'] = disk_info
+wmi_class_collector('Disks', 'Win32_DiskDrive')
 
 #OS details
-os_info = []
-for os in c.Win32_OperatingSystem():
-    os_info.append(safe_wmi_object_to_dict(os))
-wmi_info['OperatingSystem'] = os_info
+wmi_class_collector('OperatingSystem', 'Win32_OperatingSystem')
 
 #BIOS details
-bios_info = []
-for bios in c.Win32_BIOS():
-    bios_info.append(safe_wmi_object_to_dict(bios))
-wmi_info['BIOS'] = bios_info
+wmi_class_collector('BIOS', 'Win32_BIOS')
+
 
 #network adapter details
-def get_network_info_ipconfig():
+def get_network_info_ipconfig(backends):
     try:
-        #decode using 'cp850' for Windows encoding - dont have a clue why
-        ipconfig_output = subprocess.check_output('ipconfig /all', shell=True).decode('cp850')
-        
-        ipconfig_lines = ipconfig_output.splitlines()
-        
-        network_adapters = []
-        current_adapter = {}
-        
-        for line in ipconfig_lines:
-            if line.startswith('Ethernet adapter') or line.startswith('Wireless LAN adapter'):
-                if current_adapter:
-                    network_adapters.append(current_adapter)
-                current_adapter = {'Name': line.strip(':')}
-            elif 'Physical Address' in line:
-                current_adapter['MACAddress'] = line.split(':')[-1].strip()
-            elif 'IPv4 Address' in line or 'IPv6 Address' in line:
-                ip_type = 'IPv4' if 'IPv4' in line else 'IPv6'
-                current_adapter[ip_type] = line.split(':')[-1].strip().replace('(Preferred)', '')
-            elif 'Description' in line:
-                current_adapter['Description'] = line.split(':')[-1].strip()
-            elif 'Default Gateway' in line:
-                current_adapter['DefaultGateway'] = line.split(':')[-1].strip()
-
-        if current_adapter:
-            network_adapters.append(current_adapter)
-        
-        return network_adapters
+        ipconfig_output = ipconfig_parser.decode_output(backends.run_command('ipconfig /all'))
+        with instrument.span("ipconfig.parse"):
+            return ipconfig_parser.parse(ipconfig_output)['Adapters']
     except Exception as e:
         return f"Error retrieving network information: {str(e)}"
-    
-wmi_info['NetworkAdapters'] = get_network_info_ipconfig()
+
+
+collector('NetworkAdapters', timeout=30)(get_network_info_ipconfig)
+
 
 #Windows SID
-try:
-    sid_output = subprocess.check_output('wmic csproduct get UUID', shell=True).decode().strip()
-    sid_lines = sid_output.split('\n')
-    
-    if len(sid_lines) > 1:
-        sid = sid_lines[1].strip()
-    else:
-        sid = "SID not found"
-    
-    wmi_info['WindowsSID'] = sid
-except Exception as e:
-    wmi_info['WindowsSID'] = f"Error retrieving SID: {e}"
+@collector('WindowsSID', timeout=30)
+def collect_windows_sid(backends):
+    try:
+        sid_output = backends.run_command('wmic csproduct get UUID').decode().strip()
+        sid_lines = sid_output.split('\n')
+
+        if len(sid_lines) > 1:
+            return sid_lines[1].strip()
+        return "SID not found"
+    except Exception as e:
+        return f"Error retrieving SID: {e}"
+
 
 #user profiles
-def fetch_user_profiles():
-    users_directory = os_module.path.expandvars(r'C:\Users')
+@collector('LoggedInUsersHistory', timeout=10)
+def fetch_user_profiles(backends):
+    users_directory = os.path.expandvars(backends.users_directory)
     user_profiles = []
     try:
-        for user_profile in os_module.listdir(users_directory):
-            if os_module.path.isdir(os_module.path.join(users_directory, user_profile)):
+        for user_profile in os.listdir(users_directory):
+            if os.path.isdir(os.path.join(users_directory, user_profile)):
                 user_profiles.append(user_profile)
     except Exception as e:
         user_profiles.append(f"Error retrieving profiles: {e}")
     return user_profiles
 
-wmi_info['LoggedInUsersHistory'] = fetch_user_profiles()
 
-#JSON file
-with open(filename, 'w') as f:
-    json.dump(wmi_info, f, indent=4)
+def run_collectors(backends, collectors=None):
+    """run every collector on its own thread, returns (sections, per-collector timing)
+
+    A collector that fails or runs past its timeout gets an error string as its
+    section, like the sections that already catch their own errors. Threads
+    that are still stuck are daemons and are dropped when the script exits.
+    """
+    collectors = collectors if collectors is not None else COLLECTORS
+    finished = queue.Queue()
+    started = time.monotonic()
+
+    def run(section, func):
+        begin = time.monotonic()
+        try:
+            with instrument.span(f"collect.{section}"):
+                value, status = func(backends), 'ok'
+        except Exception as e:
+            value, status = f"Error retrieving {section}: {e}", 'error'
+        finished.put((section, value, status, time.monotonic() - begin))
+
+    for section, (func, _) in collectors.items():
+        threading.Thread(target=run, args=(section, func), name=f"collect-{section}", daemon=True).start()
 
-print(f"WMI info has been saved to '{filename}'")
+    results = {}
+    timings = {}
+    pending = {section: started + timeout for section, (_, timeout) in collectors.items()}
+    while pending:
+        wait = min(pending.values()) - time.monotonic()
+        if wait <= 0:
+            now = time.monotonic()
+            for section, deadline in list(pending.items()):
+                if deadline <= now:
+                    del pending[section]
+                    timeout = collectors[section][1]
+                    results[section] = f"Error retrieving {section}: timed out after {timeout}s"
+                    timings[section] = {'Seconds': round(now - started, 3), 'Status': 'timeout'}
+            continue
+        try:
+            section, value, status, seconds = finished.get(timeout=wait)
+        except queue.Empty:
+            continue
+        if section in pending:
+            del pending[section]
+            results[section] = value
+            timings[section] = {'Seconds': round(seconds, 3), 'Status': status}
 
-# --- File Copy ---
+    #keep the sections in registration order, like the old sequential script wrote them
+    wmi_info = {section: results[section] for section in collectors}
+    return wmi_info, {section: timings[section] for section in collectors}
 
-PATH_ADDR = r'//*path*'
 
-try:
-    destination_path = PATH_ADDR
+def collect(backends=None, collectors=None):
+    """the full snapshot including the '_collection' timing section"""
+    backends = backends or Backends()
+    collected_at = datetime.now()
+    started = time.monotonic()
+    wmi_info, timings = run_collectors(backends, collectors)
+    wmi_info['_collection'] = {
+        'CollectedAt': collected_at.isoformat(timespec='seconds'),
+        'Seconds': round(time.monotonic() - started, 3),
+        'Collectors': timings,
+    }
+    return wmi_info
+
+
+def snapshot_filename(backends, extension='.json'):
+    system_info = backends.instances('Win32_ComputerSystem')[0][0]
+    computer_name = system_info.Name
+    domain_name = system_info.Domain if system_info.Domain else "Workgroup"
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{computer_name}_{domain_name}_{timestamp}{extension}"
+
+
+def main(argv=None, backends=None, destination_path=PATH_ADDR):
+    parser = argparse.ArgumentParser(description="Collect a hardware inventory snapshot")
+    parser.add_argument("--full", action="store_true", default=os.environ.get("GRABBER_FULL") == "1",
+                        help="collect every WMI property instead of the PROJECTIONS lists")
+    parser.add_argument("--compact", action="store_true", default=os.environ.get("GRABBER_COMPACT") == "1",
+                        help=f"write minified, compressed {COMPACT_EXTENSION} files instead of indented json")
+    parser.add_argument("--codec", choices=sorted(CODEC_NAMES), help="compression of --compact files "
+                        "(default: zstd if the zstandard package is installed, else gzip)")
+    parser.add_argument("--spool", default=DEFAULT_SPOOL_DIR,
+                        help="local directory snapshots wait in until they reach the share "
+                        "(default: $GRABBER_SPOOL, then %%ProgramData%%\\inventory\\spool)")
+    parser.add_argument("--limit-kbps", type=int, help="bandwidth limit for the upload in KiB/s")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure(args.profile, args.metrics)
+
+    backends = backends or Backends(full=args.full)
+    filename = snapshot_filename(backends, COMPACT_EXTENSION if args.compact else '.json')
+    wmi_info = collect(backends)
+
+    #JSON file
+    with instrument.span("snapshot.write"):
+        write_snapshot(filename, wmi_info, compact=args.compact, codec=args.codec)
+
+    print(f"WMI info has been saved to '{filename}'")
 
-    shutil.copy(filename, destination_path)
-    print(f"File copied to {destination_path}")
+    # --- Upload ---
 
-    print(f"Attempting to delete the original file: '{filename}' from the current directory.")
+    #the snapshot waits in the spool until it is on the share, earlier failed uploads go first
+    spool = Spool(args.spool)
+    spool.add(filename)
+    uploader = Uploader(spool, destination_path, bytes_per_second=args.limit_kbps * 1024 if args.limit_kbps else None)
+    with instrument.span("upload"):
+        remaining = uploader.flush()
+    if remaining:
+        print(f"{remaining} snapshots left in {spool.directory}, they are sent on the next run")
+    return 0
 
-    if os_module.path.exists(filename):
-        os_module.remove(filename)
-        print(f"File '{filename}' deleted from the current directory.")
-    else:
-        print(f"File '{filename}' not found in the current directory.")
-except Exception as e:
-    print(f"An error occurred during file copy or deletion: {e}")
+if __name__ == "__main__":
+    sys.exit(main())
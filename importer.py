@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from db import connect
+from snapshot import is_snapshot_file, read_snapshot
+from inventory_schema import create_inventory_tables, extract_inventory, ingest_batch
+from snapshot_diff import create_change_tables, record_changes
+from delta_store import create_delta_tables, hash_sections, update_changed_sections, write_delta_batch
+from content_search import create_content_search, search_text_sql
+from report_rows import create_report_rows, update_report_rows
+from inventory_config import MIN_FILES_FOR_POOL, STORAGE_MODES, add_dsn_argument
+
+UPSERT_SQL = f"""
+    INSERT INTO json_files (filename, content, search_text)
+    SELECT v.filename, v.content, {search_text_sql("v.content")} FROM (VALUES %s) v(filename, content)
+    ON CONFLICT (filename) DO UPDATE SET content = EXCLUDED.content, search_text = EXCLUDED.search_text,
+        sections = NULL, unhashed = NULL, changed_sections = NULL
+"""
+
+JSON_FILES_DDL = """
+    CREATE TABLE IF NOT EXISTS json_files (
+        id SERIAL PRIMARY KEY,
+        filename TEXT UNIQUE NOT NULL,
+        content JSONB NOT NULL
+    )
+"""
+
+
+class ImportProgress:
+    """counters for a running import, str() gives a status line"""
+
+    def __init__(self, total_files):
+        self.total_files = total_files
+        self.files_done = 0
+        self.bytes_done = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-6)
+
+    @property
+    def files_per_sec(self):
+        return self.files_done / self.elapsed
+
+    @property
+    def mb_per_sec(self):
+        return self.bytes_done / self.elapsed / (1024 * 1024)
+
+    def __str__(self):
+        return (f"Imported {self.files_done}/{self.total_files} files "
+                f"({self.files_per_sec:.1f} files/s, {self.mb_per_sec:.2f} MB/s, "
+                f"{len(self.errors)} errors)")
+
+
+def parse_json_file(file_path, storage="full"):
+    """parse one file in a worker, returns (filename, payload, size, inventory rows, error)
+
+    payload is the minified json for full storage and the hashed sections for delta storage.
+    """
+    filename = os.path.basename(file_path)
+    try:
+        json_data, size = read_snapshot(file_path)
+        inventory = extract_inventory(filename, json_data)
+        if storage == "delta":
+            return filename, hash_sections(json_data), size, inventory, None
+    except Exception as e:
+        return filename, None, 0, None, str(e)
+    #send text back instead of the dict, it is cheaper to pickle and goes straight into jsonb
+    return filename, json.dumps(json_data, separators=(',', ':')), size, inventory, None
+
+
+def iter_parsed(file_paths, workers=None, storage="full"):
+    """parse files in parallel, yielding results as soon as they are ready"""
+    parse = partial(parse_json_file, storage=storage)
+    if len(file_paths) < MIN_FILES_FOR_POOL or workers == 1:
+        for file_path in file_paths:
+            yield parse(file_path)
+        return
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        yield from executor.map(parse, file_paths, chunksize=32)
+    finally:
+        #drop queued files straight away if the import stops early
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def write_batch(cursor, batch, storage="full"):
+    """upsert a batch of (filename, payload, inventory) rows and their typed tables"""
+    #a filename can only appear once per INSERT ... ON CONFLICT, last one wins
+    latest = {filename: (payload, inventory) for filename, payload, inventory in batch}
+    rows = [(filename, payload) for filename, (payload, _) in latest.items()]
+    if storage == "delta":
+        write_delta_batch(cursor, rows)
+    else:
+        execute_values(cursor, UPSERT_SQL, rows, template="(%s, %s::jsonb)", page_size=len(rows))
+        #a full row can still be the new predecessor of a delta row
+        update_changed_sections(cursor, list(latest))
+    update_report_rows(cursor, list(latest))
+    ingest_batch(cursor, {filename: inventory for filename, (_, inventory) in latest.items()})
+    record_changes(cursor, list(latest))
+
+
+def import_files(conn, file_paths, batch_size=500, workers=None, progress_callback=None, check_cancelled=None,
+                 storage="full"):
+    """parse files in worker processes and upsert them into json_files in batches
+
+    storage "delta" stores each section once per distinct content, see delta_store.py.
+
+    check_cancelled is called before each batch is written and may raise to
+    stop the import, batches already committed are kept.
+    """
+    progress = ImportProgress(len(file_paths))
+    batch = []
+    batch_files = 0
+    batch_bytes = 0
+    with conn.cursor() as cursor:
+        for filename, content, size, inventory, error in iter_parsed(list(file_paths), workers, storage):
+            if error:
+                progress.errors.append((filename, error))
+                progress.files_done += 1
+                continue
+            batch.append((filename, content, inventory))
+            batch_files += 1
+            batch_bytes += size
+            if len(batch) >= batch_size:
+                if check_cancelled:
+                    check_cancelled()
+                write_batch(cursor, batch, storage)
+                conn.commit()
+                progress.files_done += batch_files
+                progress.bytes_done += batch_bytes
+                batch, batch_files, batch_bytes = [], 0, 0
+                if progress_callback:
+                    progress_callback(progress)
+        if batch:
+            if check_cancelled:
+                check_cancelled()
+            write_batch(cursor, batch, storage)
+            conn.commit()
+            progress.files_done += batch_files
+            progress.bytes_done += batch_bytes
+    if progress_callback:
+        progress_callback(progress)
+    return progress
+
+
+def create_tables(cursor):
+    """every table an import writes to"""
+    cursor.execute(JSON_FILES_DDL)
+    create_delta_tables(cursor)
+    create_inventory_tables(cursor)
+    create_change_tables(cursor)
+    create_content_search(cursor)
+    create_report_rows(cursor)
+
+
+def collect_paths(paths):
+    """expand directories into the snapshot files they contain"""
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if is_snapshot_file(f))
+        else:
+            file_paths.append(path)
+    return file_paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import grabber.py snapshots into PostgreSQL")
+    parser.add_argument("paths", nargs="+", help="snapshot files or directories containing them")
+    add_dsn_argument(parser)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="full",
+                        help="full stores every snapshot whole, delta stores only changed sections")
+    args = parser.parse_args(argv)
+
+    file_paths = collect_paths(args.paths)
+    conn = connect(args.dsn)
+    try:
+        with conn.cursor() as cursor:
+            create_tables(cursor)
+        conn.commit()
+        progress = import_files(conn, file_paths, args.batch_size, args.workers,
+                                progress_callback=lambda p: print(p, flush=True), storage=args.storage)
+    finally:
+        conn.close()
+    for filename, error in progress.errors:
+        print(f"Error importing {filename}: {error}", file=sys.stderr)
+    return 1 if progress.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
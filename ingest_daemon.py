@@ -0,0 +1,446 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import signal
+import asyncio
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import psycopg2
+
+import instrument
+from db import CONNECTION_ERRORS, connect
+from importer import create_tables, parse_json_file, write_batch
+from inventory_config import STORAGE_MODES, add_dsn_argument
+from snapshot import is_snapshot_file
+
+#seconds between scans of the drop directory
+POLL_INTERVAL = 2.0
+#files younger than this may still be written by something that does not rename into place
+SETTLE_SECONDS = 1.0
+#parsed snapshots waiting for the writer, parsing pauses when it is full
+QUEUE_SIZE = 1000
+#a batch is written when it is full or its oldest snapshot waited this long
+BATCH_SIZE = 500
+BATCH_WAIT = 0.5
+#seconds between status file updates, and the window files_per_second is measured over
+STATUS_INTERVAL = 5.0
+RATE_WINDOW = 60.0
+#database retries back off up to this many seconds
+MAX_RETRY_DELAY = 60.0
+#errors that can come from the content of one snapshot, anything else is about the database
+ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+
+class IngestStats:
+    """counters and recent commits for the status file"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.imported = 0
+        self.rejected = 0
+        self.batches = 0
+        self.db_errors = 0
+        self.last_error = None
+        self.last_commit_at = None
+        self.last_lag = None
+        self.max_lag = 0.0
+        #(commit time, files) of recent batches
+        self.recent = deque()
+
+    def committed(self, files, lags):
+        now = time.time()
+        self.imported += files
+        self.batches += 1
+        self.last_commit_at = now
+        self.recent.append((now, files))
+        while self.recent and self.recent[0][0] < now - RATE_WINDOW:
+            self.recent.popleft()
+        if lags:
+            self.last_lag = max(lags)
+            self.max_lag = max(self.max_lag, self.last_lag)
+
+    def files_per_second(self):
+        now = time.time()
+        window = min(RATE_WINDOW, now - self.started_at) or 1.0
+        return sum(files for at, files in self.recent if at >= now - RATE_WINDOW) / window
+
+
+class IngestDaemon:
+    """watch a drop directory and import every snapshot that appears in it
+
+    Files go through three stages joined by bounded queues: the watcher
+    queues paths it has not seen yet, parser tasks parse them in a process
+    pool, and the writer upserts batches on its own database thread. A full
+    queue stops the stage before it, so a slow database holds parsing back
+    instead of filling memory. Files are moved to the archive only after the
+    batch holding them was committed: a crash in between imports them again
+    on restart, which the upsert makes harmless (at-least-once). Files that
+    fail to parse go to the rejected directory with an .error file next to them.
+    The daemon stops by itself (failed says why) when a whole batch is refused
+    file by file, which points at the database rather than the snapshots.
+    """
+
+    def __init__(self, drop_dir, archive_dir, rejected_dir, dsn=None, storage="full", workers=None,
+                 batch_size=BATCH_SIZE, batch_wait=BATCH_WAIT, poll_interval=POLL_INTERVAL,
+                 queue_size=QUEUE_SIZE, status_path=None):
+        self.drop_dir = drop_dir
+        self.archive_dir = archive_dir
+        self.rejected_dir = rejected_dir
+        self.dsn = dsn
+        self.storage = storage
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self.status_path = status_path
+        self.stats = IngestStats()
+        #paths queued, being parsed or waiting to be written, the watcher skips them
+        self.in_flight = set()
+        self.stopping = None
+        self.failed = None
+        self.conn = None
+        for directory in (archive_dir, rejected_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.stopping.set)
+            except (NotImplementedError, RuntimeError):
+                #Windows event loops have no signal handlers, Ctrl+C still raises KeyboardInterrupt
+                pass
+        self.paths = asyncio.Queue(self.queue_size)
+        self.parsed = asyncio.Queue(self.queue_size)
+        self.parse_pool = ProcessPoolExecutor(max_workers=self.workers)
+        #psycopg2 connections are used from one thread only
+        self.db_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest-db")
+        try:
+            if not await self.connect_with_retry():
+                return
+            parsers = [asyncio.create_task(self.parse_loop()) for _ in range(self.workers)]
+            writer = asyncio.create_task(self.write_loop())
+            status = asyncio.create_task(self.status_loop())
+            await self.watch_loop()
+            #drain what was already picked up, then stop the other stages
+            await self.paths.join()
+            await self.parsed.join()
+            for task in parsers + [writer, status]:
+                task.cancel()
+            await asyncio.gather(*parsers, writer, status, return_exceptions=True)
+            self.write_status()
+        finally:
+            self.parse_pool.shutdown(wait=True, cancel_futures=True)
+            await self.call_db(self.disconnect)
+            self.db_thread.shutdown(wait=True)
+
+    async def connect_with_retry(self):
+        """False when the daemon was stopped before the database could be reached"""
+        attempt = 0
+        while True:
+            try:
+                await self.call_db(self.connect)
+                return True
+            except CONNECTION_ERRORS as e:
+                attempt += 1
+                delay = min(MAX_RETRY_DELAY, 2 ** attempt)
+                print(f"Cannot connect to the database ({e}), retrying in {delay}s", file=sys.stderr, flush=True)
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), delay)
+                    return False
+                except asyncio.TimeoutError:
+                    pass
+
+    def call_db(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.db_thread, func, *args)
+
+    def scan(self):
+        """settled snapshot files in the drop directory that are not in flight, oldest first"""
+        now = time.time()
+        found = []
+        #a status file kept in the drop directory is a .json file too
+        status = os.path.abspath(self.status_path) if self.status_path else None
+        with os.scandir(self.drop_dir) as entries:
+            for entry in entries:
+                if not entry.is_file() or not is_snapshot_file(entry.name) or entry.path in self.in_flight:
+                    continue
+                if status and os.path.abspath(entry.path) == status:
+                    continue
+                mtime = entry.stat().st_mtime
+                if now - mtime >= SETTLE_SECONDS:
+                    found.append((mtime, entry.path))
+        return [path for _, path in sorted(found)]
+
+    async def watch_loop(self):
+        while not self.stopping.is_set():
+            try:
+                paths = await asyncio.get_running_loop().run_in_executor(None, self.scan)
+            except OSError as e:
+                #the share may be away for a moment, keep polling
+                self.stats.last_error = f"scan of {self.drop_dir} failed: {e}"
+                paths = []
+            for path in paths:
+                if self.stopping.is_set():
+                    break
+                self.in_flight.add(path)
+                await self.paths.put(path)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def parse_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            path = await self.paths.get()
+            try:
+                pool = self.parse_pool
+                try:
+                    with instrument.span("ingest.parse"):
+                        result = await loop.run_in_executor(pool, parse_json_file, path, self.storage)
+                except Exception as e:
+                    #parse_json_file reports bad files itself, this is the pool failing (a worker killed
+                    #for memory breaks it for every file in it): leave the file for the next scan
+                    self.in_flight.discard(path)
+                    self.stats.last_error = f"parsing {os.path.basename(path)} failed: {e!r}"
+                    if isinstance(e, BrokenProcessPool):
+                        self.replace_parse_pool(pool)
+                    continue
+                await self.parsed.put((path, result))
+            finally:
+                self.paths.task_done()
+
+    def replace_parse_pool(self, broken):
+        """start a new parse pool in place of a broken one, once whichever parser task notices first"""
+        if self.parse_pool is not broken:
+            return
+        print("Parse pool broke, starting a new one", file=sys.stderr, flush=True)
+        self.parse_pool = ProcessPoolExecutor(max_workers=self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    async def next_batch(self):
+        """wait for a first parsed snapshot, then collect more for up to batch_wait seconds"""
+        batch = [await self.parsed.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.parsed.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def write_loop(self):
+        while True:
+            batch = await self.next_batch()
+            try:
+                good = []
+                for path, (filename, payload, _, inventory, error) in batch:
+                    if error:
+                        await self.call_db(self.reject, path, error)
+                    else:
+                        good.append((path, (filename, payload, inventory)))
+                if good:
+                    await self.write_with_retry(good)
+            finally:
+                for path, _ in batch:
+                    self.in_flight.discard(path)
+                    self.parsed.task_done()
+
+    async def write_with_retry(self, good):
+        """write a batch until it is committed
+
+        Lost connections and database errors (privileges, schema) are retried
+        with backoff, the files wait in the drop directory meanwhile. A data or
+        integrity error splits the batch until the files the database refuses
+        are found, those are rejected. When every file of a batch is refused
+        on its own the error is not about the snapshots: the daemon stops
+        instead of moving the share to the rejected directory.
+        """
+        pending = list(good)
+        attempt = 0
+        while pending and not self.failed:
+            size = len(pending)
+            try:
+                refused = await self.write_halves(pending, list(pending))
+            except CONNECTION_ERRORS as e:
+                message = f"database unavailable: {e}"
+            except psycopg2.Error as e:
+                message = f"database error: {e}"
+            else:
+                if len(refused) > 1 and len(refused) == size:
+                    self.stats.last_error = self.failed = (f"all {len(refused)} snapshots of a batch were refused, "
+                                                           f"stopping: {refused[0][1]}")
+                    print(self.failed, file=sys.stderr, flush=True)
+                    self.stopping.set()
+                    return
+                for path, error in refused:
+                    await self.call_db(self.reject, path, f"database refused the snapshot: {error}")
+                return
+            attempt += 1
+            self.stats.db_errors += 1
+            self.stats.last_error = message
+            if self.stopping.is_set():
+                return
+            delay = min(MAX_RETRY_DELAY, 2 ** attempt)
+            print(f"Batch of {len(pending)} snapshots failed ({message}), retry {attempt} in {delay}s",
+                  file=sys.stderr, flush=True)
+            await asyncio.sleep(delay / 2 + random.uniform(0, delay / 2))
+
+    async def write_halves(self, pending, part):
+        """write part, halving it on row errors, returns [(path, error)] of the single files refused
+
+        Committed files are taken off pending, so a retry after a lost
+        connection does not write them again.
+        """
+        try:
+            lags = await self.call_db(self.write, part)
+        except ROW_ERRORS as e:
+            self.stats.db_errors += 1
+            if len(part) == 1:
+                return [(part[0][0], str(e).strip())]
+            middle = len(part) // 2
+            return await self.write_halves(pending, part[:middle]) + await self.write_halves(pending, part[middle:])
+        self.stats.committed(len(part), lags)
+        for item in part:
+            pending.remove(item)
+        return []
+
+    def connect(self):
+        self.conn = connect(self.dsn)
+        with self.conn.cursor() as cursor:
+            create_tables(cursor)
+        self.conn.commit()
+
+    def disconnect(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def write(self, good):
+        """upsert and commit one batch, then archive its files, returns their lag in seconds (db thread)"""
+        if self.conn is None or self.conn.closed:
+            self.connect()
+        try:
+            with instrument.span("ingest.write"), self.conn.cursor() as cursor:
+                write_batch(cursor, [row for _, row in good], self.storage)
+            self.conn.commit()
+        except Exception:
+            #a broken connection is replaced on the next attempt, a failed statement just rolled back
+            try:
+                self.conn.rollback()
+            except Exception:
+                self.disconnect()
+            raise
+        now = time.time()
+        lags = []
+        for path, _ in good:
+            try:
+                lags.append(now - os.path.getmtime(path))
+                move(path, self.archive_dir)
+            except OSError as e:
+                #imported already, it is imported again on the next scan if it could not be moved
+                self.stats.last_error = f"archiving {os.path.basename(path)} failed: {e}"
+        return lags
+
+    def reject(self, path, error):
+        self.stats.rejected += 1
+        try:
+            target = move(path, self.rejected_dir)
+            with open(target + ".error", "w") as file:
+                file.write(error + "\n")
+        except OSError as e:
+            self.stats.last_error = f"rejecting {os.path.basename(path)} failed: {e}"
+        print(f"Rejected {os.path.basename(path)}: {error}", file=sys.stderr, flush=True)
+
+    async def status_loop(self):
+        while True:
+            self.write_status()
+            await asyncio.sleep(STATUS_INTERVAL)
+
+    def status(self):
+        stats = self.stats
+        return {
+            'drop_dir': self.drop_dir,
+            'pid': os.getpid(),
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stats.started_at)),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'imported': stats.imported,
+            'rejected': stats.rejected,
+            'batches': stats.batches,
+            'db_errors': stats.db_errors,
+            'files_per_second': round(stats.files_per_second(), 2),
+            #seconds from a file landing on the share to its batch being committed
+            'last_lag_seconds': round(stats.last_lag, 3) if stats.last_lag is not None else None,
+            'max_lag_seconds': round(stats.max_lag, 3),
+            'in_flight': len(self.in_flight),
+            'queued_paths': self.paths.qsize(),
+            'queued_parsed': self.parsed.qsize(),
+            'last_commit_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stats.last_commit_at))
+            if stats.last_commit_at else None,
+            'last_error': stats.last_error,
+            'failed': self.failed,
+        }
+
+    def write_status(self):
+        if not self.status_path:
+            return
+        partial = self.status_path + ".partial"
+        with open(partial, "w") as file:
+            json.dump(self.status(), file, indent=2)
+        os.replace(partial, self.status_path)
+
+
+def move(path, directory):
+    """move a file into directory, replacing an older file of the same name, returns the new path"""
+    target = os.path.join(directory, os.path.basename(path))
+    try:
+        os.replace(path, target)
+    except OSError:
+        #the archive may be on another file system than the share
+        shutil.move(path, target)
+    return target
+
+
+def main(argv=None):
+    from grabber import PATH_ADDR
+    parser = argparse.ArgumentParser(description="Import snapshots as they arrive in the grabber drop directory")
+    parser.add_argument("drop_dir", nargs="?", default=os.environ.get("INVENTORY_DROP_DIR", PATH_ADDR),
+                        help="directory grabber.py uploads to (default: $INVENTORY_DROP_DIR, then PATH_ADDR)")
+    parser.add_argument("--archive", help="imported files are moved here (default: <drop_dir>/archive)")
+    parser.add_argument("--rejected", help="unparsable files are moved here (default: <drop_dir>/rejected)")
+    add_dsn_argument(parser)
+    parser.add_argument("--storage", choices=STORAGE_MODES, default="full")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL, help="seconds between scans")
+    parser.add_argument("--status", help="keep a json status file with throughput and lag here")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure(args.profile, args.metrics)
+
+    daemon = IngestDaemon(args.drop_dir, args.archive or os.path.join(args.drop_dir, "archive"),
+                          args.rejected or os.path.join(args.drop_dir, "rejected"), dsn=args.dsn,
+                          storage=args.storage, workers=args.workers, batch_size=args.batch_size,
+                          poll_interval=args.poll_interval, status_path=args.status)
+    print(f"Watching {args.drop_dir}", flush=True)
+    try:
+        asyncio.run(daemon.run())
+    except KeyboardInterrupt:
+        pass
+    print(f"Stopped after importing {daemon.stats.imported} snapshots, {daemon.stats.rejected} rejected")
+    return 1 if daemon.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
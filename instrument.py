@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import atexit
+import bisect
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+#INVENTORY_PROFILE=cprofile,tracemalloc turns on the capture modes, INVENTORY_METRICS=<path> writes the
+#stage metrics there when the program exits: Prometheus text for *.prom, json otherwise
+PROFILE_ENV = "INVENTORY_PROFILE"
+METRICS_ENV = "INVENTORY_METRICS"
+PROFILE_MODES = ("cprofile", "tracemalloc")
+#where the metrics go when a capture mode is on but no path was given
+DEFAULT_METRICS_PATH = "inventory-metrics.json"
+
+#upper bounds of the latency histogram buckets in seconds, +Inf is implied
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StageMetrics:
+    """latency histogram and memory peak per stage, shared by every thread in the process
+
+    Memory peaks are only known while tracemalloc is tracing, see configure(),
+    and only for spans of the main thread, see span().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+
+    def record(self, name, seconds, peak_bytes=None):
+        with self.lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'count': 0, 'sum': 0.0, 'max': 0.0,
+                                             'buckets': [0] * (len(BUCKETS) + 1), 'peak_bytes': None}
+            stage['count'] += 1
+            stage['sum'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+            stage['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+            if peak_bytes is not None:
+                stage['peak_bytes'] = max(stage['peak_bytes'] or 0, peak_bytes)
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stage, buckets=list(stage['buckets'])) for name, stage in self.stages.items()}
+
+    def summary(self, limit=15):
+        """slowest stages by total time, one line each"""
+        lines = []
+        for name, stage in sorted(self.snapshot().items(), key=lambda item: -item[1]['sum'])[:limit]:
+            line = (f"{stage['sum']:8.3f}s total {stage['count']:6d}x avg {stage['sum'] / stage['count'] * 1000:8.1f}ms "
+                    f"max {stage['max'] * 1000:8.1f}ms")
+            if stage['peak_bytes'] is not None:
+                line += f" peak {stage['peak_bytes'] / 1048576:7.1f}MB"
+            lines.append(f"{line}  {name}")
+        return "\n".join(lines)
+
+    def to_json(self):
+        stages = {}
+        for name, stage in self.snapshot().items():
+            stages[name] = {
+                'count': stage['count'],
+                'seconds_sum': round(stage['sum'], 6),
+                'seconds_max': round(stage['max'], 6),
+                'buckets': {str(bound): count for bound, count in
+                            zip(BUCKETS + ('+Inf',), cumulative(stage['buckets']))},
+                'memory_peak_bytes': stage['peak_bytes'],
+            }
+        return {'program': os.path.basename(sys.argv[0]) if sys.argv else None, 'pid': os.getpid(),
+                'written_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': stages}
+
+    def to_prometheus(self):
+        lines = ["# HELP inventory_stage_seconds Time spent per instrumented stage.",
+                 "# TYPE inventory_stage_seconds histogram"]
+        stages = sorted(self.snapshot().items())
+        for name, stage in stages:
+            label = prometheus_label(name)
+            for bound, count in zip(BUCKETS + ('+Inf',), cumulative(stage['buckets'])):
+                lines.append(f'inventory_stage_seconds_bucket{{stage="{label}",le="{bound}"}} {count}')
+            lines.append(f'inventory_stage_seconds_sum{{stage="{label}"}} {stage["sum"]:.6f}')
+            lines.append(f'inventory_stage_seconds_count{{stage="{label}"}} {stage["count"]}')
+        lines += ["# HELP inventory_stage_memory_peak_bytes Highest python allocation peak seen in a stage on the main thread.",
+                  "# TYPE inventory_stage_memory_peak_bytes gauge"]
+        for name, stage in stages:
+            if stage['peak_bytes'] is not None:
+                lines.append(f'inventory_stage_memory_peak_bytes{{stage="{prometheus_label(name)}"}} '
+                             f'{stage["peak_bytes"]}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """write the metrics to path, Prometheus text format for *.prom files"""
+        text = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.to_json(), indent=2)
+        #written next to the target and renamed, a node_exporter textfile collector never sees half a file
+        partial = path + ".partial"
+        with open(partial, "w") as file:
+            file.write(text)
+        os.replace(partial, path)
+
+
+stage_metrics = StageMetrics()
+
+
+def cumulative(counts):
+    total = 0
+    for count in counts:
+        total += count
+        yield total
+
+
+def prometheus_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+#open spans of the main thread, so a nested span's allocation peak counts for its parents too
+_local = threading.local()
+
+
+@contextmanager
+def span(name):
+    """time a stage, and its allocation peak while tracemalloc is tracing
+
+    tracemalloc keeps one peak for the whole process, and a span measures it
+    by resetting it. Only spans of the main thread do that: a span on another
+    thread resetting the peak would cut short the measurement of every span
+    open at the same time. Spans of other threads are timed without a peak,
+    and a main thread peak includes what other threads allocated meanwhile.
+    """
+    tracing = tracemalloc.is_tracing() and threading.current_thread() is threading.main_thread()
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    frame = {'peak': 0, 'start': 0}
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['start'] = current
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        stack.pop()
+        peak_bytes = None
+        if tracing and tracemalloc.is_tracing():
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            peak_bytes = max(frame['peak'] - frame['start'], 0)
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        stage_metrics.record(name, seconds, peak_bytes)
+
+
+def timed(name):
+    """decorator running a function inside span(name)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class Profiler:
+    """cProfile over the main thread and every thread started after it"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def start(self):
+        self.enable_here()
+        #before 3.12 a profile only sees the thread that enabled it
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.thread_started)
+
+    def enable_here(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        with self.lock:
+            self.profiles.append(profile)
+
+    def thread_started(self, frame, event, arg):
+        sys.setprofile(None)
+        self.enable_here()
+
+    def stop(self, path):
+        threading.setprofile(None)
+        with self.lock:
+            profiles, self.profiles = self.profiles, []
+        stats = None
+        for profile in profiles:
+            profile.disable()
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(path)
+
+
+_profiler = None
+
+
+def configure(profile=None, metrics_path=None):
+    """turn on the capture modes and the metrics file, defaults come from the environment
+
+    profile is a comma separated list of PROFILE_MODES. Everything captured
+    is written when the program exits: the stage metrics to metrics_path and
+    the cProfile stats next to it as <name>.prof, for python -m pstats or snakeviz.
+    """
+    global _profiler
+    profile = os.environ.get(PROFILE_ENV, "") if profile is None else profile
+    metrics_path = metrics_path or os.environ.get(METRICS_ENV)
+    modes = {mode.strip().lower() for mode in profile.split(",") if mode.strip()}
+    unknown = modes - set(PROFILE_MODES)
+    if unknown:
+        raise ValueError(f"unknown profile mode '{', '.join(sorted(unknown))}', expected {', '.join(PROFILE_MODES)}")
+    if modes and not metrics_path:
+        metrics_path = DEFAULT_METRICS_PATH
+    if "tracemalloc" in modes and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    if "cprofile" in modes and _profiler is None:
+        _profiler = Profiler()
+        _profiler.start()
+    if metrics_path:
+        atexit.register(finish, metrics_path)
+    return metrics_path
+
+
+def finish(metrics_path):
+    """write what was captured, called at exit"""
+    global _profiler
+    if _profiler is not None:
+        _profiler.stop(os.path.splitext(metrics_path)[0] + ".prof")
+        _profiler = None
+    stage_metrics.write(metrics_path)
+
+
+def add_arguments(parser):
+    """--profile and --metrics for a command line tool, pass the parsed values to configure()"""
+    parser.add_argument("--profile", default=None,
+                        help=f"capture modes, comma separated from {', '.join(PROFILE_MODES)} (default: ${PROFILE_ENV})")
+    parser.add_argument("--metrics", default=None,
+                        help=f"write stage timings here at exit, *.prom for Prometheus text (default: ${METRICS_ENV})")
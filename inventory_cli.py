@@ -0,0 +1,157 @@
+import os
+import sys
+import argparse
+
+import exports
+import instrument
+import parquet_export
+from catalog import Catalog
+from inventory_config import STORAGE_MODES, add_dsn_argument
+from snapshot import is_snapshot_file
+
+
+def add_source_arguments(parser):
+    parser.add_argument("--dir", help="read snapshots from this directory (through its catalog) instead of PostgreSQL")
+    add_dsn_argument(parser)
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+
+
+def print_progress(text):
+    print(text, flush=True)
+
+
+def open_catalog(args):
+    catalog = Catalog(args.dir)
+    parsed, removed = catalog.refresh(lambda done, total: print_progress(f"Parsed {done}/{total} files"),
+                                      workers=args.workers)
+    print_progress(f"Catalog up to date: {parsed} files parsed, {removed} removed")
+    for filename, error in catalog.errors():
+        print(f"Skipping {filename}: {error}", file=sys.stderr)
+    return catalog
+
+
+def connect(args):
+    #imported here so directory sources work without psycopg2
+    from db import connect
+    return connect(args.dsn)
+
+
+def run_import(args):
+    import importer
+    conn = connect(args)
+    try:
+        with conn.cursor() as cursor:
+            importer.create_tables(cursor)
+        conn.commit()
+        progress = importer.import_files(conn, importer.collect_paths(args.paths), args.batch_size, args.workers,
+                                         progress_callback=print_progress, storage=args.storage)
+    finally:
+        conn.close()
+    for filename, error in progress.errors:
+        print(f"Error importing {filename}: {error}", file=sys.stderr)
+    return 1 if progress.errors else 0
+
+
+def run_export_excel(args):
+    if args.dir:
+        catalog = open_catalog(args)
+        try:
+            count = exports.write_export_xlsx(args.output, catalog.export_cells(), progress=print_progress)
+        finally:
+            catalog.close()
+    else:
+        conn = connect(args)
+        try:
+            count = exports.write_export_xlsx(args.output, exports.db_export_cells(conn), progress=print_progress)
+        finally:
+            conn.close()
+    print(f"Exported {count} snapshots to {args.output}")
+    return 0
+
+
+def check_minimal_report(args):
+    args.format = exports.report_format(args.output, args.format)
+
+
+def run_minimal_report(args):
+    fmt = args.format
+    if args.dir:
+        catalog = open_catalog(args)
+        try:
+            count = exports.write_report(args.output, *exports.catalog_report(catalog, args.latest), fmt=fmt)
+        finally:
+            catalog.close()
+    else:
+        conn = connect(args)
+        try:
+            count = exports.write_report(args.output, *exports.db_report(conn, args.latest), fmt=fmt)
+        finally:
+            conn.close()
+    print(f"Minimal report with {count} rows written to {args.output}")
+    return 0
+
+
+def run_export_parquet(args):
+    if args.dir:
+        file_paths = [os.path.join(args.dir, name) for name in sorted(os.listdir(args.dir)) if is_snapshot_file(name)]
+        counts, errors = parquet_export.write_parquet_tables(
+            args.output, parquet_export.iter_file_inventories(file_paths, args.workers), progress=print_progress)
+    else:
+        conn = connect(args)
+        try:
+            counts, errors = parquet_export.write_parquet_tables(
+                args.output, parquet_export.iter_db_inventories(conn), progress=print_progress)
+        finally:
+            conn.close()
+    for filename, error in errors:
+        print(f"Skipping {filename}: {error}", file=sys.stderr)
+    print(f"Parquet tables written to {args.output}: " + ", ".join(f"{table} {rows}" for table, rows in counts.items()))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inventory imports, exports and reports without the GUI")
+    instrument.add_arguments(parser)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="import snapshot files into PostgreSQL")
+    import_parser.add_argument("paths", nargs="+", help="snapshot files or directories containing them")
+    add_dsn_argument(import_parser)
+    import_parser.add_argument("--batch-size", type=int, default=500)
+    import_parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    import_parser.add_argument("--storage", choices=STORAGE_MODES, default="full")
+    import_parser.set_defaults(run=run_import)
+
+    export_parser = commands.add_parser("export-excel", help="every snapshot as a tree in one workbook")
+    export_parser.add_argument("output", help=".xlsx file to write")
+    add_source_arguments(export_parser)
+    export_parser.set_defaults(run=run_export_excel)
+
+    report_parser = commands.add_parser("minimal-report", help="one row per snapshot")
+    report_parser.add_argument("output", help=".xlsx, .csv or .parquet file to write")
+    report_parser.add_argument("--format", choices=exports.REPORT_FORMATS,
+                               help="output format (default: from the file extension)")
+    report_parser.add_argument("--latest", action="store_true", help="only the newest snapshot of each machine")
+    add_source_arguments(report_parser)
+    report_parser.set_defaults(run=run_minimal_report, check=check_minimal_report)
+
+    parquet_parser = commands.add_parser("export-parquet",
+                                         help="one long table per component (machine x disk, ...) as parquet")
+    parquet_parser.add_argument("output", help="directory to write <table>/part-NNNNN.parquet files into")
+    add_source_arguments(parquet_parser)
+    parquet_parser.set_defaults(run=run_export_parquet)
+
+    args = parser.parse_args(argv)
+    #only bad arguments are usage errors, a run that fails on a snapshot or the database exits 1 with its error
+    try:
+        instrument.configure(args.profile, args.metrics)
+        check = getattr(args, "check", None)
+        if check:
+            check(args)
+    except ValueError as e:
+        parser.error(str(e))
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+import os
+import configparser
+
+#settings shared by the viewers and every command line tool. This module needs nothing outside the
+#standard library, so tools that read snapshot directories can use it without psycopg2 installed.
+
+#[database] section of this file, every key can be overridden with INVENTORY_DB_<KEY>
+CONFIG_FILE = os.environ.get("INVENTORY_CONFIG", "inventory.ini")
+ENV_PREFIX = "INVENTORY_DB_"
+DEFAULT_CONFIG = {
+    "dbname": "inventory",
+    "user": "inventory",
+    "password": "",
+    "host": "localhost",
+    "port": "5432",
+    "min_connections": "1",
+    "max_connections": "8",
+    #idle seconds after which a pooled connection is pinged before it is handed out
+    "health_check_after": "30",
+    #"full" or "delta", how the viewer stores imported snapshots, see delta_store.py
+    "storage": "full",
+}
+CONNECT_KEYS = ("dbname", "user", "password", "host", "port")
+
+#how snapshots are stored in json_files, see delta_store.py
+STORAGE_MODES = ("full", "delta")
+
+#below this many files a process pool costs more to start than the parsing it saves
+MIN_FILES_FOR_POOL = 50
+
+DSN_HELP = ("libpq connection string (default: $INVENTORY_DSN, then the [database] section of "
+            f"{CONFIG_FILE} and INVENTORY_DB_* variables, like the viewer)")
+
+
+def load_db_config(path=CONFIG_FILE):
+    config = dict(DEFAULT_CONFIG)
+    parser = configparser.ConfigParser()
+    if parser.read(path) and parser.has_section("database"):
+        config.update(parser["database"])
+    for key in DEFAULT_CONFIG:
+        value = os.environ.get(ENV_PREFIX + key.upper())
+        if value is not None:
+            config[key] = value
+    return config
+
+
+def conninfo_value(value):
+    """value quoted for a libpq key=value connection string"""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def resolve_dsn(dsn=None, path=CONFIG_FILE):
+    """the connection string a tool should use: dsn, then $INVENTORY_DSN, then load_db_config(path)"""
+    dsn = dsn or os.environ.get("INVENTORY_DSN")
+    if dsn:
+        return dsn
+    config = load_db_config(path)
+    return " ".join(f"{key}={conninfo_value(config[key])}" for key in CONNECT_KEYS if config.get(key))
+
+
+def add_dsn_argument(parser):
+    """the --dsn option of every tool, resolved with resolve_dsn when the tool connects"""
+    parser.add_argument("--dsn", default=None, help=DSN_HELP)
@@ -0,0 +1,309 @@
+import sys
+import argparse
+from datetime import datetime
+
+from inventory_config import add_dsn_argument
+from snapshot import parse_snapshot_filename
+
+#typed tables next to json_files, one snapshot row per json_files row
+INVENTORY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS machine (
+        id SERIAL PRIMARY KEY,
+        computer_name TEXT NOT NULL,
+        domain_name TEXT NOT NULL,
+        UNIQUE (computer_name, domain_name)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS snapshot (
+        id SERIAL PRIMARY KEY,
+        json_file_id INTEGER UNIQUE NOT NULL REFERENCES json_files(id) ON DELETE CASCADE,
+        machine_id INTEGER NOT NULL REFERENCES machine(id),
+        taken_at TIMESTAMP,
+        windows_sid TEXT,
+        total_memory BIGINT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS snapshot_machine_taken_idx ON snapshot (machine_id, taken_at DESC)",
+    "CREATE INDEX IF NOT EXISTS snapshot_total_memory_idx ON snapshot (total_memory)",
+    """
+    CREATE TABLE IF NOT EXISTS cpu (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshot(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT,
+        socket_designation TEXT,
+        manufacturer TEXT,
+        number_of_cores INTEGER,
+        number_of_logical_processors INTEGER,
+        max_clock_speed INTEGER,
+        PRIMARY KEY (snapshot_id, position)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS cpu_name_idx ON cpu (name)",
+    """
+    CREATE TABLE IF NOT EXISTS memory_module (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshot(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        manufacturer TEXT,
+        capacity BIGINT,
+        speed INTEGER,
+        bank_label TEXT,
+        device_locator TEXT,
+        serial_number TEXT,
+        part_number TEXT,
+        PRIMARY KEY (snapshot_id, position)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS disk (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshot(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        model TEXT,
+        size BIGINT,
+        serial_number TEXT,
+        interface_type TEXT,
+        media_type TEXT,
+        PRIMARY KEY (snapshot_id, position)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS disk_model_idx ON disk (model)",
+    """
+    CREATE TABLE IF NOT EXISTS network_adapter (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshot(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT,
+        description TEXT,
+        mac_address TEXT,
+        ipv4 TEXT,
+        ipv6 TEXT,
+        default_gateway TEXT,
+        PRIMARY KEY (snapshot_id, position)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS network_adapter_mac_idx ON network_adapter (mac_address)",
+    """
+    CREATE TABLE IF NOT EXISTS printer (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshot(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        device_id TEXT,
+        driver_name TEXT,
+        port_name TEXT,
+        is_local BOOLEAN,
+        is_network BOOLEAN,
+        status TEXT,
+        PRIMARY KEY (snapshot_id, position)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS os (
+        snapshot_id INTEGER PRIMARY KEY REFERENCES snapshot(id) ON DELETE CASCADE,
+        caption TEXT,
+        version TEXT,
+        build_number TEXT,
+        os_architecture TEXT,
+        install_date TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS os_caption_idx ON os (caption)",
+    """
+    CREATE OR REPLACE VIEW latest_snapshot AS
+        SELECT DISTINCT ON (s.machine_id) s.*, m.computer_name, m.domain_name
+        FROM snapshot s JOIN machine m ON m.id = s.machine_id
+        ORDER BY s.machine_id, s.taken_at DESC NULLS LAST, s.id DESC
+    """,
+]
+
+#table -> column names after (snapshot_id, position)
+CHILD_COLUMNS = {
+    'cpu': ['name', 'socket_designation', 'manufacturer', 'number_of_cores',
+            'number_of_logical_processors', 'max_clock_speed'],
+    'memory_module': ['manufacturer', 'capacity', 'speed', 'bank_label', 'device_locator',
+                      'serial_number', 'part_number'],
+    'disk': ['model', 'size', 'serial_number', 'interface_type', 'media_type'],
+    'network_adapter': ['name', 'description', 'mac_address', 'ipv4', 'ipv6', 'default_gateway'],
+    'printer': ['device_id', 'driver_name', 'port_name', 'is_local', 'is_network', 'status'],
+}
+OS_COLUMNS = ['caption', 'version', 'build_number', 'os_architecture', 'install_date']
+
+
+def create_inventory_tables(cursor):
+    for statement in INVENTORY_DDL:
+        cursor.execute(statement)
+
+
+def to_int(value):
+    """WMI returns most numbers as strings, anything unparsable becomes NULL"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_text(value):
+    return None if value is None else str(value).strip()
+
+
+def to_cim_datetime(value):
+    """parse a CIM datetime like 20230115083012.000000+060"""
+    try:
+        return datetime.strptime(str(value)[:14], '%Y%m%d%H%M%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def section_items(json_data, section):
+    """the dicts of a section, sections that failed to collect are strings"""
+    items = json_data.get(section)
+    if not isinstance(items, list):
+        return []
+    return [item for item in items if isinstance(item, dict)]
+
+
+def extract_inventory(filename, json_data):
+    """pull the typed rows for one snapshot out of its JSON"""
+    computer, domain, taken_at = parse_snapshot_filename(filename)
+    memory_modules = [
+        (m.get('Manufacturer'), to_int(m.get('Capacity')), to_int(m.get('Speed')), to_text(m.get('BankLabel')),
+         to_text(m.get('DeviceLocator')), to_text(m.get('SerialNumber')), to_text(m.get('PartNumber')))
+        for m in section_items(json_data, 'MemoryModules')
+    ]
+    capacities = [m[1] for m in memory_modules if m[1] is not None]
+    os_rows = [
+        (o.get('Caption'), o.get('Version'), o.get('BuildNumber'), o.get('OSArchitecture'),
+         to_cim_datetime(o.get('InstallDate')))
+        for o in section_items(json_data, 'OperatingSystem')
+    ]
+    return {
+        'computer_name': computer,
+        'domain_name': domain,
+        'taken_at': taken_at,
+        'windows_sid': to_text(json_data.get('WindowsSID')),
+        'total_memory': sum(capacities) if capacities else None,
+        'os': os_rows[0] if os_rows else None,
+        'cpu': [
+            (c.get('Name'), c.get('SocketDesignation'), c.get('Manufacturer'), to_int(c.get('NumberOfCores')),
+             to_int(c.get('NumberOfLogicalProcessors')), to_int(c.get('MaxClockSpeed')))
+            for c in section_items(json_data, 'CPU')
+        ],
+        'memory_module': memory_modules,
+        'disk': [
+            (to_text(d.get('Model')), to_int(d.get('Size')), to_text(d.get('SerialNumber')),
+             d.get('InterfaceType'), d.get('MediaType'))
+            for d in section_items(json_data, 'Disks')
+        ],
+        'network_adapter': [
+            (a.get('Name'), a.get('Description'), a.get('MACAddress'), a.get('IPv4'), a.get('IPv6'),
+             a.get('DefaultGateway'))
+            for a in section_items(json_data, 'NetworkAdapters')
+        ],
+        'printer': [
+            (p.get('DeviceID'), p.get('DriverName'), p.get('PortName'), p.get('Local'), p.get('Network'),
+             p.get('PrinterStatus'))
+            for p in section_items(json_data, 'Printers')
+        ],
+    }
+
+
+def ingest_batch(cursor, inventories):
+    """write the typed rows for {filename: inventory}, replacing older rows for those files"""
+    from psycopg2.extras import execute_values
+    if not inventories:
+        return
+    cursor.execute("SELECT id, filename FROM json_files WHERE filename = ANY(%s)", (list(inventories),))
+    file_ids = {filename: file_id for file_id, filename in cursor.fetchall()}
+    inventories = {f: inv for f, inv in inventories.items() if f in file_ids}
+    if not inventories:
+        return
+
+    machines = sorted({(inv['computer_name'], inv['domain_name']) for inv in inventories.values()})
+    execute_values(cursor, """
+        INSERT INTO machine (computer_name, domain_name) VALUES %s
+        ON CONFLICT (computer_name, domain_name) DO NOTHING
+    """, machines)
+    cursor.execute("""
+        SELECT id, computer_name, domain_name FROM machine
+        WHERE (computer_name, domain_name) IN (SELECT * FROM unnest(%s::text[], %s::text[]))
+    """, ([m[0] for m in machines], [m[1] for m in machines]))
+    machine_ids = {(name, domain): machine_id for machine_id, name, domain in cursor.fetchall()}
+
+    #child rows go with the snapshot through ON DELETE CASCADE
+    cursor.execute("DELETE FROM snapshot WHERE json_file_id = ANY(%s)", (list(file_ids.values()),))
+    snapshot_rows = execute_values(cursor, """
+        INSERT INTO snapshot (json_file_id, machine_id, taken_at, windows_sid, total_memory) VALUES %s
+        RETURNING id, json_file_id
+    """, [(file_ids[f], machine_ids[(inv['computer_name'], inv['domain_name'])], inv['taken_at'],
+           inv['windows_sid'], inv['total_memory']) for f, inv in inventories.items()], fetch=True)
+    snapshot_ids = {file_id: snapshot_id for snapshot_id, file_id in snapshot_rows}
+
+    for table, columns in CHILD_COLUMNS.items():
+        rows = []
+        for filename, inv in inventories.items():
+            snapshot_id = snapshot_ids[file_ids[filename]]
+            rows.extend((snapshot_id, position) + item for position, item in enumerate(inv[table]))
+        if rows:
+            execute_values(cursor, f"INSERT INTO {table} (snapshot_id, position, {', '.join(columns)}) VALUES %s",
+                           rows)
+    os_rows = [(snapshot_ids[file_ids[f]],) + inv['os'] for f, inv in inventories.items() if inv['os']]
+    if os_rows:
+        execute_values(cursor, f"INSERT INTO os (snapshot_id, {', '.join(OS_COLUMNS)}) VALUES %s", os_rows)
+
+
+def machines_with_memory_below(cursor, max_bytes):
+    """latest snapshot of every machine with less than max_bytes of installed memory"""
+    cursor.execute("""
+        SELECT computer_name, domain_name, taken_at, total_memory FROM latest_snapshot
+        WHERE total_memory < %s ORDER BY total_memory, computer_name
+    """, (max_bytes,))
+    return cursor.fetchall()
+
+
+def backfill(conn, batch_size=500, rebuild=False, progress_callback=None):
+    """fill the typed tables from json_files rows that have none yet (or all rows with rebuild)"""
+    with conn.cursor() as cursor:
+        create_inventory_tables(cursor)
+    conn.commit()
+    where = "" if rebuild else "WHERE NOT EXISTS (SELECT 1 FROM snapshot s WHERE s.json_file_id = f.id)"
+    done = 0
+    #WITH HOLD keeps the source cursor open across the per-batch commits
+    with conn.cursor(name="inventory_backfill", withhold=True) as source, conn.cursor() as cursor:
+        source.execute(f"SELECT f.filename, f.content FROM json_snapshots f {where}")
+        while True:
+            rows = source.fetchmany(batch_size)
+            if not rows:
+                break
+            ingest_batch(cursor, {filename: extract_inventory(filename, content) for filename, content in rows})
+            conn.commit()
+            done += len(rows)
+            if progress_callback:
+                progress_callback(done)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create and backfill the normalized inventory tables")
+    parser.add_argument("command", choices=["migrate", "backfill"])
+    add_dsn_argument(parser)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--rebuild", action="store_true", help="re-extract rows that were already ingested")
+    args = parser.parse_args(argv)
+
+    #imported here so extract_inventory works without psycopg2, e.g. for parquet exports of a directory
+    from db import connect
+    conn = connect(args.dsn)
+    try:
+        if args.command == "migrate":
+            with conn.cursor() as cursor:
+                create_inventory_tables(cursor)
+            conn.commit()
+        else:
+            done = backfill(conn, args.batch_size, args.rebuild,
+                            progress_callback=lambda n: print(f"Backfilled {n} snapshots", flush=True))
+            print(f"Backfill finished, {done} snapshots")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,359 @@
+import os
+import re
+import sys
+import json
+import difflib
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from inventory_config import MIN_FILES_FOR_POOL
+
+#saved `ipconfig /all` outputs (*.txt, bytes as ipconfig wrote them) and their expected parse (*.json)
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "ipconfig")
+#ipconfig indents field lines by 3 spaces and the extra values of a field up to its value column
+CONTINUATION_INDENT = 8
+#console code page when the system one cannot be asked, the Western European OEM page
+DEFAULT_ENCODING = 'cp850'
+
+#field kinds: text as printed, a flag as True/False, a list of values, a list of addresses
+#with the (Preferred)/(Deprecated)/... state suffix removed
+TEXT, FLAG, LIST, ADDRESSES = 'text', 'flag', 'list', 'addresses'
+
+#field -> (kind, labels in English, German, French, Spanish, Italian)
+FIELDS = {
+    #Windows IP Configuration
+    'HostName': (TEXT, ["Host Name", "Hostname", "Nom de l'hôte", "Nombre de host", "Nome host"]),
+    'PrimaryDnsSuffix': (TEXT, ["Primary Dns Suffix", "Primäres DNS-Suffix", "Suffixe DNS principal",
+                                "Sufijo DNS principal", "Suffisso DNS primario"]),
+    'NodeType': (TEXT, ["Node Type", "Knotentyp", "Type de noeud", "Tipo de nodo", "Tipo nodo"]),
+    'IPRoutingEnabled': (FLAG, ["IP Routing Enabled", "IP-Routing aktiviert", "Routage IP activé",
+                                "Enrutamiento IP habilitado", "Routing IP abilitato"]),
+    'WINSProxyEnabled': (FLAG, ["WINS Proxy Enabled", "WINS-Proxy aktiviert", "Proxy WINS activé",
+                                "Proxy WINS habilitado", "Proxy WINS abilitato"]),
+    'DNSSuffixSearchList': (LIST, ["DNS Suffix Search List", "DNS-Suffixsuchliste", "Liste de recherche du suffixe DNS",
+                                   "Lista de búsqueda de sufijos DNS", "Elenco di ricerca suffissi DNS"]),
+    #adapters
+    'MediaState': (TEXT, ["Media State", "Medienstatus", "Statut du média", "Estado de los medios",
+                          "Stato supporto"]),
+    'DNSSuffix': (TEXT, ["Connection-specific DNS Suffix", "Verbindungsspezifisches DNS-Suffix",
+                         "Suffixe DNS propre à la connexion", "Sufijo DNS específico para la conexión",
+                         "Suffisso DNS specifico per connessione"]),
+    'ConnectionDNSSuffixSearchList': (LIST, ["Connection-specific DNS Suffix Search List",
+                                             "Verbindungsspezifische DNS-Suffixsuchliste",
+                                             "Liste de recherche de suffixes DNS propres à la connexion",
+                                             "Lista de búsqueda de sufijos DNS específicos de la conexión",
+                                             "Elenco di ricerca suffissi DNS specifici per connessione"]),
+    'Description': (TEXT, ["Description", "Beschreibung", "Descripción", "Descrizione"]),
+    'MACAddress': (TEXT, ["Physical Address", "Physische Adresse", "Adresse physique", "Dirección física",
+                          "Indirizzo fisico"]),
+    'DHCPEnabled': (FLAG, ["DHCP Enabled", "DHCP aktiviert", "DHCP activé", "DHCP habilitado", "DHCP abilitato"]),
+    'AutoconfigurationEnabled': (FLAG, ["Autoconfiguration Enabled", "Autokonfiguration aktiviert",
+                                        "Configuration automatique activée", "Configuración automática habilitada",
+                                        "Configurazione automatica abilitata"]),
+    'IPv6Addresses': (ADDRESSES, ["IPv6 Address", "IPv6-Adresse", "Adresse IPv6", "Dirección IPv6",
+                                  "Indirizzo IPv6"]),
+    'TemporaryIPv6Addresses': (ADDRESSES, ["Temporary IPv6 Address", "Temporäre IPv6-Adresse",
+                                           "Adresse IPv6 temporaire", "Dirección IPv6 temporal",
+                                           "Indirizzo IPv6 temporaneo"]),
+    'LinkLocalIPv6Addresses': (ADDRESSES, ["Link-local IPv6 Address", "Verbindungslokale IPv6-Adresse",
+                                           "Adresse IPv6 de liaison locale", "Vínculo: dirección IPv6 local",
+                                           "Indirizzo IPv6 locale rispetto al collegamento"]),
+    'IPv4Addresses': (ADDRESSES, ["IPv4 Address", "IP Address", "IPv4-Adresse", "Adresse IPv4",
+                                  "Dirección IPv4", "Indirizzo IPv4"]),
+    'AutoconfigurationIPv4Addresses': (ADDRESSES, ["Autoconfiguration IPv4 Address", "Autokonfiguration IPv4-Adresse",
+                                                   "Adresse d'autoconfiguration IPv4",
+                                                   "Dirección IPv4 de configuración automática",
+                                                   "Indirizzo IPv4 di configurazione automatica"]),
+    #the Italian label is "Subnet mask", matched by the English one
+    'SubnetMasks': (LIST, ["Subnet Mask", "Subnetzmaske", "Masque de sous-réseau", "Máscara de subred"]),
+    'LeaseObtained': (TEXT, ["Lease Obtained", "Lease erhalten", "Bail obtenu", "Concesión obtenida",
+                             "Lease ottenuto"]),
+    'LeaseExpires': (TEXT, ["Lease Expires", "Lease läuft ab", "Bail expirant", "La concesión expira",
+                            "Scadenza lease"]),
+    'DefaultGateways': (ADDRESSES, ["Default Gateway", "Standardgateway", "Passerelle par défaut",
+                                    "Puerta de enlace predeterminada", "Gateway predefinito"]),
+    'DHCPServer': (TEXT, ["DHCP Server", "DHCP-Server", "Serveur DHCP", "Servidor DHCP", "Server DHCP"]),
+    #"IAID DHCPv6" is the French and the Italian label
+    'DHCPv6IAID': (TEXT, ["DHCPv6 IAID", "DHCPv6-IAID", "IAID DHCPv6", "IAID de DHCPv6"]),
+    'DHCPv6ClientDUID': (TEXT, ["DHCPv6 Client DUID", "DHCPv6-Client-DUID", "DUID de client DHCPv6",
+                                "DUID de cliente DHCPv6", "DUID client DHCPv6"]),
+    'DNSServers': (ADDRESSES, ["DNS Servers", "DNS-Server", "Serveurs DNS", "Servidores DNS", "Server DNS"]),
+    'PrimaryWINSServer': (TEXT, ["Primary WINS Server", "Primärer WINS-Server", "Serveur WINS principal",
+                                 "Servidor WINS principal", "Server WINS primario"]),
+    'SecondaryWINSServer': (TEXT, ["Secondary WINS Server", "Sekundärer WINS-Server", "Serveur WINS secondaire",
+                                   "Servidor WINS secundario", "Server WINS secondario"]),
+    'NetBIOSOverTcpip': (TEXT, ["NetBIOS over Tcpip", "NetBIOS über TCP/IP", "NetBIOS sur Tcpip",
+                                "NetBIOS sobre TCP/IP", "NetBIOS su TCP/IP"]),
+}
+
+#fields that change on every DHCP lease renewal or privacy address rotation, snapshot_diff.py
+#does not report them and delta storage keeps them out of the section hashes
+VOLATILE_FIELDS = {'LeaseObtained', 'LeaseExpires', 'TemporaryIPv6Addresses'}
+
+#adapter header prefix -> kind, headers that match none are kept with kind 'Other'
+ADAPTER_KINDS = [
+    ("Ethernet adapter ", 'Ethernet'), ("Ethernet-Adapter ", 'Ethernet'), ("Carte Ethernet ", 'Ethernet'),
+    ("Adaptador de Ethernet ", 'Ethernet'), ("Scheda Ethernet ", 'Ethernet'),
+    ("Wireless LAN adapter ", 'Wireless'), ("Drahtlos-LAN-Adapter ", 'Wireless'),
+    ("Carte réseau sans fil ", 'Wireless'), ("Adaptador de LAN inalámbrica ", 'Wireless'),
+    ("Scheda LAN wireless ", 'Wireless'),
+    ("Tunnel adapter ", 'Tunnel'), ("Tunneladapter ", 'Tunnel'), ("Carte Tunnel ", 'Tunnel'),
+    ("Adaptador de túnel ", 'Tunnel'), ("Scheda Tunnel ", 'Tunnel'),
+    ("PPP adapter ", 'PPP'), ("PPP-Adapter ", 'PPP'), ("Carte PPP ", 'PPP'), ("Adaptador PPP ", 'PPP'),
+    ("Scheda PPP ", 'PPP'),
+    ("Unknown adapter ", 'Unknown'), ("Unbekannter Adapter ", 'Unknown'), ("Carte inconnue ", 'Unknown'),
+    ("Adaptador desconocido ", 'Unknown'), ("Scheda sconosciuta ", 'Unknown'),
+]
+
+YES = {"yes", "ja", "oui", "sí", "si", "sì"}
+NO = {"no", "nein", "non"}
+
+#"(Preferred)", "(Bevorzugt)", "(Deprecated)", ... after an address
+_address_state = re.compile(r"\s*\([^()]*\)$")
+
+
+def label_key(label):
+    """a field label as it is looked up: no dot leaders, no case"""
+    return label.rstrip(" .\t").strip().casefold()
+
+
+#casefolded label -> (field, kind)
+LABELS = {label_key(label): (field, kind) for field, (kind, labels) in FIELDS.items() for label in labels}
+
+
+def oem_encoding():
+    """the console code page ipconfig writes in"""
+    if sys.platform == 'win32':
+        try:
+            import ctypes
+            return f"cp{ctypes.windll.kernel32.GetOEMCP()}"
+        except Exception:
+            pass
+    return DEFAULT_ENCODING
+
+
+def decode_output(raw, encoding=None):
+    """ipconfig output bytes as text: utf-8 when it is (chcp 65001), the console code page otherwise"""
+    if isinstance(raw, str):
+        return raw
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode(encoding or oem_encoding(), errors='replace')
+
+
+def adapter_header(header):
+    """(kind, connection name) of an adapter header line without its colon"""
+    for prefix, kind in ADAPTER_KINDS:
+        if header.startswith(prefix):
+            return kind, header[len(prefix):].strip()
+    return 'Other', header
+
+
+class IpconfigParser:
+    """single pass over `ipconfig /all` lines, feed() them as they come and close() for the result
+
+    The result is {'Host': {field: value}, 'Adapters': [{field: value}]}, with
+    fields named after FIELDS whatever the output language. Every adapter has
+    its header as Name, its Kind and the Connection name; the first IPv4/IPv6
+    address and gateway are repeated as IPv4, IPv6 and DefaultGateway, the
+    keys snapshots had before. Labels that are not in FIELDS are kept under
+    Other, so an unknown locale loses nothing.
+    """
+
+    def __init__(self):
+        self.host = {}
+        self.adapters = []
+        #record the field lines go to, the host section until the first adapter header
+        self.record = self.host
+        #field a continuation line adds to
+        self.values = None
+
+    def feed(self, line):
+        line = line.rstrip("\r\n")
+        text = line.strip()
+        if not text:
+            return
+        if not line[0].isspace():
+            self.values = None
+            if text.endswith(":"):
+                name = text[:-1].rstrip()
+                kind, connection = adapter_header(name)
+                self.record = {'Name': name, 'Kind': kind, 'Connection': connection}
+                self.adapters.append(self.record)
+            else:
+                #"Windows IP Configuration"
+                self.record = self.host
+            return
+        if len(line) - len(line.lstrip()) >= CONTINUATION_INDENT:
+            if self.values is not None:
+                self.values.append(text)
+            return
+        self.field_line(text)
+
+    def field_line(self, text):
+        #labels have no colon except the odd one ("Vínculo: dirección IPv6 local"), values often
+        #have some (IPv6), so the label is the shortest one before a colon that is a known label
+        colon = text.find(":")
+        if colon == -1:
+            self.values = None
+            return
+        separator = colon
+        match = None
+        while separator != -1:
+            match = LABELS.get(label_key(text[:separator]))
+            if match:
+                break
+            separator = text.find(":", separator + 1)
+        if match is None:
+            separator = colon
+        value = text[separator + 1:].strip()
+        self.values = None
+        if match is None:
+            self.record.setdefault('Other', {})[text[:separator].rstrip(" .")] = value
+            return
+        field, kind = match
+        if kind in (LIST, ADDRESSES):
+            self.values = self.record.setdefault(field, [])
+            if value:
+                self.values.append(value)
+        elif value:
+            if kind == FLAG:
+                folded = value.casefold()
+                value = True if folded in YES else False if folded in NO else value
+            self.record[field] = value
+
+    def close(self):
+        for record in [self.host] + self.adapters:
+            for field, value in list(record.items()):
+                if field in FIELDS and FIELDS[field][0] in (LIST, ADDRESSES):
+                    if FIELDS[field][0] == ADDRESSES:
+                        value = [_address_state.sub("", address) for address in value]
+                    if value:
+                        record[field] = value
+                    else:
+                        del record[field]
+        for adapter in self.adapters:
+            ipv4 = adapter.get('IPv4Addresses') or adapter.get('AutoconfigurationIPv4Addresses')
+            if ipv4:
+                adapter['IPv4'] = ipv4[0]
+            ipv6 = adapter.get('IPv6Addresses') or adapter.get('LinkLocalIPv6Addresses')
+            if ipv6:
+                adapter['IPv6'] = ipv6[0]
+            gateways = adapter.get('DefaultGateways')
+            if gateways:
+                #the IPv4 one when there is one, it goes next to IPv4 in the reports
+                adapter['DefaultGateway'] = next((g for g in gateways if ":" not in g), gateways[0])
+        return {'Host': self.host, 'Adapters': self.adapters}
+
+
+def parse(text):
+    """{'Host': ..., 'Adapters': [...]} for the text of `ipconfig /all`"""
+    parser = IpconfigParser()
+    for line in text.splitlines():
+        parser.feed(line)
+    return parser.close()
+
+
+def read_output(path, encoding=None):
+    """the text of a saved ipconfig output"""
+    with open(path, "rb") as file:
+        return decode_output(file.read(), encoding)
+
+
+def parse_file(path, encoding=None):
+    """(path, result or None, error) for a saved ipconfig output, for a worker process"""
+    try:
+        return path, parse(read_output(path, encoding)), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def parse_files(paths, workers=None, encoding=None):
+    """yield (path, result, error) for saved outputs, parsed in worker processes"""
+    parse_one = partial(parse_file, encoding=encoding)
+    if workers == 1 or len(paths) < MIN_FILES_FOR_POOL:
+        yield from map(parse_one, paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse_one, paths, chunksize=32)
+
+
+def fixture_paths(directory=FIXTURE_DIR):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".txt"))
+
+
+def golden_path(path):
+    return os.path.splitext(path)[0] + ".json"
+
+
+def to_json(result):
+    return json.dumps(result, indent=2, ensure_ascii=False) + "\n"
+
+
+def check_fixtures(directory=FIXTURE_DIR, update=False, workers=None, encoding=None):
+    """compare every fixture's parse with its golden file, returns the number that differ
+
+    update rewrites the golden files from the current parser instead.
+    """
+    failed = 0
+    for path, result, error in parse_files(fixture_paths(directory), workers, encoding):
+        name = os.path.basename(path)
+        if error:
+            print(f"{name}: {error}")
+            failed += 1
+            continue
+        actual = to_json(result)
+        if update:
+            with open(golden_path(path), "w", encoding="utf-8") as file:
+                file.write(actual)
+            print(f"{name}: golden file written")
+            continue
+        try:
+            with open(golden_path(path), encoding="utf-8") as file:
+                expected = file.read()
+        except FileNotFoundError:
+            print(f"{name}: no golden file, run with --update")
+            failed += 1
+            continue
+        if actual != expected:
+            failed += 1
+            print(f"{name}: differs from its golden file")
+            sys.stdout.writelines(difflib.unified_diff(expected.splitlines(True), actual.splitlines(True),
+                                                       golden_path(name), "parsed"))
+        else:
+            print(f"{name}: ok")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse saved `ipconfig /all` outputs into json")
+    parser.add_argument("paths", nargs="*", help="saved outputs to print as json")
+    parser.add_argument("--check", nargs="?", const=FIXTURE_DIR, metavar="DIR",
+                        help=f"compare the fixtures in DIR with their golden files (default: {FIXTURE_DIR})")
+    parser.add_argument("--update", action="store_true", help="with --check, rewrite the golden files")
+    parser.add_argument("--encoding", help=f"code page of the saved outputs that are not utf-8 "
+                        f"(default: the console's, {DEFAULT_ENCODING} off Windows)")
+    parser.add_argument("--workers", type=int, default=None, help="parser processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    if args.check:
+        failed = check_fixtures(args.check, update=args.update, workers=args.workers, encoding=args.encoding)
+        return 1 if failed else 0
+    if not args.paths:
+        parser.error("give saved outputs to parse, or --check")
+    failed = 0
+    results = {}
+    for path, result, error in parse_files(args.paths, args.workers, args.encoding):
+        if error:
+            print(f"{path}: {error}", file=sys.stderr)
+            failed += 1
+        else:
+            results[path] = result
+    sys.stdout.write(to_json(results if len(args.paths) > 1 else next(iter(results.values()), None)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """handle for one background job, passed to the work function"""
+
+    def __init__(self, job_id, name, runner):
+        self.id = job_id
+        self.name = name
+        self.runner = runner
+        self.status = "Queued"
+        self.conn = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """call between steps of long work, raises JobCancelled once cancel() was requested"""
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self.cancel_event.set()
+        #abort a query that is already running on this job's connection
+        conn = self.conn
+        if conn is not None and not conn.closed:
+            conn.cancel()
+
+    def progress(self, text):
+        """update the job's status line, safe to call from the worker thread"""
+        self.runner.root.after(0, self.runner.set_status, self, text)
+
+
+class JobRunner:
+    """runs work(job, conn) on a thread pool, each job on its own pooled connection
+
+    on_done(result) and on_error(exception) are called on the Tk thread
+    through root.after, so they may touch widgets and show dialogs.
+    on_change(jobs) is called whenever a job is added, updated or finished.
+    """
+
+    def __init__(self, root, db, max_workers=4, on_change=None):
+        self.root = root
+        self.db = db
+        self.on_change = on_change
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.ids = itertools.count(1)
+        self.jobs = {}
+
+    def submit(self, name, work, on_done=None, on_error=None, needs_db=True):
+        job = Job(next(self.ids), name, self)
+        self.jobs[job.id] = job
+        self.changed()
+        self.executor.submit(self.run, job, work, on_done, on_error, needs_db)
+        return job
+
+    def run(self, job, work, on_done, on_error, needs_db):
+        self.root.after(0, self.set_status, job, "Running")
+        try:
+            job.check_cancelled()
+            if needs_db:
+                result = self.db.run(lambda conn: self.run_on(job, work, conn))
+            else:
+                result = work(job, None)
+        except Exception as e:
+            self.root.after(0, self.finish, job, on_error, e, True)
+            return
+        self.root.after(0, self.finish, job, on_done, result, False)
+
+    def run_on(self, job, work, conn):
+        job.conn = conn
+        try:
+            return work(job, conn)
+        finally:
+            job.conn = None
+
+    def finish(self, job, callback, value, failed):
+        self.jobs.pop(job.id, None)
+        self.changed()
+        if isinstance(value, JobCancelled) or (failed and job.cancelled):
+            return
+        if callback:
+            callback(value)
+        elif failed:
+            print(f"Job '{job.name}' failed: {value}")
+
+    def set_status(self, job, text):
+        job.status = text
+        self.changed()
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job:
+            job.cancel()
+            self.set_status(job, "Cancelling...")
+
+    def cancel_all(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
+
+    def changed(self):
+        if self.on_change:
+            self.on_change(list(self.jobs.values()))
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
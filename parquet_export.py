@@ -0,0 +1,167 @@
+import os
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+from inventory_config import MIN_FILES_FOR_POOL
+from inventory_schema import CHILD_COLUMNS, OS_COLUMNS, extract_inventory
+from snapshot import read_snapshot
+
+#snapshots per row group, each table is flushed after this many
+ROW_GROUP_SNAPSHOTS = 5000
+#rows per parquet file before the next part-NNNNN file of a table is started
+MAX_ROWS_PER_FILE = 5_000_000
+#every table starts with the machine and snapshot it belongs to
+KEY_COLUMNS = [('filename', 'string'), ('computer_name', 'string'), ('domain_name', 'string'),
+               ('taken_at', 'timestamp')]
+
+#column types of the long tables, they follow the PostgreSQL tables in inventory_schema.py
+COLUMN_TYPES = {
+    'snapshot': [('windows_sid', 'string'), ('total_memory', 'int64')],
+    'cpu': [('name', 'string'), ('socket_designation', 'string'), ('manufacturer', 'string'),
+            ('number_of_cores', 'int32'), ('number_of_logical_processors', 'int32'), ('max_clock_speed', 'int32')],
+    'memory_module': [('manufacturer', 'string'), ('capacity', 'int64'), ('speed', 'int32'), ('bank_label', 'string'),
+                      ('device_locator', 'string'), ('serial_number', 'string'), ('part_number', 'string')],
+    'disk': [('model', 'string'), ('size', 'int64'), ('serial_number', 'string'), ('interface_type', 'string'),
+             ('media_type', 'string')],
+    'network_adapter': [('name', 'string'), ('description', 'string'), ('mac_address', 'string'), ('ipv4', 'string'),
+                        ('ipv6', 'string'), ('default_gateway', 'string')],
+    'printer': [('device_id', 'string'), ('driver_name', 'string'), ('port_name', 'string'), ('is_local', 'bool'),
+                ('is_network', 'bool'), ('status', 'string')],
+    'os': [('caption', 'string'), ('version', 'string'), ('build_number', 'string'), ('os_architecture', 'string'),
+           ('install_date', 'timestamp')],
+}
+
+
+def coerce(value, type_name):
+    """a value as the column type expects it, None when it does not fit"""
+    if value is None:
+        return None
+    if type_name == 'string':
+        return str(value)
+    if type_name in ('int32', 'int64'):
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+    if type_name == 'bool':
+        return value if isinstance(value, bool) else None
+    return value if isinstance(value, datetime) else None
+
+
+def inventory_rows(filename, inventory):
+    """{table: [row dicts]} for one snapshot's extract_inventory() result"""
+    keys = {'filename': filename, 'computer_name': inventory['computer_name'],
+            'domain_name': inventory['domain_name'], 'taken_at': inventory['taken_at']}
+    tables = {'snapshot': [dict(keys, windows_sid=inventory['windows_sid'], total_memory=inventory['total_memory'])]}
+    for table, columns in CHILD_COLUMNS.items():
+        tables[table] = [dict(keys, position=position, **dict(zip(columns, item)))
+                         for position, item in enumerate(inventory[table])]
+    tables['os'] = [dict(keys, **dict(zip(OS_COLUMNS, inventory['os'])))] if inventory['os'] else []
+    return tables
+
+
+def parse_file_inventory(file_path):
+    """(filename, inventory or None, error) for a worker process"""
+    filename = os.path.basename(file_path)
+    try:
+        json_data, _ = read_snapshot(file_path)
+        return filename, extract_inventory(filename, json_data), None
+    except Exception as e:
+        return filename, None, str(e)
+
+
+def iter_file_inventories(file_paths, workers=None):
+    """yield (filename, inventory, error) for snapshot files, parsed in worker processes"""
+    if workers == 1 or len(file_paths) < MIN_FILES_FOR_POOL:
+        yield from map(parse_file_inventory, file_paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(parse_file_inventory, file_paths, chunksize=32)
+
+
+def iter_db_inventories(conn, batch_size=200):
+    """yield (filename, inventory, None) for every snapshot in the database"""
+    with conn.cursor(name="parquet_export") as cursor:
+        cursor.itersize = batch_size
+        cursor.execute("SELECT filename, content FROM json_snapshots ORDER BY filename")
+        for filename, json_data in cursor:
+            yield filename, extract_inventory(filename, json_data), None
+
+
+class TableWriter:
+    """one long table written as <directory>/<table>/part-NNNNN.parquet files"""
+
+    def __init__(self, pa, pq, directory, table, max_rows_per_file=MAX_ROWS_PER_FILE):
+        self.pa = pa
+        self.pq = pq
+        self.directory = os.path.join(directory, table)
+        self.max_rows_per_file = max_rows_per_file
+        columns = list(KEY_COLUMNS)
+        if table not in ('snapshot', 'os'):
+            columns.append(('position', 'int32'))
+        self.columns = columns + COLUMN_TYPES[table]
+        arrow_types = {'string': pa.string(), 'int32': pa.int32(), 'int64': pa.int64(), 'bool': pa.bool_(),
+                       'timestamp': pa.timestamp('s')}
+        self.schema = pa.schema([(name, arrow_types[type_name]) for name, type_name in self.columns])
+        self.rows = []
+        self.writer = None
+        self.file_rows = 0
+        self.part = 0
+        self.total_rows = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def add(self, rows):
+        self.rows.extend(rows)
+
+    def flush(self):
+        """write the buffered rows as a row group, starting a new file when the current one is full"""
+        if not self.rows:
+            return
+        if self.writer is not None and self.file_rows >= self.max_rows_per_file:
+            self.writer.close()
+            self.writer = None
+        if self.writer is None:
+            path = os.path.join(self.directory, f"part-{self.part:05d}.parquet")
+            self.writer = self.pq.ParquetWriter(path, self.schema)
+            self.part += 1
+            self.file_rows = 0
+        arrays = [self.pa.array([coerce(row.get(name), type_name) for row in self.rows], type=field.type)
+                  for (name, type_name), field in zip(self.columns, self.schema)]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+        self.file_rows += len(self.rows)
+        self.total_rows += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def write_parquet_tables(directory, inventories, row_group_snapshots=ROW_GROUP_SNAPSHOTS, progress=None):
+    """write the long tables for (filename, inventory, error) items, returns ({table: rows}, errors)
+
+    Rows are buffered for row_group_snapshots snapshots at a time, so memory
+    stays bounded and finished row groups are on disk as the export runs.
+    """
+    #optional dependency, only needed for parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writers = {table: TableWriter(pa, pq, directory, table) for table in COLUMN_TYPES}
+    errors = []
+    count = 0
+    try:
+        for filename, inventory, error in inventories:
+            if error:
+                errors.append((filename, error))
+                continue
+            for table, rows in inventory_rows(filename, inventory).items():
+                writers[table].add(rows)
+            count += 1
+            if count % row_group_snapshots == 0:
+                for writer in writers.values():
+                    writer.flush()
+                if progress:
+                    progress(f"{count} snapshots written")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {table: writer.total_rows for table, writer in writers.items()}, errors
@@ -0,0 +1,291 @@
+import sys
+import json
+import time
+import argparse
+
+from flatten import flatten
+from inventory_config import add_dsn_argument
+from snapshot import split_snapshot_filename
+
+#one entry per report field: (section, field, repeats, column prefix)
+#repeats is SINGLE for one value taken from the last item (CPU_Name), a number for
+#numbered columns (MemoryModule_1_Capacity ...) or JOINED for a comma separated list.
+#field None means the section itself is the value (WindowsSID).
+SINGLE = 'single'
+JOINED = 'joined'
+
+REPORT_COLUMNS = [
+    ('CPU', 'Name', SINGLE, 'CPU'),
+    ('CPU', 'SocketDesignation', SINGLE, 'CPU'),
+    ('Motherboard', 'Manufacturer', SINGLE, 'MB'),
+    ('Motherboard', 'Product', SINGLE, 'MB'),
+    ('MemoryModules', 'Manufacturer', 8, 'MemoryModule'),
+    ('MemoryModules', 'Capacity', 8, 'MemoryModule'),
+    ('Printers', 'DriverName', 10, 'Printer'),
+    ('WIADevices', 'Name', JOINED, 'WIADevices'),
+    ('DVD/CD-ROM', 'Caption', 4, 'DVDDrive'),
+    ('DVD/CD-ROM', 'Id', 4, 'DVDDrive'),
+    ('Disks', 'Model', 8, 'Disk'),
+    ('Disks', 'Size', 8, 'Disk'),
+    ('OperatingSystem', 'Caption', SINGLE, 'OS'),
+    ('OperatingSystem', 'InstallDate', SINGLE, 'OS'),
+    ('NetworkAdapters', 'Description', 8, 'NetworkAdapter'),
+    ('NetworkAdapters', 'MACAddress', 8, 'NetworkAdapter'),
+    ('NetworkAdapters', 'IPv4', 8, 'NetworkAdapter'),
+    ('WindowsSID', None, SINGLE, 'WindowsSID'),
+]
+
+#only items matching (field, value) are reported for these sections. Numbered columns
+#keep the item's position among all items, so Printer_2_DriverName is the second
+#printer even when the first one is offline.
+SECTION_FILTERS = {
+    'Printers': ('PrinterStatus', 'Online'),
+}
+
+BASE_COLUMNS = ['ComputerName', 'DomainName', 'DateTime']
+
+
+def column_names(section, field, repeats, prefix):
+    """the report columns one spec entry expands to"""
+    if field is None or repeats == JOINED:
+        return [prefix]
+    if repeats == SINGLE:
+        return [f"{prefix}_{field}"]
+    return [f"{prefix}_{i + 1}_{field}" for i in range(repeats)]
+
+
+def report_column_names():
+    """every column the report can have, before empty ones are dropped"""
+    return BASE_COLUMNS + [name for spec in REPORT_COLUMNS for name in column_names(*spec)]
+
+
+def sql_literal(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def section_sql(section):
+    """SQL expression for a section's array, with its filter applied"""
+    if section in SECTION_FILTERS:
+        field, value = SECTION_FILTERS[section]
+        path = f'$."{section}"[*] ? (@."{field}" == "{value}")'
+        return f"jsonb_path_query_array(content, {sql_literal(path)})"
+    return f"(content->{sql_literal(section)})"
+
+
+def item_sql(section, index, field):
+    """SQL expression for field of the section's item at index, NULL for items SECTION_FILTERS drops"""
+    item = f"(content->{sql_literal(section)}) -> {index}"
+    value = f"{item}->>{sql_literal(field)}"
+    if section in SECTION_FILTERS:
+        filter_field, filter_value = SECTION_FILTERS[section]
+        return f"CASE WHEN {item}->>{sql_literal(filter_field)} = {sql_literal(filter_value)} THEN {value} END"
+    return value
+
+
+def build_report_sql(table="json_snapshots", key_columns=()):
+    """one SELECT that extracts every report column inside PostgreSQL, after key_columns of table"""
+    #the filename is split like snapshot.split_snapshot_filename: the timestamp is matched at the
+    #end of the stem, so domains with underscores stay whole
+    columns = list(key_columns) + [
+        "split_part(COALESCE(parts.head, parts.stem), '_', 1) AS \"ComputerName\"",
+        "CASE WHEN parts.head IS NULL THEN split_part(parts.stem, '_', 2) "
+        "WHEN strpos(parts.head, '_') > 0 THEN substr(parts.head, strpos(parts.head, '_') + 1) "
+        "ELSE '' END AS \"DomainName\"",
+        "parts.stamp AS \"DateTime\"",
+    ]
+    for section, field, repeats, prefix in REPORT_COLUMNS:
+        names = column_names(section, field, repeats, prefix)
+        if field is None:
+            columns.append(f"content->>{sql_literal(section)} AS \"{names[0]}\"")
+        elif repeats == JOINED:
+            items = section_sql(section)
+            columns.append(
+                f"CASE WHEN jsonb_typeof({items}) = 'array' THEN "
+                f"(SELECT string_agg(COALESCE(d->>{sql_literal(field)}, d #>> '{{}}'), ', ') "
+                f"FROM jsonb_array_elements({items}) d) "
+                f"ELSE {items} #>> '{{}}' END AS \"{names[0]}\"")
+        elif repeats == SINGLE:
+            columns.append(f"{item_sql(section, -1, field)} AS \"{names[0]}\"")
+        else:
+            for i, name in enumerate(names):
+                columns.append(f"{item_sql(section, i, field)} AS \"{name}\"")
+    return (f"SELECT {', '.join(columns)} FROM {table} "
+            "CROSS JOIN LATERAL (SELECT regexp_replace(filename, '[.][^.]*$', '') AS stem) stem "
+            "CROSS JOIN LATERAL (SELECT stem.stem, "
+            "substring(stem.stem from '^(.*)_[0-9]{8}_[0-9]{6}$') AS head, "
+            "substring(stem.stem from '_([0-9]{8}_[0-9]{6})$') AS stamp) parts")
+
+
+def finish_report(df):
+    """drop numbered columns nobody filled and sort the columns like the old report"""
+    empty = [col for col in df.columns if col not in BASE_COLUMNS and df[col].isna().all()]
+    df = df.drop(columns=empty)
+    return df.reindex(sorted(df.columns), axis=1)
+
+
+def sql_report(conn, table="json_snapshots"):
+    """build the minimal report with one columnar read"""
+    import pandas as pd
+    df = pd.read_sql(build_report_sql(table), conn)
+    conn.rollback()
+    return finish_report(df)
+
+
+def report_value(value):
+    """format a value the way ->> renders it in SQL"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def build_report_lookups():
+    """REPORT_COLUMNS by the section their values come from, see build_report_row"""
+    section_columns = {}
+    joined_columns = {}
+    item_columns = {}
+    for section, field, repeats, prefix in REPORT_COLUMNS:
+        names = column_names(section, field, repeats, prefix)
+        if field is None:
+            section_columns.setdefault(section, []).append(names[0])
+        elif repeats == JOINED:
+            joined_columns.setdefault(section, []).append((names[0], field))
+        else:
+            item_columns.setdefault(section, []).append((field, names, repeats == SINGLE))
+    return section_columns, joined_columns, item_columns
+
+
+#section -> [column of the whole value], section -> [(JOINED column, field)],
+#section -> [(field, [column of the first item, the second item, ...], SINGLE)]
+SECTION_COLUMNS, JOINED_COLUMNS, ITEM_COLUMNS = build_report_lookups()
+REPORT_SECTIONS = list(dict.fromkeys(section for section, _, _, _ in REPORT_COLUMNS))
+
+
+def build_report_row(filename, data):
+    """the python equivalent of build_report_sql for one snapshot
+
+    Each reported section is flattened one level down to its items: a section
+    fills the columns of its whole value, an item passing SECTION_FILTERS fills
+    the columns of its position, or the SINGLE columns when it is the last
+    item. Columns without a value are left out of the row.
+    """
+    computer, domain, stamp = split_snapshot_filename(filename)
+    row = {'ComputerName': computer, 'DomainName': domain, 'DateTime': stamp}
+    for section in REPORT_SECTIONS:
+        section_data = data.get(section)
+        if section_data is None:
+            continue
+        for name in SECTION_COLUMNS.get(section, ()):
+            row[name] = report_value(section_data)
+        joined_columns = JOINED_COLUMNS.get(section, ())
+        if not isinstance(section_data, list):
+            for name, _ in joined_columns:
+                row[name] = report_value(section_data)
+            continue
+        joined = [[] for _ in joined_columns]
+        item_columns = ITEM_COLUMNS.get(section, ())
+        section_filter = SECTION_FILTERS.get(section)
+        last = len(section_data) - 1
+        records = flatten(section_data, max_depth=1, paths=False)
+        next(records)  #the section itself
+        for position, _, item in records:
+            is_dict = isinstance(item, dict)
+            if section_filter and not (is_dict and item.get(section_filter[0]) == section_filter[1]):
+                continue
+            for texts, (_, field) in zip(joined, joined_columns):
+                texts.append(str(item.get(field, item)) if is_dict else str(item))
+            if not is_dict:
+                continue
+            for field, names, single in item_columns:
+                if field not in item:
+                    continue
+                if single:
+                    if position == last:
+                        row[names[0]] = report_value(item[field])
+                elif position < len(names):
+                    row[names[position]] = report_value(item[field])
+        for texts, (name, _) in zip(joined, joined_columns):
+            row[name] = ', '.join(texts)
+    return row
+
+
+def python_report(rows):
+    """build the minimal report from (filename, json_data) pairs in python"""
+    import pandas as pd
+    all_data = [build_report_row(filename, data) for filename, data in rows]
+    df = pd.DataFrame(all_data, columns=report_column_names())
+    return finish_report(df)
+
+
+def same_report(first, second):
+    """whether two report frames hold the same columns and values, whatever their row order"""
+    if list(first.columns) != list(second.columns):
+        return False
+    frames = []
+    for df in (first, second):
+        df = df.sort_values(BASE_COLUMNS, na_position='last').reset_index(drop=True).astype(object)
+        frames.append(df.where(df.notna(), None))
+    return frames[0].equals(frames[1])
+
+
+def benchmark(conn, snapshots):
+    """time the SQL and python report paths on (filename, json_data) snapshots loaded into a temp table"""
+    import pandas as pd
+    from psycopg2.extras import Json, execute_values
+    snapshots = list(snapshots)
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE TEMP TABLE bench_json_files (filename TEXT PRIMARY KEY, content JSONB NOT NULL)")
+        execute_values(cursor, "INSERT INTO bench_json_files (filename, content) VALUES %s",
+                       ((filename, Json(data)) for filename, data in snapshots))
+    conn.commit()
+
+    started = time.perf_counter()
+    sql_df = pd.read_sql(build_report_sql("bench_json_files"), conn)
+    sql_df = finish_report(sql_df)
+    sql_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT filename, content FROM bench_json_files")
+        py_df = python_report(cursor.fetchall())
+    py_seconds = time.perf_counter() - started
+    conn.rollback()
+
+    with conn.cursor() as cursor:
+        cursor.execute("DROP TABLE bench_json_files")
+    conn.commit()
+    return {'machines': len(snapshots), 'sql_seconds': sql_seconds, 'python_seconds': py_seconds,
+            'same_report': same_report(sql_df, py_df)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Minimal inventory report")
+    parser.add_argument("command", choices=["report", "benchmark"])
+    add_dsn_argument(parser)
+    parser.add_argument("--output", default="minimal_report.xlsx")
+    parser.add_argument("--machines", type=int, default=5000, help="synthetic fleet size for benchmark")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic fleet seed for benchmark")
+    args = parser.parse_args(argv)
+
+    #imported here so the file based viewer can use the report rows without psycopg2 or pandas
+    from db import connect
+    from fleet import generate_fleet
+    conn = connect(args.dsn)
+    try:
+        if args.command == "report":
+            sql_report(conn).to_excel(args.output, index=False)
+            print(f"Minimal report written to {args.output}")
+        else:
+            result = benchmark(conn, generate_fleet(args.machines, args.seed))
+            print(f"{result['machines']} machines: SQL {result['sql_seconds']:.2f}s, "
+                  f"python {result['python_seconds']:.2f}s, same report: {result['same_report']}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import sys
+import argparse
+
+from inventory_config import add_dsn_argument
+from report import build_report_sql
+from snapshot import parse_snapshot_filename
+
+#the minimal report row of every snapshot, kept up to date by the importer so a report is one
+#sequential read instead of extracting every column from every snapshot again. row holds the
+#report columns that have a value, the machine columns are repeated for the latest-per-machine index.
+REPORT_ROWS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS report_row (
+        json_file_id INTEGER PRIMARY KEY REFERENCES json_files(id) ON DELETE CASCADE,
+        computer_name TEXT,
+        domain_name TEXT,
+        taken_at TIMESTAMP,
+        row JSONB NOT NULL
+    )
+    """,
+    #snapshots without a timestamp in their filename sort after the dated ones, like max(taken_at) in the catalog
+    "CREATE INDEX IF NOT EXISTS report_row_latest_idx "
+    "ON report_row (computer_name, domain_name, taken_at DESC NULLS LAST)",
+]
+
+#the report rows of the json_snapshots rows in a VALUES list of (filename, taken_at). taken_at is
+#parsed from the filename in python like the catalog and the inventory tables do, None for
+#digits that are no date (20241399_250000)
+UPSERT_SQL = f"""
+    INSERT INTO report_row (json_file_id, computer_name, domain_name, taken_at, row)
+    SELECT r.id, r."ComputerName", r."DomainName", t.taken_at,
+           jsonb_strip_nulls(to_jsonb(r) - 'id' - 'filename')
+    FROM ({build_report_sql(key_columns=("id", "filename"))}) r
+    JOIN (VALUES %s) t(filename, taken_at) ON t.filename = r.filename
+    ON CONFLICT (json_file_id) DO UPDATE SET
+        computer_name = EXCLUDED.computer_name,
+        domain_name = EXCLUDED.domain_name,
+        taken_at = EXCLUDED.taken_at,
+        row = EXCLUDED.row
+"""
+
+#every snapshot, or the newest one of each machine, in report order. The latter walks report_row_latest_idx.
+REPORT_ROWS_SQL = {
+    False: "SELECT row FROM report_row ORDER BY computer_name, domain_name, taken_at",
+    True: "SELECT DISTINCT ON (computer_name, domain_name) row FROM report_row "
+          "ORDER BY computer_name, domain_name, taken_at DESC NULLS LAST",
+}
+
+
+def create_report_rows(cursor):
+    for statement in REPORT_ROWS_DDL:
+        cursor.execute(statement)
+
+
+def update_report_rows(cursor, filenames):
+    """recompute the report rows of imported snapshots"""
+    #imported here so the file based viewer can use the exports without psycopg2
+    from psycopg2.extras import execute_values
+    rows = [(filename, parse_snapshot_filename(filename)[2]) for filename in filenames]
+    if rows:
+        execute_values(cursor, UPSERT_SQL, rows, template="(%s, %s::timestamp)", page_size=len(rows))
+
+
+def fill_missing(cursor, batch_size=1000):
+    """add rows for snapshots imported before report_row existed, returns how many"""
+    cursor.execute("SELECT f.filename FROM json_files f "
+                   "WHERE NOT EXISTS (SELECT 1 FROM report_row m WHERE m.json_file_id = f.id)")
+    filenames = [filename for (filename,) in cursor.fetchall()]
+    for start in range(0, len(filenames), batch_size):
+        update_report_rows(cursor, filenames[start:start + batch_size])
+    return len(filenames)
+
+
+def filled_columns(cursor, latest=False):
+    """the report columns at least one of the selected rows has a value for"""
+    cursor.execute(f"SELECT DISTINCT jsonb_object_keys(row) FROM ({REPORT_ROWS_SQL[latest]}) r")
+    return [name for (name,) in cursor.fetchall()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill or rebuild the materialized minimal report rows")
+    parser.add_argument("command", choices=["backfill", "rebuild"],
+                        help="backfill adds missing rows, rebuild recomputes every row after REPORT_COLUMNS changed")
+    add_dsn_argument(parser)
+    args = parser.parse_args(argv)
+
+    from db import connect
+    conn = connect(args.dsn)
+    try:
+        with conn.cursor() as cursor:
+            create_report_rows(cursor)
+            if args.command == "rebuild":
+                cursor.execute("TRUNCATE report_row")
+            done = fill_missing(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"{done} report rows written")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
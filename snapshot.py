@@ -0,0 +1,111 @@
+import os
+import re
+import gzip
+import json
+import struct
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#grabber.py names files {ComputerName}_{Domain}_{%Y%m%d_%H%M%S}.json, or .hwinv in the compact format
+TIMESTAMP_FORMAT = '%Y%m%d_%H%M%S'
+SNAPSHOT_EXTENSIONS = ('.json', '.hwinv')
+COMPACT_EXTENSION = '.hwinv'
+#a stem ending in _<8 digits>_<6 digits> is computer_domain_timestamp, the domain may contain underscores.
+#report.py's build_report_sql splits filenames with the same pattern.
+STAMPED_STEM = re.compile(r'(.*)_([0-9]{8}_[0-9]{6})')
+
+#compact format: magic, format version, codec, then the minified json compressed with the codec
+COMPACT_MAGIC = b'HWINV'
+COMPACT_VERSION = 1
+COMPACT_HEADER = struct.Struct('>5sBB')
+CODEC_GZIP = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {'gzip': CODEC_GZIP, 'zstd': CODEC_ZSTD}
+
+
+def is_snapshot_file(filename):
+    return filename.lower().endswith(SNAPSHOT_EXTENSIONS)
+
+
+def default_codec():
+    """zstd when the zstandard package is installed, gzip otherwise"""
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def open_compact_stream(file, codec):
+    """decompressing reader over the rest of file"""
+    if codec == CODEC_GZIP:
+        return gzip.GzipFile(fileobj=file, mode='rb')
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("snapshot is zstd compressed, install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().stream_reader(file)
+    raise ValueError(f"unknown snapshot codec {codec}")
+
+
+def read_snapshot(file_path):
+    """read one grabber.py snapshot in either format, returns (json_data, size in bytes on disk)
+
+    The format is detected from the header rather than the extension, compact
+    files are decompressed as they are read, without a copy of the compressed bytes.
+    """
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        header = file.read(COMPACT_HEADER.size)
+        if not header.startswith(COMPACT_MAGIC):
+            return json.loads(header + file.read()), size
+        _, version, codec = COMPACT_HEADER.unpack(header)
+        if version > COMPACT_VERSION:
+            raise ValueError(f"snapshot format version {version} is newer than this reader ({COMPACT_VERSION})")
+        with open_compact_stream(file, codec) as stream:
+            return json.load(stream), size
+
+
+def write_snapshot(file_path, json_data, compact=False, codec=None):
+    """write a snapshot, pretty printed json or the compact format"""
+    if not compact:
+        with open(file_path, 'w') as file:
+            json.dump(json_data, file, indent=4)
+        return
+    codec = codec or default_codec()
+    raw = json.dumps(json_data, separators=(',', ':')).encode('utf-8')
+    with open(file_path, 'wb') as file:
+        file.write(COMPACT_HEADER.pack(COMPACT_MAGIC, COMPACT_VERSION, CODEC_NAMES[codec]))
+        if codec == 'zstd':
+            if zstandard is None:
+                raise ValueError("the zstd codec needs the zstandard package")
+            file.write(zstandard.ZstdCompressor(level=10).compress(raw))
+        else:
+            #no name and mtime=0 in the gzip header keep the output identical for identical snapshots
+            with gzip.GzipFile(filename='', fileobj=file, mode='wb', compresslevel=9, mtime=0) as stream:
+                stream.write(raw)
+
+
+def split_snapshot_filename(filename):
+    """(computer, domain, timestamp text or None) as written in a snapshot filename"""
+    #domains contain dots and the timestamp contains an underscore, so the timestamp is matched at the end
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    match = STAMPED_STEM.fullmatch(stem)
+    if match:
+        head, stamp = match.groups()
+        computer, _, domain = head.partition('_')
+        return computer, domain, stamp
+    parts = stem.split('_')
+    return parts[0], parts[1] if len(parts) > 1 else '', None
+
+
+def parse_snapshot_filename(filename):
+    """split a snapshot filename into (computer, domain, timestamp or None)
+
+    timestamp is None as well when the digits are no valid date (20241399_250000).
+    """
+    computer, domain, stamp = split_snapshot_filename(filename)
+    try:
+        timestamp = datetime.strptime(stamp, TIMESTAMP_FORMAT) if stamp else None
+    except ValueError:
+        timestamp = None
+    return computer, domain, timestamp
@@ -0,0 +1,146 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from snapshot import read_snapshot
+
+#memory the parsed snapshots of one viewer may keep
+DEFAULT_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def approximate_size(json_data):
+    """bytes held by a parsed snapshot, containers and leaves as reported by sys.getsizeof"""
+    total = 0
+    stack = [json_data]
+    while stack:
+        value = stack.pop()
+        total += sys.getsizeof(value)
+        if isinstance(value, dict):
+            for key, item in value.items():
+                total += sys.getsizeof(key)
+                stack.append(item)
+        elif isinstance(value, list):
+            stack.extend(value)
+    return total
+
+
+def file_fetcher(file_path):
+    """fetch function for a snapshot file, its version is (mtime_ns, size), (None, None) once it is deleted"""
+    def fetch(cached_version):
+        try:
+            stat = os.stat(file_path)
+            version = (stat.st_mtime_ns, stat.st_size)
+            if version == cached_version:
+                return version, None
+            json_data, _ = read_snapshot(file_path)
+        except FileNotFoundError:
+            return None, None
+        return version, json_data
+    return fetch
+
+
+class SnapshotCache:
+    """parsed snapshots by name, evicted least recently used once max_bytes is exceeded
+
+    Entries are looked up through a fetch function, fetch(cached_version)
+    returns (current_version, json_data) and may return json_data None when
+    current_version equals cached_version, so a hit costs a stat() or a
+    version query instead of reading and parsing the snapshot again.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES, prefetch_workers=1):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetches = 0
+        self.executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="prefetch")
+
+    def cached_version(self, name):
+        with self.lock:
+            entry = self.entries.get(name)
+            return entry[0] if entry else None
+
+    def fetch(self, name, fetch, count=True):
+        """the current parsed snapshot for name, None if it no longer exists"""
+        cached_version = self.cached_version(name)
+        while True:
+            version, json_data = fetch(cached_version)
+            with self.lock:
+                entry = self.entries.get(name)
+                if json_data is None and version is not None:
+                    if entry is not None and entry[0] == version:
+                        self.entries.move_to_end(name)
+                        if count:
+                            self.hits += 1
+                        return entry[1]
+                    if cached_version is not None:
+                        #a prefetch evicted or replaced the entry after cached_version() was read, load it whole
+                        cached_version = None
+                        continue
+                if count:
+                    self.misses += 1
+                self.discard(name)
+                if json_data is not None:
+                    self.store(name, version, json_data)
+            return json_data
+
+    def store(self, name, version, json_data):
+        size = approximate_size(json_data)
+        if size > self.max_bytes:
+            return
+        self.entries[name] = (version, json_data, size)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+            self.evictions += 1
+
+    def discard(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def prefetch(self, name, fetch):
+        """load name in the background if it is missing or stale, errors are ignored"""
+        def run():
+            try:
+                self.fetch(name, fetch, count=False)
+            except Exception:
+                pass
+        with self.lock:
+            self.prefetches += 1
+        self.executor.submit(run)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'prefetches': self.prefetches,
+            }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"{stats['entries']} snapshots, {stats['bytes'] / 1048576:.1f}/{stats['max_bytes'] / 1048576:.0f} MB, "
+                f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), "
+                f"{stats['evictions']} evicted, {stats['prefetches']} prefetched")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,239 @@
+import sys
+import json
+import argparse
+from datetime import datetime, timedelta
+
+from inventory_config import add_dsn_argument
+from ipconfig_parser import VOLATILE_FIELDS
+
+#list items are matched between snapshots on the first of these fields that has a value, a tuple
+#of fields is one key made of all of them (tunnel adapters share MACs like 00-00-00-00-00-00-00-E0),
+#sections not listed (Motherboard, OperatingSystem, BIOS) are matched by position so an
+#upgrade shows up as changed fields rather than a removal and an addition
+SECTION_KEYS = {
+    'CPU': ('DeviceID', 'Name'),
+    'MemoryModules': ('SerialNumber', 'DeviceLocator', 'BankLabel'),
+    'Printers': ('DeviceID',),
+    'WIADevices': ('DeviceID', 'Name'),
+    'DVD/CD-ROM': ('Id', 'Caption'),
+    'Disks': ('SerialNumber', 'Model'),
+    'NetworkAdapters': (('MACAddress', 'Name'),),
+}
+
+#properties that change on every run and say nothing about the hardware
+IGNORED_FIELDS = {
+    'CurrentClockSpeed', 'LoadPercentage', 'CurrentVoltage', 'FreePhysicalMemory', 'FreeVirtualMemory',
+    'FreeSpaceInPagingFiles', 'LastBootUpTime', 'LocalDateTime', 'NumberOfProcesses', 'NumberOfUsers',
+    'Status', 'PrinterStatus', 'SizeStoredInPagingFiles', 'TotalVisibleMemorySize', 'TotalVirtualMemorySize',
+} | VOLATILE_FIELDS
+
+CHANGE_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS snapshot_change (
+        id BIGSERIAL PRIMARY KEY,
+        machine_id INTEGER NOT NULL REFERENCES machine(id),
+        json_file_id INTEGER NOT NULL REFERENCES json_files(id) ON DELETE CASCADE,
+        previous_json_file_id INTEGER REFERENCES json_files(id) ON DELETE SET NULL,
+        changed_at TIMESTAMP,
+        section TEXT NOT NULL,
+        change_type TEXT NOT NULL,
+        item_key TEXT,
+        detail JSONB
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS snapshot_change_changed_at_idx ON snapshot_change (changed_at)",
+    "CREATE INDEX IF NOT EXISTS snapshot_change_machine_idx ON snapshot_change (machine_id, changed_at)",
+    "CREATE INDEX IF NOT EXISTS snapshot_change_file_idx ON snapshot_change (json_file_id)",
+]
+
+
+def create_change_tables(cursor):
+    for statement in CHANGE_DDL:
+        cursor.execute(statement)
+
+
+def item_key(section, item, position):
+    if not isinstance(item, dict):
+        return str(item)
+    for field in SECTION_KEYS.get(section, ()):
+        if isinstance(field, tuple):
+            values = [item.get(name) for name in field]
+            if any(value not in (None, '') for value in values):
+                return " / ".join('' if value is None else str(value).strip() for value in values)
+            continue
+        value = item.get(field)
+        if value not in (None, ''):
+            return str(value).strip()
+    return f"#{position}"
+
+
+def diff_items(old, new):
+    """{field: [old, new]} for the properties that differ between two items"""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None if old == new else {'value': [old, new]}
+    fields = {}
+    for field in old.keys() | new.keys():
+        if field in IGNORED_FIELDS:
+            continue
+        if old.get(field) != new.get(field):
+            fields[field] = [old.get(field), new.get(field)]
+    return fields or None
+
+
+def diff_section(section, old, new):
+    """yield (change_type, item_key, detail) between two versions of a section"""
+    if not isinstance(old, list) or not isinstance(new, list):
+        #scalar sections and sections that failed to collect (error strings)
+        if old != new:
+            yield 'changed', None, {'value': [old, new]}
+        return
+    old_items = {}
+    for position, item in enumerate(old):
+        old_items.setdefault(item_key(section, item, position), item)
+    new_items = {}
+    for position, item in enumerate(new):
+        new_items.setdefault(item_key(section, item, position), item)
+    for key, item in new_items.items():
+        if key not in old_items:
+            yield 'added', key, item
+        else:
+            fields = diff_items(old_items[key], item)
+            if fields:
+                yield 'changed', key, fields
+    for key, item in old_items.items():
+        if key not in new_items:
+            yield 'removed', key, item
+
+
+def diff_snapshots(old, new, sections=None):
+    """yield (section, change_type, item_key, detail) between two snapshots of one machine
+
+    sections limits the comparison, e.g. to the sections whose hashes differ.
+    """
+    names = sections if sections is not None else sorted(old.keys() | new.keys())
+    for section in names:
+        #metadata such as grabber.py's _collection timings differs on every run
+        if section.startswith('_'):
+            continue
+        for change_type, key, detail in diff_section(section, old.get(section), new.get(section)):
+            yield section, change_type, key, detail
+
+
+def changed_section_names(old_hashes, new_hashes):
+    """sections to diff, None (all of them) unless both snapshots are stored as deltas"""
+    if old_hashes is None or new_hashes is None:
+        return None
+    return sorted(name for name in old_hashes.keys() | new_hashes.keys()
+                  if old_hashes.get(name) != new_hashes.get(name))
+
+
+def record_changes(cursor, filenames):
+    """diff imported snapshots against the previous snapshot of their machine and store the changes
+
+    The snapshot right after each imported one is diffed again as well, so
+    importing an older snapshot late keeps the history consistent.
+    """
+    from psycopg2.extras import Json, execute_values
+    cursor.execute("""
+        SELECT s.json_file_id, n.json_file_id
+        FROM snapshot s JOIN json_files f ON f.id = s.json_file_id
+        LEFT JOIN LATERAL (
+            SELECT json_file_id FROM snapshot n
+            WHERE n.machine_id = s.machine_id AND n.taken_at > s.taken_at
+            ORDER BY n.taken_at LIMIT 1
+        ) n ON true
+        WHERE f.filename = ANY(%s)
+    """, (list(filenames),))
+    file_ids = set()
+    for file_id, next_file_id in cursor.fetchall():
+        file_ids.add(file_id)
+        if next_file_id is not None:
+            file_ids.add(next_file_id)
+    if not file_ids:
+        return 0
+
+    cursor.execute("DELETE FROM snapshot_change WHERE json_file_id = ANY(%s)", (list(file_ids),))
+    cursor.execute("""
+        SELECT s.json_file_id, s.machine_id, s.taken_at, p.json_file_id,
+               cur_file.sections, prev_file.sections, cur.content, prev.content
+        FROM snapshot s
+        JOIN LATERAL (
+            SELECT json_file_id FROM snapshot p
+            WHERE p.machine_id = s.machine_id AND p.taken_at < s.taken_at
+            ORDER BY p.taken_at DESC LIMIT 1
+        ) p ON true
+        JOIN json_files cur_file ON cur_file.id = s.json_file_id
+        JOIN json_files prev_file ON prev_file.id = p.json_file_id
+        JOIN json_snapshots cur ON cur.id = s.json_file_id
+        JOIN json_snapshots prev ON prev.id = p.json_file_id
+        WHERE s.json_file_id = ANY(%s)
+    """, (list(file_ids),))
+    rows = []
+    for file_id, machine_id, taken_at, prev_id, sections, prev_sections, content, prev_content in cursor.fetchall():
+        names = changed_section_names(prev_sections, sections)
+        for section, change_type, key, detail in diff_snapshots(prev_content, content, names):
+            rows.append((machine_id, file_id, prev_id, taken_at, section, change_type, key, Json(detail)))
+    if rows:
+        execute_values(cursor, """
+            INSERT INTO snapshot_change (machine_id, json_file_id, previous_json_file_id, changed_at,
+                                         section, change_type, item_key, detail) VALUES %s
+        """, rows)
+    return len(rows)
+
+
+def changes_since(cursor, since):
+    """every recorded hardware change after since, newest first"""
+    cursor.execute("""
+        SELECT m.computer_name, m.domain_name, c.changed_at, c.section, c.change_type, c.item_key, c.detail
+        FROM snapshot_change c JOIN machine m ON m.id = c.machine_id
+        WHERE c.changed_at >= %s
+        ORDER BY c.changed_at DESC, m.computer_name, c.section
+    """, (since,))
+    return cursor.fetchall()
+
+
+def backfill(conn, batch_size=500, progress_callback=None):
+    """compute the change history for every snapshot already in the database"""
+    with conn.cursor() as cursor:
+        create_change_tables(cursor)
+        cursor.execute("SELECT f.filename FROM json_files f JOIN snapshot s ON s.json_file_id = f.id")
+        filenames = [row[0] for row in cursor.fetchall()]
+    conn.commit()
+    done = 0
+    for start in range(0, len(filenames), batch_size):
+        with conn.cursor() as cursor:
+            record_changes(cursor, filenames[start:start + batch_size])
+        conn.commit()
+        done += len(filenames[start:start + batch_size])
+        if progress_callback:
+            progress_callback(done)
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hardware changes between snapshots of the same machine")
+    parser.add_argument("command", choices=["changes", "backfill"])
+    add_dsn_argument(parser)
+    parser.add_argument("--days", type=int, default=7, help="how far back to list changes")
+    args = parser.parse_args(argv)
+
+    #imported here so delta_store and the tests can use the diffing without psycopg2
+    from db import connect
+    conn = connect(args.dsn)
+    try:
+        if args.command == "backfill":
+            done = backfill(conn, progress_callback=lambda n: print(f"Diffed {n} snapshots", flush=True))
+            print(f"Backfill finished, {done} snapshots")
+        else:
+            with conn.cursor() as cursor:
+                for name, domain, changed_at, section, change_type, key, detail in changes_since(
+                        cursor, datetime.now() - timedelta(days=args.days)):
+                    print(f"{changed_at:%Y-%m-%d %H:%M} {name}.{domain} {section} {change_type} "
+                          f"{key or ''} {json.dumps(detail, default=str)}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+from snapshot import is_snapshot_file
+
+
+def default_spool_dir():
+    """%ProgramData%\\inventory\\spool, or the temp directory where there is no ProgramData
+
+    Never next to the script: grabber.py usually runs from the share or
+    NETLOGON, which is exactly what the spool has to outlast.
+    """
+    program_data = os.environ.get("ProgramData")
+    if program_data:
+        return os.path.join(program_data, "inventory", "spool")
+    return os.path.join(tempfile.gettempdir(), "inventory-spool")
+
+
+#snapshots wait here until they reached the share, survives reboots and failed runs
+DEFAULT_SPOOL_DIR = os.environ.get("GRABBER_SPOOL") or default_spool_dir()
+#suffix of the file on the share while it is being written, renamed once complete
+PARTIAL_SUFFIX = ".partial"
+COPY_CHUNK_SIZE = 64 * 1024
+
+
+class UploadFailed(Exception):
+    pass
+
+
+class Throttle:
+    """token bucket limiting the bytes per second of a copy, None means unlimited"""
+
+    def __init__(self, bytes_per_second=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = bytes_per_second
+        self.clock = clock
+        self.sleep = sleep
+        self.allowance = 0.0
+        self.last = clock()
+
+    def wait(self, size):
+        if not self.rate:
+            return
+        now = self.clock()
+        #at most one second of burst
+        self.allowance = min(self.rate, self.allowance + (now - self.last) * self.rate) - size
+        self.last = now
+        if self.allowance < 0:
+            self.sleep(-self.allowance / self.rate)
+
+
+class Spool:
+    """local directory of snapshots waiting to be uploaded, oldest first"""
+
+    def __init__(self, directory=DEFAULT_SPOOL_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def add(self, file_path):
+        """move a finished snapshot into the spool, returns its spooled path"""
+        target = os.path.join(self.directory, os.path.basename(file_path))
+        shutil.move(file_path, target)
+        return target
+
+    def pending(self):
+        #filenames end in the collection timestamp, so one machine's spool sorts oldest first
+        return [os.path.join(self.directory, name) for name in sorted(os.listdir(self.directory))
+                if is_snapshot_file(name)]
+
+
+class Uploader:
+    """forwards spooled snapshots to the share
+
+    Each file is copied under a temporary name and renamed into place, so the
+    importer never sees half a snapshot. Failures are retried with exponential
+    backoff. A file is removed from the spool only after its rename succeeded,
+    anything left over is sent on the next run.
+    """
+
+    def __init__(self, spool, destination, batch_size=20, max_attempts=5, base_delay=2.0, max_delay=300.0,
+                 bytes_per_second=None, sleep=time.sleep):
+        self.spool = spool
+        self.destination = destination
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.bytes_per_second = bytes_per_second
+        self.sleep = sleep
+
+    def backoff(self, attempt):
+        """seconds to wait before retry number attempt (1-based), with jitter"""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def upload_file(self, file_path, throttle):
+        name = os.path.basename(file_path)
+        partial = os.path.join(self.destination, name + PARTIAL_SUFFIX)
+        try:
+            with open(file_path, "rb") as source, open(partial, "wb") as target:
+                while True:
+                    chunk = source.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    throttle.wait(len(chunk))
+                    target.write(chunk)
+                target.flush()
+                os.fsync(target.fileno())
+            os.replace(partial, os.path.join(self.destination, name))
+        except BaseException:
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            raise
+
+    def upload_batch(self, batch):
+        """send a batch after one reachability check of the share, raises UploadFailed on the first error"""
+        if not os.path.isdir(self.destination):
+            raise UploadFailed(f"destination {self.destination} is not reachable")
+        throttle = Throttle(self.bytes_per_second, sleep=self.sleep)
+        for file_path in batch:
+            try:
+                self.upload_file(file_path, throttle)
+            except OSError as e:
+                raise UploadFailed(f"{os.path.basename(file_path)}: {e}") from e
+            os.remove(file_path)
+            print(f"File copied to {self.destination}: {os.path.basename(file_path)}")
+
+    def flush(self):
+        """upload every spooled snapshot, returns the number still waiting afterwards"""
+        pending = self.spool.pending()
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            for attempt in range(1, self.max_attempts + 1):
+                try:
+                    self.upload_batch([path for path in batch if os.path.exists(path)])
+                    break
+                except UploadFailed as e:
+                    if attempt == self.max_attempts:
+                        print(f"Upload failed after {attempt} attempts, keeping files in {self.spool.directory}: {e}")
+                        return len(self.spool.pending())
+                    delay = self.backoff(attempt)
+                    print(f"Upload attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+                    self.sleep(delay)
+        return len(self.spool.pending())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload snapshots waiting in the spool directory")
+    parser.add_argument("destination", help="share or directory the importer reads from")
+    parser.add_argument("--spool", default=DEFAULT_SPOOL_DIR,
+                        help="spool directory (default: $GRABBER_SPOOL, then %%ProgramData%%\\inventory\\spool)")
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--attempts", type=int, default=5)
+    parser.add_argument("--limit-kbps", type=int, help="bandwidth limit in KiB/s")
+    args = parser.parse_args(argv)
+
+    uploader = Uploader(Spool(args.spool), args.destination, batch_size=args.batch_size, max_attempts=args.attempts,
+                        bytes_per_second=args.limit_kbps * 1024 if args.limit_kbps else None)
+    remaining = uploader.flush()
+    return 1 if remaining else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import pytest
+
+from content_search import Term, jsonpath_number, parse_query, term_jsonpath
+
+
+@pytest.mark.parametrize("text, expected", [("2666", "2666"), ("-3", "-3"), ("1.5", "1.5"), ("0", "0"),
+                                            ("0012345", None), ("01.5", None), ("1.50", None), ("-0", None),
+                                            ("1e5", None), ("S3Z", None), ("١٢", None)])
+def test_jsonpath_number(text, expected):
+    assert jsonpath_number(text) == expected
+
+
+def test_exact_term_compares_canonical_numbers_as_numbers():
+    assert term_jsonpath(Term('Memory', 'Speed', '=', "2666")) == \
+        '$."Memory"[*]."Speed" ? (@ == "2666" || @ == 2666)'
+
+
+@pytest.mark.parametrize("value", ["0012345", "01.5"])
+def test_exact_term_with_leading_zeros_stays_a_string(value):
+    assert term_jsonpath(Term('Disks', 'SerialNumber', '=', value)) == \
+        f'$."Disks"[*]."SerialNumber" ? (@ == "{value}")'
+
+
+def test_word_terms_compare_digits_as_numbers_only_when_canonical():
+    path = term_jsonpath(parse_query('"Disks.SerialNumber:007 2666"')[0])
+    assert '@ == 007' not in path
+    assert '@ == 2666' in path
@@ -0,0 +1,40 @@
+import json
+
+from delta_store import hash_sections, stable_section
+
+
+def snapshot(seconds, lease, load=5):
+    return {
+        'CPU': [{'Name': "CPU0", 'LoadPercentage': load}],
+        'NetworkAdapters': [{'MACAddress': "3C-52-82-1A-2B-3C", 'IPv4': "10.0.1.25", 'LeaseObtained': lease}],
+        '_collection': {'Seconds': seconds, 'Collectors': {'CPU': {'Seconds': seconds, 'Status': 'ok'}}},
+    }
+
+
+def test_metadata_sections_are_kept_but_not_hashed():
+    sections, unhashed = hash_sections(snapshot(1.5, "Monday"))
+    assert set(sections) == {'CPU', 'NetworkAdapters'}
+    assert json.loads(unhashed)['_collection'] == snapshot(1.5, "Monday")['_collection']
+
+
+def test_timings_leases_and_load_do_not_change_the_hashes():
+    first, first_unhashed = hash_sections(snapshot(1.5, "Monday", load=5))
+    second, second_unhashed = hash_sections(snapshot(9.0, "Tuesday", load=80))
+    assert first == second
+    assert first_unhashed != second_unhashed
+
+
+def test_ignored_fields_are_kept_per_item():
+    section = [{'Name': "CPU0", 'LoadPercentage': 5}, {'Name': "CPU1"}, "not an item"]
+    stable, fields = stable_section(section)
+    assert stable == [{'Name': "CPU0"}, {'Name': "CPU1"}, "not an item"]
+    assert fields == [{'LoadPercentage': 5}, {}, {}]
+    #putting the fields back gives the section as it was read
+    assert [dict(item, **extra) if isinstance(item, dict) else item
+            for item, extra in zip(stable, fields)] == section
+
+
+def test_sections_without_ignored_fields_have_none_kept_aside():
+    assert stable_section([{'Name': "CPU0"}]) == ([{'Name': "CPU0"}], None)
+    assert stable_section("Error retrieving CPU") == ("Error retrieving CPU", None)
+    assert hash_sections({'CPU': [{'Name': "CPU0"}]})[1] is None
@@ -0,0 +1,132 @@
+import os
+import threading
+
+import pytest
+
+import grabber
+import ipconfig_parser
+from grabber import Backends, collect, run_collectors, snapshot_filename
+
+
+class FakeWMIObject:
+    def __init__(self, **properties):
+        self.__dict__.update(properties)
+        self.properties = list(properties)
+
+
+class FakeWMI:
+    """wmi.WMI() stand-in: every attribute is a class returning its instances, records the queried props"""
+
+    def __init__(self, instances):
+        self.instances = instances
+        self.queries = []
+
+    def __getattr__(self, class_name):
+        def query(props=None):
+            self.queries.append((class_name, props))
+            return self.instances.get(class_name, [])
+        return query
+
+
+class FakeWIA:
+    DeviceInfos = []
+
+
+def fake_backends(tmp_path, instances=None, commands=None):
+    wmi = FakeWMI(instances or {
+        'Win32_ComputerSystem': [FakeWMIObject(Name="PC1", Domain="corp.example.com")],
+        'Win32_Processor': [FakeWMIObject(Name="CPU0", SocketDesignation="U3E1")],
+        'Win32_Printer': [FakeWMIObject(DeviceID="P1", DriverName="Driver", Local=True, Network=False,
+                                        PortName="USB001", PrinterStatus=3)],
+    })
+    with open(os.path.join(ipconfig_parser.FIXTURE_DIR, "en-us.txt"), "rb") as file:
+        ipconfig = file.read()
+    commands = commands or {'ipconfig /all': ipconfig, 'wmic csproduct get UUID': b"UUID  \r\n1234-5678  \r\n"}
+    os.mkdir(tmp_path / "alice")
+    os.mkdir(tmp_path / "bob")
+    (tmp_path / "desktop.ini").write_text("")
+    backends = Backends(wmi_factory=lambda: wmi, com_dispatch=lambda name: FakeWIA(),
+                        run_command=commands.__getitem__, users_directory=str(tmp_path))
+    return backends, wmi
+
+
+def test_collect_with_fake_backends(tmp_path):
+    backends, wmi = fake_backends(tmp_path)
+    snapshot = collect(backends)
+
+    assert list(snapshot) == list(grabber.COLLECTORS) + ['_collection']
+    #projected properties the fake does not have are read as None
+    assert list(snapshot['CPU'][0]) == grabber.PROJECTIONS['Win32_Processor']
+    assert snapshot['CPU'][0]['Name'] == "CPU0"
+    assert snapshot['Printers'][0]['PrinterStatus'] == 'Online'
+    assert snapshot['WIADevices'] == "No WIA devices found"
+    assert snapshot['NetworkAdapters'][0]['IPv4'] == "10.0.1.25"
+    assert snapshot['WindowsSID'] == "1234-5678"
+    assert sorted(snapshot['LoggedInUsersHistory']) == ["alice", "bob"]
+    assert ('Win32_Processor', grabber.PROJECTIONS['Win32_Processor']) in wmi.queries
+    timings = snapshot['_collection']['Collectors']
+    assert list(timings) == list(grabber.COLLECTORS)
+    assert {timing['Status'] for timing in timings.values()} == {'ok'}
+
+
+def test_full_collects_every_property(tmp_path):
+    backends, wmi = fake_backends(tmp_path)
+    backends.full = True
+    backends.instances('Win32_Processor')
+    assert wmi.queries == [('Win32_Processor', None)]
+
+
+def test_failing_collector_becomes_an_error_section(tmp_path):
+    backends, _ = fake_backends(tmp_path)
+
+    def broken(backends):
+        raise RuntimeError("access denied")
+
+    sections, timings = run_collectors(backends, {'Good': (lambda b: [1], 5), 'Broken': (broken, 5)})
+    assert sections == {'Good': [1], 'Broken': "Error retrieving Broken: access denied"}
+    assert timings['Good']['Status'] == 'ok'
+    assert timings['Broken']['Status'] == 'error'
+
+
+def test_collector_past_its_timeout_is_not_waited_for(tmp_path):
+    backends, _ = fake_backends(tmp_path)
+    release = threading.Event()
+
+    def stuck(backends):
+        release.wait(10)
+        return "too late"
+
+    try:
+        sections, timings = run_collectors(backends, {'Stuck': (stuck, 0.1), 'Fast': (lambda b: "done", 5)})
+    finally:
+        release.set()
+    assert sections == {'Stuck': "Error retrieving Stuck: timed out after 0.1s", 'Fast': "done"}
+    assert timings['Stuck']['Status'] == 'timeout'
+    assert timings['Stuck']['Seconds'] < 5
+    #sections stay in registration order whichever finishes first
+    assert list(sections) == ['Stuck', 'Fast']
+
+
+def test_wmi_connection_per_thread():
+    created = []
+
+    def factory():
+        created.append(threading.get_ident())
+        return FakeWMI({})
+
+    backends = Backends(wmi_factory=factory)
+    backends.wmi()
+    backends.wmi()
+    thread = threading.Thread(target=backends.wmi)
+    thread.start()
+    thread.join()
+    assert len(created) == 2
+
+
+@pytest.mark.parametrize("domain, expected", [("corp.example.com", "PC1_corp.example.com_"),
+                                              ("", "PC1_Workgroup_")])
+def test_snapshot_filename(tmp_path, domain, expected):
+    backends, _ = fake_backends(tmp_path, instances={
+        'Win32_ComputerSystem': [FakeWMIObject(Name="PC1", Domain=domain)]})
+    filename = snapshot_filename(backends, '.hwinv')
+    assert filename.startswith(expected) and filename.endswith('.hwinv')
@@ -0,0 +1,107 @@
+import asyncio
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import ingest_daemon
+from ingest_daemon import IngestDaemon
+
+
+def make_daemon(tmp_path, refuse=(), down=0):
+    """a daemon whose write refuses the files in refuse and fails to connect down times"""
+    daemon = IngestDaemon(str(tmp_path / "drop"), str(tmp_path / "archive"), str(tmp_path / "rejected"))
+    daemon.stopping = asyncio.Event()
+    daemon.written = []
+    daemon.rejected = []
+    failures = {'down': down}
+
+    async def call_db(func, *args):
+        return func(*args)
+
+    def write(part):
+        if failures['down']:
+            failures['down'] -= 1
+            raise psycopg2.OperationalError("server closed the connection")
+        bad = [path for path, _ in part if path in refuse]
+        if bad:
+            raise psycopg2.DataError(f"invalid input in {bad[0]}")
+        daemon.written.extend(path for path, _ in part)
+        return [0.0] * len(part)
+
+    daemon.call_db = call_db
+    daemon.write = write
+    daemon.reject = lambda path, error: daemon.rejected.append(path)
+    return daemon
+
+
+def batch(count):
+    return [(f"file{index}", (f"file{index}", "{}", [])) for index in range(count)]
+
+
+def test_refused_file_is_found_by_halving(tmp_path):
+    daemon = make_daemon(tmp_path, refuse={"file5"})
+    asyncio.run(daemon.write_with_retry(batch(8)))
+    assert daemon.rejected == ["file5"]
+    assert sorted(daemon.written) == sorted(f"file{index}" for index in range(8) if index != 5)
+    assert daemon.stats.imported == 7
+    assert not daemon.failed
+
+
+def test_single_refused_file_is_rejected(tmp_path):
+    daemon = make_daemon(tmp_path, refuse={"file0"})
+    asyncio.run(daemon.write_with_retry(batch(1)))
+    assert daemon.rejected == ["file0"]
+    assert not daemon.failed
+
+
+def test_whole_batch_refused_stops_the_daemon(tmp_path):
+    daemon = make_daemon(tmp_path, refuse={f"file{index}" for index in range(4)})
+    asyncio.run(daemon.write_with_retry(batch(4)))
+    assert daemon.rejected == []
+    assert daemon.failed.startswith("all 4 snapshots of a batch were refused")
+    assert daemon.stopping.is_set()
+
+
+def test_lost_connection_is_retried(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_daemon, "MAX_RETRY_DELAY", 0)
+    daemon = make_daemon(tmp_path, down=2)
+    asyncio.run(daemon.write_with_retry(batch(3)))
+    assert daemon.written == ["file0", "file1", "file2"]
+    assert daemon.stats.db_errors == 2
+    assert daemon.rejected == []
+
+
+class BrokenPool(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("a worker was killed"))
+        return future
+
+
+def test_broken_parse_pool_is_replaced_and_the_file_rescanned(tmp_path):
+    daemon = make_daemon(tmp_path)
+    broken = BrokenPool()
+    daemon.parse_pool = broken
+
+    async def parse_one():
+        daemon.paths = asyncio.Queue()
+        daemon.parsed = asyncio.Queue()
+        daemon.in_flight.add("file0")
+        await daemon.paths.put("file0")
+        parser = asyncio.create_task(daemon.parse_loop())
+        await asyncio.wait_for(daemon.paths.join(), 5)
+        parser.cancel()
+        await asyncio.gather(parser, return_exceptions=True)
+
+    try:
+        asyncio.run(parse_one())
+        assert "file0" not in daemon.in_flight
+        assert daemon.parsed.empty()
+        assert daemon.parse_pool is not broken
+        assert "a worker was killed" in daemon.stats.last_error
+    finally:
+        if daemon.parse_pool is not broken:
+            daemon.parse_pool.shutdown()
@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+pytest.importorskip("openpyxl")
+
+import inventory_cli
+
+
+def test_unknown_report_format_is_a_usage_error(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        inventory_cli.main(["minimal-report", str(tmp_path / "report.foo"), "--dir", str(tmp_path)])
+    assert exit.value.code == 2
+    assert "unknown report format 'foo'" in capsys.readouterr().err
+
+
+def test_failing_run_is_not_a_usage_error(tmp_path, monkeypatch):
+    def corrupt(args):
+        raise json.JSONDecodeError("Expecting value", "{", 1)
+
+    monkeypatch.setattr(inventory_cli, "open_catalog", corrupt)
+    with pytest.raises(json.JSONDecodeError):
+        inventory_cli.main(["minimal-report", str(tmp_path / "report.csv"), "--dir", str(tmp_path)])
@@ -0,0 +1,75 @@
+import os
+import json
+
+import pytest
+
+import ipconfig_parser
+from ipconfig_parser import golden_path, parse, read_output
+
+FIXTURES = ipconfig_parser.fixture_paths()
+
+
+def fixture(name):
+    return os.path.join(ipconfig_parser.FIXTURE_DIR, name)
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_fixture_matches_golden(path):
+    with open(golden_path(path), encoding="utf-8") as file:
+        expected = json.load(file)
+    assert parse(read_output(path)) == expected
+
+
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_fixture_labels_are_known(path):
+    #a label missing from FIELDS lands under Other, which means the locale is not fully supported
+    result = parse(read_output(path))
+    assert 'Other' not in result['Host']
+    for adapter in result['Adapters']:
+        assert 'Other' not in adapter, adapter['Name']
+        assert adapter['Kind'] != 'Other', adapter['Name']
+
+
+def test_multiple_addresses_keep_their_order():
+    ethernet = parse(read_output(fixture("en-us.txt")))['Adapters'][0]
+    assert ethernet['IPv4Addresses'] == ["10.0.1.25", "10.0.1.26"]
+    assert ethernet['SubnetMasks'] == ["255.255.255.0", "255.255.0.0"]
+    assert ethernet['DNSServers'] == ["2001:db8:10::53", "10.0.0.10", "10.0.0.11"]
+    assert ethernet['IPv4'] == "10.0.1.25"
+    #the IPv4 gateway is the legacy DefaultGateway even when the IPv6 one comes first
+    assert ethernet['DefaultGateways'] == ["fe80::1%12", "10.0.1.1"]
+    assert ethernet['DefaultGateway'] == "10.0.1.1"
+
+
+def test_ipv6_values_keep_their_colons():
+    ethernet = parse(read_output(fixture("en-us.txt")))['Adapters'][0]
+    assert ethernet['IPv6Addresses'] == ["2001:db8:10:1::25"]
+    assert ethernet['LinkLocalIPv6Addresses'] == ["fe80::1c2d:3e4f:5a6b:7c8d%12"]
+    assert ethernet['IPv6'] == "2001:db8:10:1::25"
+
+
+def test_tunnel_adapters():
+    adapters = parse(read_output(fixture("en-us.txt")))['Adapters']
+    tunnels = [adapter for adapter in adapters if adapter['Kind'] == 'Tunnel']
+    assert [tunnel['Connection'] for tunnel in tunnels] == ["Teredo Tunneling Pseudo-Interface",
+                                                            "isatap.corp.example.com"]
+    #tunnels share their physical address, snapshot_diff.py tells them apart by Name
+    assert {tunnel['MACAddress'] for tunnel in tunnels} == {"00-00-00-00-00-00-00-E0"}
+    teredo, isatap = tunnels
+    assert teredo['IPv6Addresses'] == ["2001:0:2851:782c:1c2d:3e4f:f5ff:fee6"]
+    assert 'DefaultGateways' not in teredo
+    assert isatap['MediaState'] == "Media disconnected"
+    assert 'IPv6' not in isatap
+
+
+def test_continuation_lines_extend_lists():
+    host = parse(read_output(fixture("en-us.txt")))['Host']
+    assert host['DNSSuffixSearchList'] == ["corp.example.com", "example.com"]
+
+
+def test_utf8_output_is_decoded_as_utf8():
+    text = "Windows IP Configuration\r\n\r\n   Host Name . . . . : PC1\r\n\r\nScheda Ethernet Ethernet:\r\n\r\n" \
+           "   DHCP abilitato. . . : Sì\r\n"
+    result = parse(ipconfig_parser.decode_output(text.encode("utf-8"), encoding="cp850"))
+    assert result['Adapters'][0]['DHCPEnabled'] is True
+
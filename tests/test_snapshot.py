@@ -0,0 +1,64 @@
+import gzip
+from datetime import datetime
+
+import pytest
+
+import snapshot
+from snapshot import (COMPACT_EXTENSION, COMPACT_MAGIC, is_snapshot_file, parse_snapshot_filename, read_snapshot,
+                      write_snapshot)
+
+DATA = {
+    'CPU': [{'Name': "Intel(R) Core(TM) i5-8500 CPU @ 3.00GHz", 'NumberOfCores': 6}],
+    'WindowsSID': "1234-5678",
+    'LoggedInUsersHistory': ["alice", "bob"],
+    'Notes': "ünïcödé",
+}
+COMPACT_NAME = "PC1_corp.example.com_20240315_081500" + COMPACT_EXTENSION
+
+
+def test_plain_round_trip(tmp_path):
+    path = tmp_path / "PC1_corp.example.com_20240315_081500.json"
+    write_snapshot(str(path), DATA)
+    assert path.read_bytes().startswith(b"{")
+    assert read_snapshot(str(path)) == (DATA, path.stat().st_size)
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compact_round_trip(tmp_path, codec):
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    path = tmp_path / COMPACT_NAME
+    write_snapshot(str(path), DATA, compact=True, codec=codec)
+    assert path.read_bytes().startswith(COMPACT_MAGIC)
+    assert read_snapshot(str(path)) == (DATA, path.stat().st_size)
+
+
+def test_compact_files_are_identical_for_identical_snapshots(tmp_path):
+    first, second = tmp_path / "first.hwinv", tmp_path / "second.hwinv"
+    write_snapshot(str(first), DATA, compact=True, codec="gzip")
+    write_snapshot(str(second), DATA, compact=True, codec="gzip")
+    assert first.read_bytes() == second.read_bytes()
+
+
+def test_newer_compact_version_is_refused(tmp_path):
+    path = tmp_path / COMPACT_NAME
+    header = snapshot.COMPACT_HEADER.pack(COMPACT_MAGIC, snapshot.COMPACT_VERSION + 1, snapshot.CODEC_GZIP)
+    path.write_bytes(header + gzip.compress(b"{}"))
+    with pytest.raises(ValueError, match="newer than this reader"):
+        read_snapshot(str(path))
+
+
+@pytest.mark.parametrize("name", [COMPACT_NAME, COMPACT_NAME.upper(), "PC1_corp_20240315_081500.json"])
+def test_snapshot_names(name):
+    assert is_snapshot_file(name)
+
+
+@pytest.mark.parametrize("name", ["PC1_corp_20240315_081500.hwinv.partial", "PC1.error", "status.txt"])
+def test_other_names(name):
+    assert not is_snapshot_file(name)
+
+
+def test_compact_names_parse_like_plain_ones():
+    expected = ("PC1", "corp.example.com", datetime(2024, 3, 15, 8, 15))
+    assert parse_snapshot_filename(COMPACT_NAME) == expected
+    assert parse_snapshot_filename(COMPACT_NAME.replace(COMPACT_EXTENSION, ".json")) == expected
@@ -0,0 +1,115 @@
+import os
+
+from snapshot import write_snapshot
+from snapshot_cache import SnapshotCache, approximate_size, file_fetcher
+
+
+class FakeSource:
+    """snapshots by name with a version each, counts the snapshots it had to read"""
+
+    def __init__(self, **snapshots):
+        self.snapshots = {name: (1, data) for name, data in snapshots.items()}
+        self.reads = []
+
+    def change(self, name, data):
+        version, _ = self.snapshots[name]
+        self.snapshots[name] = (version + 1, data)
+
+    def fetcher(self, name):
+        def fetch(cached_version):
+            if name not in self.snapshots:
+                return None, None
+            version, data = self.snapshots[name]
+            if version == cached_version:
+                return version, None
+            self.reads.append(name)
+            return version, data
+        return fetch
+
+
+def snapshot(tag):
+    return {'Tag': tag, 'Padding': "x" * 1000}
+
+
+def lookup(cache, source, name):
+    return cache.fetch(name, source.fetcher(name))
+
+
+def test_hit_does_not_read_again():
+    source = FakeSource(a=snapshot("a"))
+    cache = SnapshotCache()
+    assert lookup(cache, source, "a") == snapshot("a")
+    assert lookup(cache, source, "a") == snapshot("a")
+    assert source.reads == ["a"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_new_version_replaces_the_entry():
+    source = FakeSource(a=snapshot("a"))
+    cache = SnapshotCache()
+    lookup(cache, source, "a")
+    source.change("a", snapshot("a2"))
+    assert lookup(cache, source, "a") == snapshot("a2")
+    assert source.reads == ["a", "a"]
+    assert cache.total_bytes == approximate_size(snapshot("a2"))
+
+
+def test_deleted_snapshot_is_dropped():
+    source = FakeSource(a=snapshot("a"))
+    cache = SnapshotCache()
+    lookup(cache, source, "a")
+    del source.snapshots["a"]
+    assert lookup(cache, source, "a") is None
+    assert cache.stats()['entries'] == 0
+    assert cache.total_bytes == 0
+
+
+def test_least_recently_used_is_evicted_past_max_bytes():
+    source = FakeSource(a=snapshot("a"), b=snapshot("b"), c=snapshot("c"))
+    cache = SnapshotCache(max_bytes=2 * approximate_size(snapshot("a")))
+    lookup(cache, source, "a")
+    lookup(cache, source, "b")
+    #a is used again, so b is the least recently used when c comes in
+    lookup(cache, source, "a")
+    lookup(cache, source, "c")
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.evictions == 1
+    assert cache.total_bytes <= cache.max_bytes
+    lookup(cache, source, "b")
+    assert source.reads == ["a", "b", "c", "b"]
+
+
+def test_snapshot_larger_than_the_cache_is_not_kept():
+    source = FakeSource(a=snapshot("a"))
+    cache = SnapshotCache(max_bytes=100)
+    assert lookup(cache, source, "a") == snapshot("a")
+    assert cache.stats()['entries'] == 0
+
+
+def test_prefetched_snapshot_is_a_hit():
+    source = FakeSource(a=snapshot("a"))
+    cache = SnapshotCache()
+    cache.prefetch("a", source.fetcher("a"))
+    cache.executor.shutdown(wait=True)
+    assert lookup(cache, source, "a") == snapshot("a")
+    assert (cache.hits, cache.misses, cache.prefetches) == (1, 0, 1)
+
+
+def test_file_fetcher_rereads_when_the_mtime_changes(tmp_path):
+    path = str(tmp_path / "PC1_corp_20240101_080000.json")
+    write_snapshot(path, snapshot("a"))
+    cache = SnapshotCache()
+    assert cache.fetch("PC1", file_fetcher(path)) == snapshot("a")
+
+    #same size, so only the modification time tells the versions apart
+    write_snapshot(path, snapshot("b"))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.fetch("PC1", file_fetcher(path)) == snapshot("b")
+    assert cache.misses == 2
+
+    assert cache.fetch("PC1", file_fetcher(path)) == snapshot("b")
+    assert cache.hits == 1
+
+    os.remove(path)
+    assert cache.fetch("PC1", file_fetcher(path)) is None
@@ -0,0 +1,53 @@
+import os
+
+from spool import PARTIAL_SUFFIX, Spool, Uploader
+
+
+def spooled(tmp_path, *names):
+    """a spool holding a snapshot per name, the file content is its name"""
+    spool = Spool(str(tmp_path / "spool"))
+    for name in names:
+        path = tmp_path / name
+        path.write_text(name)
+        spool.add(str(path))
+    return spool
+
+
+def test_flush_uploads_every_spooled_snapshot(tmp_path):
+    names = ["PC1_corp_20240101_080000.json", "PC1_corp_20240102_080000.hwinv"]
+    spool = spooled(tmp_path, *names)
+    (tmp_path / "spool" / "notes.txt").write_text("not a snapshot")
+    share = tmp_path / "share"
+    share.mkdir()
+
+    assert Uploader(spool, str(share), batch_size=1).flush() == 0
+    assert sorted(os.listdir(share)) == names
+    assert all((share / name).read_text() == name for name in names)
+    assert spool.pending() == []
+    assert not any(name.endswith(PARTIAL_SUFFIX) for name in os.listdir(share))
+
+
+def test_unreachable_share_leaves_files_spooled(tmp_path):
+    spool = spooled(tmp_path, "PC1_corp_20240101_080000.json")
+    sleeps = []
+
+    uploader = Uploader(spool, str(tmp_path / "share"), max_attempts=3, sleep=sleeps.append)
+    assert uploader.flush() == 1
+    assert len(sleeps) == 2
+    assert [os.path.basename(path) for path in spool.pending()] == ["PC1_corp_20240101_080000.json"]
+
+    #the next run gets through once the share is back
+    (tmp_path / "share").mkdir()
+    assert uploader.flush() == 0
+
+
+def test_file_already_on_the_share_is_replaced(tmp_path):
+    name = "PC1_corp_20240101_080000.json"
+    spool = spooled(tmp_path, name)
+    share = tmp_path / "share"
+    share.mkdir()
+    (share / name).write_text("an earlier, interrupted upload")
+
+    assert Uploader(spool, str(share)).flush() == 0
+    assert (share / name).read_text() == name
+    assert spool.pending() == []
@@ -0,0 +1,55 @@
+import pytest
+
+from xlsx_stream import StreamingSheet, sheet_cells
+
+
+class FakeWorkbook:
+    """write-only workbook stand-in, sheets are lists of appended rows by title"""
+
+    def __init__(self):
+        self.sheets = {}
+
+    def create_sheet(self, title):
+        rows = self.sheets[title] = []
+        return type("Sheet", (), {'append': staticmethod(rows.append)})()
+
+
+def test_rows_roll_over_to_new_sheets():
+    workbook = FakeWorkbook()
+    sheet = StreamingSheet(workbook, "Data", max_rows=2)
+    for value in range(5):
+        sheet.append([value])
+    sheet.close()
+    assert workbook.sheets == {'Data': [[0], [1]], 'Data 2': [[2], [3]], 'Data 3': [[4]]}
+
+
+def test_header_starts_every_sheet():
+    workbook = FakeWorkbook()
+    sheet = StreamingSheet(workbook, "Sheet1", max_rows=3, header=["Name", "Size"])
+    for value in range(5):
+        sheet.append([f"disk{value}", value])
+    sheet.close()
+    assert workbook.sheets == {
+        'Sheet1': [["Name", "Size"], ["disk0", 0], ["disk1", 1]],
+        'Sheet1 2': [["Name", "Size"], ["disk2", 2], ["disk3", 3]],
+        'Sheet1 3': [["Name", "Size"], ["disk4", 4]],
+    }
+
+
+def test_skipped_rows_and_cells_are_padded():
+    workbook = FakeWorkbook()
+    sheet = StreamingSheet(workbook, "Data")
+    sheet.cell(row=1, column=2, value="b")
+    sheet.cell(row=1, column=1, value="a")
+    sheet.cell(row=3, column=3, value="c")
+    with pytest.raises(ValueError):
+        sheet.cell(row=2, column=1, value="late")
+    sheet.close()
+    assert workbook.sheets['Data'] == [["a", "b"], [], [None, None, "c"]]
+
+
+def test_sheet_cells_layout():
+    cells, last_row = sheet_cells({'CPU': [{'Name': "CPU0"}], 'WindowsSID': "1234"})
+    assert cells == [(1, 1, 'CPU'), (2, 2, 'Item 0'), (3, 3, 'Name'), (4, 4, "CPU0"),
+                     (4, 1, 'WindowsSID'), (5, 2, "1234")]
+    assert last_row == 5
@@ -1,28 +1,45 @@
-import os
-import json
 import tkinter as tk
+from itertools import islice
 from tkinter import ttk, filedialog, messagebox, simpledialog
-from openpyxl import Workbook
-import pandas as pd
 import psycopg2
-from psycopg2.extras import Json
 import bcrypt
 
+import importer
+import exports
+import instrument
+from flatten import flatten, label
+from inventory_schema import create_inventory_tables
+from file_search import FileSearch, create_search_indexes
+from jobs import JobRunner
+from db import Database
+from delta_store import create_delta_tables
+from snapshot_diff import create_change_tables
+from snapshot_cache import SnapshotCache
+from content_search import create_content_search
+from report_rows import create_report_rows
+
+#wait this long after the last keystroke before searching
+SEARCH_DELAY_MS = 250
+
+#database and export jobs that may run at the same time
+JOB_WORKERS = 4
+
+#max sibling items inserted at once, the rest are behind a "show more" item
+TREE_CHUNK_SIZE = 200
+
+#rows the file list keeps, pages scrolled further out of view are dropped and fetched again
+#when the list is scrolled back to them
+MAX_LISTED_FILES = 1000
+
 class JsonViewerApp:
     def __init__(self, root):
         self.root = root
         self.root.title("JSON Viewer - PostgreSQL")
         self.root.geometry("800x600")
 
-        # Database connection
-        self.conn = psycopg2.connect(
-            dbname="dbname",
-            user="dbuser",
-            password="****",
-            host="****",
-            port="****"
-        )
-        self.cursor = self.conn.cursor()
+        # Database connection pool, settings come from inventory.ini or INVENTORY_DB_* variables
+        self.db = Database()
+        self.storage = self.db.config["storage"]
         self.create_tables()
         self.add_default_admin()
 
@@ -48,11 +65,17 @@ class JsonViewerApp:
         self.search_box = tk.Entry(self.list_frame, textvariable=self.search_var)
         self.search_box.pack(fill=tk.X, padx=5, pady=5)
         self.search_box.bind("<KeyRelease>", self.update_file_list)
+        #match the query against snapshot contents, e.g. Disks.Model:samsung
+        self.content_search_var = tk.BooleanVar()
+        self.content_search_check = tk.Checkbutton(self.list_frame, text="Search contents",
+                                                   variable=self.content_search_var, command=self.start_search)
+        self.content_search_check.pack(anchor=tk.W, padx=5)
+        self.search_after_id = None
 
         #listbox frame and scrollbars
         self.list_scroll_y = tk.Scrollbar(self.list_frame, orient=tk.VERTICAL)
         self.list_scroll_x = tk.Scrollbar(self.list_frame, orient=tk.HORIZONTAL)
-        self.file_listbox = tk.Listbox(self.list_frame, yscrollcommand=self.list_scroll_y.set,
+        self.file_listbox = tk.Listbox(self.list_frame, yscrollcommand=self.on_list_scroll,
                                        xscrollcommand=self.list_scroll_x.set)
         self.file_listbox.bind("<<ListboxSelect>>", self.display_json_content)
         self.list_scroll_y.config(command=self.file_listbox.yview)
@@ -74,9 +97,29 @@ class JsonViewerApp:
         self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree_scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
         self.tree.pack(fill=tk.BOTH, expand=1)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree_nodes = {}
+        self.tree_more = {}
 
         self.paned_window.add(self.tree_frame)
 
+        #background jobs with their progress and a cancel button
+        self.jobs_frame = tk.Frame(self.root)
+        self.jobs_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.jobs_view = ttk.Treeview(self.jobs_frame, columns=("status",), height=3)
+        self.jobs_view.heading("#0", text="Job")
+        self.jobs_view.heading("status", text="Progress")
+        self.jobs_view.column("#0", width=250)
+        self.jobs_view.pack(side=tk.LEFT, fill=tk.X, expand=1, padx=5, pady=2)
+        self.cancel_job_button = tk.Button(self.jobs_frame, text="Cancel Job", command=self.cancel_selected_jobs)
+        self.cancel_job_button.pack(side=tk.RIGHT, padx=5)
+        self.jobs = JobRunner(self.root, self.db, JOB_WORKERS,
+                              on_change=self.show_jobs)
+        self.selected_file = None
+        #parsed snapshots, a click on a cached file only checks the row version
+        self.snapshot_cache = SnapshotCache()
+
         #buttons
         self.import_button = tk.Button(self.root, text="Import JSON Files", command=self.import_json_files)
         self.import_button.pack(side=tk.BOTTOM, pady=5)
@@ -87,46 +130,55 @@ class JsonViewerApp:
         self.minimal_report_button = tk.Button(self.root, text="Minimal Report", command=self.create_minimal_report)
         self.minimal_report_button.pack(side=tk.BOTTOM, pady=5)
 
+        #filenames are paged in from the server as the list is scrolled
+        self.file_search = FileSearch(self.db, self.on_file_page,
+                                      trigram=self.trigram_search, storage=self.storage)
+
         # User authentication
         self.current_user = None
         self.show_login_dialog()
 
     def create_tables(self):
-        try:
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS json_files (
-                    id SERIAL PRIMARY KEY,
-                    filename TEXT UNIQUE NOT NULL,
-                    content JSONB NOT NULL
-                )
-            """)
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    username TEXT UNIQUE NOT NULL,
-                    password TEXT NOT NULL,
-                    is_default BOOLEAN DEFAULT FALSE
-                )
-            """)
-            self.conn.commit()
-            print("Tables created successfully.")
-        except Exception as e:
-            print(f"Error creating tables: {e}")
-            self.conn.rollback()
+        self.trigram_search = False
+        with self.db.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(importer.JSON_FILES_DDL)
+                    create_delta_tables(cursor)
+                    create_inventory_tables(cursor)
+                    create_change_tables(cursor)
+                    create_content_search(cursor)
+                    create_report_rows(cursor)
+                    cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS users (
+                            id SERIAL PRIMARY KEY,
+                            username TEXT UNIQUE NOT NULL,
+                            password TEXT NOT NULL,
+                            is_default BOOLEAN DEFAULT FALSE
+                        )
+                    """)
+                conn.commit()
+                print("Tables created successfully.")
+                self.trigram_search = create_search_indexes(conn)
+            except Exception as e:
+                print(f"Error creating tables: {e}")
+                conn.rollback()
 
     def add_default_admin(self):
         hashed_password = bcrypt.hashpw(b"123", bcrypt.gensalt())
-        try:
-            self.cursor.execute("""
-                INSERT INTO users (username, password, is_default)
-                VALUES (%s, %s, %s)
-                ON CONFLICT (username) DO NOTHING
-            """, ("admin", hashed_password.decode('utf-8'), True))
-            self.conn.commit()
-            print("Default admin added successfully.")
-        except psycopg2.Error as e:
-            print(f"Error adding default admin: {e}")
-            self.conn.rollback()
+        with self.db.connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT INTO users (username, password, is_default)
+                        VALUES (%s, %s, %s)
+                        ON CONFLICT (username) DO NOTHING
+                    """, ("admin", hashed_password.decode('utf-8'), True))
+                conn.commit()
+                print("Default admin added successfully.")
+            except psycopg2.Error as e:
+                print(f"Error adding default admin: {e}")
+                conn.rollback()
 
     def create_toolbar(self):
         toolbar = tk.Frame(self.root, bd=1, relief=tk.RAISED)
@@ -141,6 +193,16 @@ class JsonViewerApp:
         logout_button = tk.Button(toolbar, text="Logout", command=self.logout)
         logout_button.pack(side=tk.LEFT, padx=2, pady=2)
 
+        stats_button = tk.Button(toolbar, text="Query Stats", command=self.show_query_stats)
+        stats_button.pack(side=tk.LEFT, padx=2, pady=2)
+
+    def show_query_stats(self):
+        """per-query timings collected by the connection pool, and the viewer's own stages"""
+        summary = self.db.metrics.summary() or "No queries run yet"
+        stages = instrument.stage_metrics.summary() or "Nothing timed yet"
+        messagebox.showinfo("Query Stats", f"{summary}\n\nStages:\n{stages}\n\n"
+                                           f"Snapshot cache: {self.snapshot_cache.summary()}")
+
     def show_login_dialog(self):
         username = simpledialog.askstring("Login", "Enter username:")
         if username:
@@ -156,78 +218,169 @@ class JsonViewerApp:
                 self.create_user(username, password)
 
     def login(self, username, password):
-        self.cursor.execute("SELECT password, is_default FROM users WHERE username = %s", (username,))
-        result = self.cursor.fetchone()
-        if result and bcrypt.checkpw(password.encode('utf-8'), result[0].encode('utf-8')):
-            self.current_user = username
-            messagebox.showinfo("Login", f"Welcome, {username}!")
-
+        def work(job, conn):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT password, is_default FROM users WHERE username = %s", (username,))
+                result = cursor.fetchone()
+            if not (result and bcrypt.checkpw(password.encode('utf-8'), result[0].encode('utf-8'))):
+                return False
             #if it's the default admin user, disable it after successful login
-            if result[1]: 
-                self.disable_default_admin()
+            if result[1]:
+                self.disable_default_admin(conn)
+            return True
+
+        self.jobs.submit("Login", work, on_done=lambda ok: self.login_finished(username, ok),
+                         on_error=self.job_error("Login"))
 
+    def login_finished(self, username, ok):
+        if ok:
+            self.current_user = username
+            messagebox.showinfo("Login", f"Welcome, {username}!")
             self.load_json_files()
         else:
             messagebox.showerror("Login", "Invalid username or password")
 
     def logout(self):
         self.current_user = None
+        self.selected_file = None
+        self.jobs.cancel_all()
+        self.snapshot_cache.clear()
         self.file_listbox.delete(0, tk.END)
         self.tree.delete(*self.tree.get_children())
         messagebox.showinfo("Logout", "You have been logged out")
 
     def create_user(self, username, password):
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-        try:
-            self.cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
-                                (username, hashed_password.decode('utf-8')))
-            self.conn.commit()
-            messagebox.showinfo("Create User", f"User {username} created successfully")
-        except psycopg2.IntegrityError:
-            self.conn.rollback()
-            messagebox.showerror("Create User", f"Username {username} already exists")
-
-    def disable_default_admin(self):
+        def work(job, conn):
+            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
+                                   (username, hashed_password.decode('utf-8')))
+                conn.commit()
+                return True
+            except psycopg2.IntegrityError:
+                conn.rollback()
+                return False
+
+        def done(created):
+            if created:
+                messagebox.showinfo("Create User", f"User {username} created successfully")
+            else:
+                messagebox.showerror("Create User", f"Username {username} already exists")
+
+        self.jobs.submit("Create user", work, on_done=done, on_error=self.job_error("Create User"))
+
+    def disable_default_admin(self, conn):
         try:
-            self.cursor.execute("DELETE FROM users WHERE username = 'admin' AND is_default = TRUE")
-            self.conn.commit()
+            with conn.cursor() as cursor:
+                cursor.execute("DELETE FROM users WHERE username = 'admin' AND is_default = TRUE")
+            conn.commit()
             print("Default admin user has been disabled.")
         except psycopg2.Error as e:
             print(f"Error disabling default admin: {e}")
+            conn.rollback()
+
+    def show_jobs(self, jobs):
+        """refresh the job list, called by the JobRunner on the GUI thread"""
+        self.jobs_view.delete(*self.jobs_view.get_children())
+        for job in jobs:
+            self.jobs_view.insert('', 'end', iid=str(job.id), text=job.name, values=(job.status,))
+
+    def cancel_selected_jobs(self):
+        for item in self.jobs_view.selection():
+            self.jobs.cancel(int(item))
+
+    def job_error(self, title):
+        """on_error callback that shows the failure in a message box"""
+        return lambda e: messagebox.showerror(title, f"{title} failed: {e}")
 
     def load_json_files(self):
-        """load file names from the database"""
+        """load the first page of file names from the database"""
         if not self.current_user:
             messagebox.showerror("Error", "Please log in to view files")
             return
-        self.cursor.execute("SELECT filename FROM json_files")
-        self.json_files = [row[0] for row in self.cursor.fetchall()]
-        self.update_file_list()
+        self.start_search()
 
     def update_file_list(self, event=None):
-        """update file list based on search"""
-        search_term = self.search_var.get().lower()
+        """debounce keystrokes in the search box"""
+        if self.search_after_id is not None:
+            self.root.after_cancel(self.search_after_id)
+        self.search_after_id = self.root.after(SEARCH_DELAY_MS, self.start_search)
+
+    def start_search(self):
+        """restart the file list from the first page of matches"""
+        self.search_after_id = None
+        if not self.current_user:
+            return
         self.file_listbox.delete(0, tk.END)
-        for file in self.json_files:
-            if search_term in file.lower():
-                self.file_listbox.insert(tk.END, file)
+        self.file_search.search(self.search_var.get(), content=self.content_search_var.get())
+
+    def on_file_page(self, generation, filenames, exhausted, backward):
+        """called from the search thread, hands the page to the GUI thread"""
+        self.root.after(0, self.show_file_page, generation, filenames, backward)
+
+    def show_file_page(self, generation, filenames, backward=False):
+        #a newer search may have started while this page was on its way
+        if generation != self.file_search.generation or not self.current_user:
+            return
+        if backward:
+            #the rows in view stay where they are
+            top = self.file_listbox.nearest(0)
+            self.file_listbox.insert(0, *filenames)
+            self.file_listbox.yview(top + len(filenames))
+        else:
+            self.file_listbox.insert(tk.END, *filenames)
+        self.trim_file_list(backward)
+        #keep paging until the list can actually scroll
+        self.on_list_scroll(*self.file_listbox.yview())
+
+    def trim_file_list(self, backward):
+        """drop the rows beyond MAX_LISTED_FILES from the end the list is scrolling away from"""
+        excess = self.file_listbox.size() - MAX_LISTED_FILES
+        if excess <= 0:
+            return
+        if backward:
+            self.file_listbox.delete(MAX_LISTED_FILES, tk.END)
+            self.file_search.dropped_after(self.file_listbox.get(tk.END))
+        else:
+            top = self.file_listbox.nearest(0)
+            self.file_listbox.delete(0, excess - 1)
+            self.file_search.dropped_before(self.file_listbox.get(0))
+            self.file_listbox.yview(max(top - excess, 0))
+
+    def on_list_scroll(self, first, last):
+        """listbox scrolled, fetch the next page when an end of the listed rows comes into view"""
+        self.list_scroll_y.set(first, last)
+        if not self.current_user:
+            return
+        if float(last) >= 0.9:
+            self.file_search.next_page()
+        elif float(first) <= 0.1:
+            self.file_search.previous_page()
 
     def import_json_files(self):
         """import files into the database"""
         if not self.current_user:
             messagebox.showerror("Error", "Please log in to import files")
             return
-        file_paths = filedialog.askopenfilenames(filetypes=[("JSON files", "*.json")])
-        for file_path in file_paths:
-            filename = os.path.basename(file_path)
-            with open(file_path, 'r') as file:
-                json_data = json.load(file)
-
-            self.cursor.execute(
-                "INSERT INTO json_files (filename, content) VALUES (%s, %s) ON CONFLICT (filename) DO UPDATE SET content = EXCLUDED.content",
-                (filename, Json(json_data))
-            )
-        self.conn.commit()
+        file_paths = filedialog.askopenfilenames(filetypes=[("Snapshots", "*.json *.hwinv"),
+                                                             ("All files", "*.*")])
+        if not file_paths:
+            return
+        file_paths = list(file_paths)
+
+        def work(job, conn):
+            return importer.import_files(conn, file_paths, progress_callback=lambda p: job.progress(str(p)),
+                                         check_cancelled=job.check_cancelled, storage=self.storage)
+
+        self.jobs.submit(f"Import {len(file_paths)} files", work, on_done=self.import_finished,
+                         on_error=self.job_error("Import"))
+
+    def import_finished(self, progress):
+        """back on the GUI thread once the import job is done"""
+        if progress.errors:
+            failed = "\n".join(f"{name}: {err}" for name, err in progress.errors[:20])
+            messagebox.showwarning("Import", f"{len(progress.errors)} files could not be imported:\n{failed}")
         self.load_json_files()
 
     def display_json_content(self, event):
@@ -236,177 +389,150 @@ class JsonViewerApp:
             messagebox.showerror("Error", "Please log in to view file contents")
             return
         selected_file = self.file_listbox.get(tk.ACTIVE)
-        self.cursor.execute("SELECT content FROM json_files WHERE filename = %s", (selected_file,))
-        json_data = self.cursor.fetchone()[0]
-
+        self.selected_file = selected_file
+
+        def work(job, conn):
+            with instrument.span("snapshot.load"):
+                return self.snapshot_cache.fetch(
+                    selected_file, lambda cached: self.fetch_snapshot(conn, selected_file, cached))
+
+        def done(json_data):
+            #ignore snapshots that arrive after the user clicked on another file
+            if selected_file == self.selected_file and json_data is not None:
+                self.show_tree(json_data)
+
+        self.jobs.submit(f"Load {selected_file}", work, on_done=done, on_error=self.job_error("Load"))
+        self.prefetch_neighbours()
+
+    def fetch_snapshot(self, conn, filename, cached_version):
+        """(version, content) of a snapshot, content is None when cached_version is still current"""
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT version, CASE WHEN version = %s THEN NULL ELSE content END
+                FROM json_snapshots WHERE filename = %s
+            """, (cached_version, filename))
+            row = cursor.fetchone()
+        return (row[0], row[1]) if row else (None, None)
+
+    def prefetch_neighbours(self):
+        """load the snapshots above and below the selection in the background"""
+        index = self.file_listbox.index(tk.ACTIVE)
+        for neighbour in (index - 1, index + 1):
+            if 0 <= neighbour < self.file_listbox.size():
+                filename = self.file_listbox.get(neighbour)
+                self.snapshot_cache.prefetch(filename, lambda cached, filename=filename: self.db.run(
+                    lambda conn: self.fetch_snapshot(conn, filename, cached)))
+
+    def show_tree(self, json_data):
+        """replace the tree with a snapshot, only the top level is materialized"""
         self.tree.delete(*self.tree.get_children())
+        self.tree_nodes = {}
+        self.tree_more = {}
         self.populate_tree('', json_data)
-
-    def populate_tree(self, parent, json_data):
-        """populate treeview"""
-        if isinstance(json_data, dict):
-            for key, value in json_data.items():
-                node_id = self.tree.insert(parent, 'end', text=str(key), open=True)
-                self.populate_tree(node_id, value)
-        elif isinstance(json_data, list):
-            for idx, value in enumerate(json_data):
-                node_id = self.tree.insert(parent, 'end', text=f"Item {idx}", open=True)
-                self.populate_tree(node_id, value)
-        else:
+        for node_id in self.tree.get_children():
+            self.tree.item(node_id, open=True)
+            self.expand_node(node_id)
+
+    @instrument.timed("tree.populate")
+    def populate_tree(self, parent, json_data, start=0):
+        """insert up to TREE_CHUNK_SIZE children of json_data, containers get a placeholder"""
+        if not isinstance(json_data, (dict, list)):
             self.tree.insert(parent, 'end', text=str(json_data))
+            return
+        #the first record is json_data itself, its children follow
+        records = flatten(json_data, max_depth=1, paths=False)
+        for key, _, value in islice(records, start + 1, start + 1 + TREE_CHUNK_SIZE):
+            if isinstance(value, (dict, list)):
+                node_id = self.tree.insert(parent, 'end', text=label(key))
+                if value:
+                    #children are inserted when the node is first opened
+                    self.tree_nodes[node_id] = value
+                    self.tree.insert(node_id, 'end', text="...")
+            else:
+                node_id = self.tree.insert(parent, 'end', text=label(key), open=True)
+                self.tree.insert(node_id, 'end', text=str(value))
+        remaining = len(json_data) - start - TREE_CHUNK_SIZE
+        if remaining > 0:
+            more_id = self.tree.insert(parent, 'end', text=f"Show more ({remaining} remaining)")
+            self.tree_more[more_id] = (parent, json_data, start + TREE_CHUNK_SIZE)
+
+    def expand_node(self, node_id):
+        """swap the placeholder of a node for its first chunk of children"""
+        json_data = self.tree_nodes.pop(node_id, None)
+        if json_data is not None:
+            self.tree.delete(*self.tree.get_children(node_id))
+            self.populate_tree(node_id, json_data)
+
+    def on_tree_open(self, event):
+        self.expand_node(self.tree.focus())
+
+    def on_tree_select(self, event):
+        """selecting a "show more" item replaces it with the next chunk"""
+        for item in self.tree.selection():
+            if item in self.tree_more:
+                parent, json_data, start = self.tree_more.pop(item)
+                self.tree.delete(item)
+                self.populate_tree(parent, json_data, start)
 
     def export_to_excel(self):
         """export all Excel"""
         if not self.current_user:
             messagebox.showerror("Error", "Please log in to export files")
             return
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "JSON Data"
-
-        row_num = 1
-        self.cursor.execute("SELECT filename, content FROM json_files")
-        for filename, json_data in self.cursor.fetchall():
-            ws.cell(row=row_num, column=1, value=f"File: {filename}")
-            row_num = self.write_json_to_sheet(ws, json_data, row_num + 1)
-            row_num += 1 
-
-        # Save the Excel file
         excel_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                                   filetypes=[("Excel files", "*.xlsx")])
-        if excel_path:
-            wb.save(excel_path)
-            messagebox.showinfo("Success", "Excel file created successfully!")
-
-    def write_json_to_sheet(self, sheet, json_data, start_row, start_col=1):
-        """Write content to Excel"""
-        if isinstance(json_data, dict):
-            for key, value in json_data.items():
-                sheet.cell(row=start_row, column=start_col, value=key)
-                start_row = self.write_json_to_sheet(sheet, value, start_row + 1, start_col + 1)
-        elif isinstance(json_data, list):
-            for idx, value in enumerate(json_data):
-                sheet.cell(row=start_row, column=start_col, value=f"Item {idx}")
-                start_row = self.write_json_to_sheet(sheet, value, start_row + 1, start_col + 1)
-        else:
-            sheet.cell(row=start_row, column=start_col, value=json_data)
-        return start_row
+        if not excel_path:
+            return
+
+        self.jobs.submit("Export to Excel", lambda job, conn: self.write_excel_export(job, conn, excel_path),
+                         on_done=lambda _: messagebox.showinfo("Success", "Excel file created successfully!"),
+                         on_error=self.job_error("Export"))
+
+    def write_excel_export(self, job, conn, excel_path):
+        """export job, runs on a worker thread"""
+        exports.write_export_xlsx(excel_path, exports.db_export_cells(conn),
+                                  progress=job.progress, check_cancelled=job.check_cancelled)
 
     def create_minimal_report(self):
         """create a minimal report"""
         if not self.current_user:
             messagebox.showerror("Error", "Please log in to create a report")
             return
-        all_data = []
-
-        self.cursor.execute("SELECT filename, content FROM json_files")
-        for filename, data in self.cursor.fetchall():
-            filename_parts = filename.split('_')
-            row = {
-                'ComputerName': filename_parts[0] if len(filename_parts) > 0 else '',
-                'DomainName': filename_parts[1] if len(filename_parts) > 1 else '',
-                'DateTime': filename_parts[2].split('.')[0] if len(filename_parts) > 2 else ''
-            }
-
-            #CPU
-            cpu_list = data.get('CPU', [{}])
-            for cpu in cpu_list:
-                row.update({
-                    'CPU_Name': cpu.get('Name', ''),
-                    'CPU_SocketDesignation': cpu.get('SocketDesignation', '')
-                })
-
-            #Motherboard
-            motherboard_list = data.get('Motherboard', [{}])
-            for motherboard in motherboard_list:
-                row.update({
-                    'MB_Manufacturer': motherboard.get('Manufacturer', ''),
-                    'MB_Product': motherboard.get('Product', '')
-                })
-
-            #Memory Modules
-            memory_modules = data.get('MemoryModules', [])
-            for i, module in enumerate(memory_modules):
-                prefix = f'MemoryModule_{i + 1}_'
-                row.update({
-                    f'{prefix}Manufacturer': module.get('Manufacturer', ''),
-                    f'{prefix}Capacity': module.get('Capacity', '')
-                })
-
-            #Printers
-            printers = data.get('Printers', [])
-            for i, printer in enumerate(printers):
-                if printer.get('PrinterStatus') == 'Online':
-                    prefix = f'Printer_{i + 1}_'
-                    row.update({
-                        f'{prefix}DriverName': printer.get('DriverName')
-                    })
-
-
-            #WIA Devices
-            wia_devices = data.get('WIADevices', [])
-            #Combine WIA device names into a single column
-            wia_device_names = [device.get('Name', device) if isinstance(device, dict) else device for device in
-                                wia_devices]
-            row['WIADevices'] = ', '.join(wia_device_names)
-
-            #DVD/CD-ROM
-            dvd_drives = data.get('DVD/CD-ROM', [])
-            for i, drive in enumerate(dvd_drives):
-                prefix = f'DVDDrive_{i + 1}_'
-                row.update({
-                    f'{prefix}Caption': drive.get('Caption'),
-                    f'{prefix}Id': drive.get('Id')
-                })
-
-            #Disks
-            disks = data.get('Disks', [])
-            for i, disk in enumerate(disks):
-                prefix = f'Disk_{i + 1}_'
-                row.update({
-                    f'{prefix}Model': disk.get('Model', ''),
-                    f'{prefix}Size': disk.get('Size', '')
-                })
-
-            #Operating System
-            os_data = data.get('OperatingSystem', [{}])
-            for os_info in os_data:
-                row.update({
-                    'OS_Caption': os_info.get('Caption', ''),
-                    'OS_InstallDate': os_info.get('InstallDate', '')
-                })
-
-            #Network Adapters
-            network_adapters = data.get('NetworkAdapters', [])
-            for i, adapter in enumerate(network_adapters):
-                prefix = f'NetworkAdapter_{i + 1}_'
-                row.update({
-                    f'{prefix}Description': adapter.get('Description', ''),
-                    f'{prefix}MACAddress': adapter.get('MACAddress', ''),
-                    f'{prefix}IPv4': adapter.get('IPv4', '')
-                })
-
-            #Windows SID
-            row['WindowsSID'] = data.get('WindowsSID')
-
-            all_data.append(row)
-
-        df = pd.DataFrame(all_data)
-        df = df.reindex(sorted(df.columns), axis=1)
-
         output_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
-                                                   filetypes=[("Excel files", "*.xlsx")])
-        if output_path:
-            df.to_excel(output_path, index=False)
-            messagebox.showinfo("Success", "Minimal report created successfully!")
+                                                   filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"),
+                                                              ("Parquet files", "*.parquet")])
+        if not output_path:
+            return
+        latest = messagebox.askyesnocancel("Minimal report", "Only the latest snapshot of each machine?\n\n"
+                                           "No writes a row for every snapshot.")
+        if latest is None:
+            return
+
+        def work(job, conn):
+            #the rows are materialized in report_row by the importer, see report_rows.py
+            columns, rows = exports.db_report(conn, latest)
+            job.progress("Writing report")
+            exports.write_report(output_path, columns, rows, check_cancelled=job.check_cancelled)
+
+        self.jobs.submit("Minimal report", work,
+                         on_done=lambda _: messagebox.showinfo("Success", "Minimal report created successfully!"),
+                         on_error=self.job_error("Minimal report"))
 
 
     def __del__(self):
         """Close the database connection when the object is destroyed."""
-        if hasattr(self, 'conn'):
-            self.conn.close()
+        if hasattr(self, 'jobs'):
+            self.jobs.shutdown()
+        if hasattr(self, 'file_search'):
+            self.file_search.close()
+        if hasattr(self, 'snapshot_cache'):
+            self.snapshot_cache.close()
+        if hasattr(self, 'db'):
+            self.db.close()
 
 if __name__ == "__main__":
+    #INVENTORY_PROFILE / INVENTORY_METRICS, see instrument.py
+    instrument.configure()
     root = tk.Tk()
     app = JsonViewerApp(root)
     root.mainloop()
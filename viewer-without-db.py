@@ -1,8 +1,16 @@
 import os
-import json
 import tkinter as tk
+from itertools import islice
 from tkinter import ttk, filedialog, messagebox
-from openpyxl import Workbook
+
+import exports
+import instrument
+from flatten import flatten, label
+from catalog import Catalog
+from snapshot_cache import SnapshotCache, file_fetcher
+
+#max sibling items inserted at once, the rest are behind a "show more" item
+TREE_CHUNK_SIZE = 200
 
 class JsonViewerApp:
     def __init__(self, root):
@@ -23,6 +31,11 @@ class JsonViewerApp:
         self.search_box = tk.Entry(self.list_frame, textvariable=self.search_var)
         self.search_box.pack(fill=tk.X, padx=5, pady=5)
         self.search_box.bind("<KeyRelease>", self.update_file_list)
+        #match the query against snapshot contents, e.g. Disks.Model:samsung
+        self.content_search_var = tk.BooleanVar()
+        self.content_search_check = tk.Checkbutton(self.list_frame, text="Search contents",
+                                                   variable=self.content_search_var, command=self.update_file_list)
+        self.content_search_check.pack(anchor=tk.W, padx=5)
         # Listbox frame
         self.list_scroll_y = tk.Scrollbar(self.list_frame, orient=tk.VERTICAL)
         self.list_scroll_x = tk.Scrollbar(self.list_frame, orient=tk.HORIZONTAL)
@@ -43,91 +56,154 @@ class JsonViewerApp:
         self.tree_scroll_y.pack(side=tk.RIGHT, fill=tk.Y)
         self.tree_scroll_x.pack(side=tk.BOTTOM, fill=tk.X)
         self.tree.pack(fill=tk.BOTH, expand=1)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+        self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree_nodes = {}
+        self.tree_more = {}
         self.paned_window.add(self.tree_frame)
         self.export_button = tk.Button(self.root, text="Export to Excel", command=self.export_to_excel)
         self.export_button.pack(side=tk.BOTTOM, pady=10)
-        self.json_files = []
+        self.minimal_report_button = tk.Button(self.root, text="Minimal Report", command=self.create_minimal_report)
+        self.minimal_report_button.pack(side=tk.BOTTOM, pady=5)
+        self.catalog = None
+        self.snapshot_cache = SnapshotCache()
         self.load_json_files()
 
     def load_json_files(self):
-        """Load file names from the 'json_files' dir"""
+        """Index the 'json_files' dir, only new or modified files are parsed"""
         self.json_dir = os.path.join(os.getcwd(), "json_files")
         if not os.path.exists(self.json_dir):
             os.makedirs(self.json_dir)
-        self.json_files = [f for f in os.listdir(self.json_dir) if f.endswith(".json")]
+        if self.catalog is None:
+            self.catalog = Catalog(self.json_dir)
+        self.catalog.refresh()
         self.update_file_list()
 
     def update_file_list(self, event=None):
         """Update list on search"""
-        search_term = self.search_var.get().lower()
         self.file_listbox.delete(0, tk.END)
-        for file in self.json_files:
-            if search_term in file.lower():
-                self.file_listbox.insert(tk.END, file)
+        if self.content_search_var.get():
+            try:
+                files = self.catalog.search_contents(self.search_var.get())
+            except ValueError:
+                #unbalanced quote while the query is still being typed
+                return
+        else:
+            files = self.catalog.filenames(self.search_var.get())
+        for file in files:
+            self.file_listbox.insert(tk.END, file)
 
     def display_json_content(self, event):
         """Display content in the tree view"""
         selected_file = self.file_listbox.get(tk.ACTIVE)
-        file_path = os.path.join(self.json_dir, selected_file)
-        with open(file_path, 'r') as file:
-            json_data = json.load(file)
+        with instrument.span("snapshot.load"):
+            json_data = self.snapshot_cache.fetch(selected_file, self.snapshot_fetcher(selected_file))
+        if json_data is None:
+            #deleted from the share since the list was filled
+            messagebox.showwarning("Snapshot", f"{selected_file} no longer exists")
+            self.catalog.refresh()
+            self.update_file_list()
+            return
+        self.show_tree(json_data)
+        self.prefetch_neighbours()
+
+    def snapshot_fetcher(self, filename):
+        return file_fetcher(os.path.join(self.json_dir, filename))
 
+    def prefetch_neighbours(self):
+        """parse the files above and below the selection in the background"""
+        index = self.file_listbox.index(tk.ACTIVE)
+        for neighbour in (index - 1, index + 1):
+            if 0 <= neighbour < self.file_listbox.size():
+                filename = self.file_listbox.get(neighbour)
+                self.snapshot_cache.prefetch(filename, self.snapshot_fetcher(filename))
+
+    def show_tree(self, json_data):
+        """replace the tree with a snapshot, only the top level is materialized"""
         self.tree.delete(*self.tree.get_children())
+        self.tree_nodes = {}
+        self.tree_more = {}
         self.populate_tree('', json_data)
+        for node_id in self.tree.get_children():
+            self.tree.item(node_id, open=True)
+            self.expand_node(node_id)
 
-    def populate_tree(self, parent, json_data):
-        """populate treeview"""
-        if isinstance(json_data, dict):
-            for key, value in json_data.items():
-                node_id = self.tree.insert(parent, 'end', text=str(key), open=True)
-                self.populate_tree(node_id, value)
-        elif isinstance(json_data, list):
-            for idx, value in enumerate(json_data):
-                node_id = self.tree.insert(parent, 'end', text=f"Item {idx}", open=True)
-                self.populate_tree(node_id, value)
-        else:
+    @instrument.timed("tree.populate")
+    def populate_tree(self, parent, json_data, start=0):
+        """insert up to TREE_CHUNK_SIZE children of json_data, containers get a placeholder"""
+        if not isinstance(json_data, (dict, list)):
             self.tree.insert(parent, 'end', text=str(json_data))
+            return
+        #the first record is json_data itself, its children follow
+        records = flatten(json_data, max_depth=1, paths=False)
+        for key, _, value in islice(records, start + 1, start + 1 + TREE_CHUNK_SIZE):
+            if isinstance(value, (dict, list)):
+                node_id = self.tree.insert(parent, 'end', text=label(key))
+                if value:
+                    #children are inserted when the node is first opened
+                    self.tree_nodes[node_id] = value
+                    self.tree.insert(node_id, 'end', text="...")
+            else:
+                node_id = self.tree.insert(parent, 'end', text=label(key), open=True)
+                self.tree.insert(node_id, 'end', text=str(value))
+        remaining = len(json_data) - start - TREE_CHUNK_SIZE
+        if remaining > 0:
+            more_id = self.tree.insert(parent, 'end', text=f"Show more ({remaining} remaining)")
+            self.tree_more[more_id] = (parent, json_data, start + TREE_CHUNK_SIZE)
+
+    def expand_node(self, node_id):
+        """swap the placeholder of a node for its first chunk of children"""
+        json_data = self.tree_nodes.pop(node_id, None)
+        if json_data is not None:
+            self.tree.delete(*self.tree.get_children(node_id))
+            self.populate_tree(node_id, json_data)
+
+    def on_tree_open(self, event):
+        self.expand_node(self.tree.focus())
+
+    def on_tree_select(self, event):
+        """selecting a "show more" item replaces it with the next chunk"""
+        for item in self.tree.selection():
+            if item in self.tree_more:
+                parent, json_data, start = self.tree_more.pop(item)
+                self.tree.delete(item)
+                self.populate_tree(parent, json_data, start)
 
     def export_to_excel(self):
         """Export all"""
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "JSON Data"
-
-        row_num = 1
-        for json_file in os.listdir(self.json_dir):
-            if json_file.endswith(".json"):
-                file_path = os.path.join(self.json_dir, json_file)
-                with open(file_path, 'r') as file:
-                    json_data = json.load(file)
-
-                # file name in the first column
-                ws.cell(row=row_num, column=1, value=f"File: {json_file}")
-                row_num = self.write_json_to_sheet(ws, json_data, row_num + 1)
-                row_num += 1 
-
-        # excel file
         excel_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
                                                   filetypes=[("Excel files", "*.xlsx")])
-        if excel_path:
-            wb.save(excel_path)
-            messagebox.showinfo("Success", "Excel file created successfully!")
-
-    def write_json_to_sheet(self, sheet, json_data, start_row, start_col=1):
-        """Write to an Excel sheet."""
-        if isinstance(json_data, dict):
-            for key, value in json_data.items():
-                sheet.cell(row=start_row, column=start_col, value=key)
-                start_row = self.write_json_to_sheet(sheet, value, start_row + 1, start_col + 1)
-        elif isinstance(json_data, list):
-            for idx, value in enumerate(json_data):
-                sheet.cell(row=start_row, column=start_col, value=f"Item {idx}")
-                start_row = self.write_json_to_sheet(sheet, value, start_row + 1, start_col + 1)
-        else:
-            sheet.cell(row=start_row, column=start_col, value=json_data)
-        return start_row
+        if not excel_path:
+            return
+
+        #pick up files added since startup, the cells of unchanged files come from the catalog
+        self.catalog.refresh()
+
+        exports.write_export_xlsx(excel_path, self.catalog.export_cells())
+        errors = self.catalog.errors()
+        if errors:
+            skipped = "\n".join(f"{name}: {err}" for name, err in errors[:20])
+            messagebox.showwarning("Export", f"{len(errors)} unreadable files were skipped:\n{skipped}")
+        messagebox.showinfo("Success", "Excel file created successfully!")
+
+    def create_minimal_report(self):
+        """one row per snapshot, built from the summary rows in the catalog"""
+        output_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                                   filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"),
+                                                              ("Parquet files", "*.parquet")])
+        if not output_path:
+            return
+        latest = messagebox.askyesnocancel("Minimal report", "Only the latest snapshot of each machine?\n\n"
+                                           "No writes a row for every snapshot.")
+        if latest is None:
+            return
+        self.catalog.refresh()
+        exports.write_report(output_path, *exports.catalog_report(self.catalog, latest))
+        messagebox.showinfo("Success", "Minimal report created successfully!")
 
 if __name__ == "__main__":
+    #INVENTORY_PROFILE / INVENTORY_METRICS, see instrument.py
+    instrument.configure()
     root = tk.Tk()
     app = JsonViewerApp(root)
     root.mainloop()
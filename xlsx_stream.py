@@ -0,0 +1,98 @@
+from flatten import flatten, label
+
+#Excel's hard limit of rows per worksheet
+EXCEL_MAX_ROWS = 1048576
+
+
+class StreamingSheet:
+    """cell(row=, column=, value=) on top of a write-only workbook
+
+    Write-only sheets can only append whole rows, so cells are buffered until
+    a later row is written and then flushed. Rows must therefore be written in
+    increasing order, columns within a row may come in any order. When a sheet
+    is full a new one named "<title> 2", "<title> 3", ... is started.
+
+    A header is written as the first row of every sheet, row numbers passed
+    to cell() then count the rows below it.
+    """
+
+    def __init__(self, workbook, title, max_rows=EXCEL_MAX_ROWS, header=None):
+        self.workbook = workbook
+        self.title = title
+        self.max_rows = max_rows
+        self.header = header
+        self.sheet_count = 0
+        self.sheet = None
+        self.row_offset = 0
+        self.sheet_rows = 0
+        self.current_row = None
+        self.current_cells = {}
+        self.last_row = 0
+        self.new_sheet(0)
+
+    def new_sheet(self, row_offset):
+        self.sheet_count += 1
+        title = self.title if self.sheet_count == 1 else f"{self.title} {self.sheet_count}"
+        self.sheet = self.workbook.create_sheet(title)
+        self.row_offset = row_offset
+        self.sheet_rows = 0
+        if self.header is not None:
+            self.sheet.append(list(self.header))
+            self.sheet_rows = 1
+            self.row_offset -= 1
+
+    def cell(self, row, column, value=None):
+        if self.current_row is not None and row < self.current_row:
+            raise ValueError(f"row {row} written after row {self.current_row}")
+        if row != self.current_row:
+            self.flush()
+            self.current_row = row
+        self.current_cells[column] = value
+
+    def flush(self):
+        """write the buffered row, padding any skipped rows with empty ones"""
+        if self.current_row is None:
+            return
+        if self.current_row - self.row_offset > self.max_rows:
+            self.new_sheet(self.current_row - 1)
+        while self.sheet_rows < self.current_row - self.row_offset - 1:
+            self.sheet.append([])
+            self.sheet_rows += 1
+        width = max(self.current_cells)
+        self.sheet.append([self.current_cells.get(col) for col in range(1, width + 1)])
+        self.sheet_rows += 1
+        self.last_row = self.current_row
+        self.current_row = None
+        self.current_cells = {}
+
+    def append(self, values):
+        """write values to the columns of the next row"""
+        row = (self.current_row if self.current_row is not None else self.last_row) + 1
+        for column, value in enumerate(values, 1):
+            self.cell(row=row, column=column, value=value)
+
+    def close(self):
+        self.flush()
+
+
+def sheet_cells(json_data, start_row=1, start_col=1):
+    """the export layout of a snapshot as ((row, column, value) cells, row of the last cell)
+
+    Keys and "Item n" labels go one column right per nesting level, a value
+    goes on the row below its key, the layout of write_json_to_sheet.
+    """
+    cells = []
+    append = cells.append
+    row = start_row
+    if not isinstance(json_data, (dict, list)):
+        append((row, start_col, json_data))
+        return cells, row
+    records = flatten(json_data, paths=False)
+    next(records)  #json_data itself
+    for key, depth, value in records:
+        col = start_col + depth - 1
+        append((row, col, key if key.__class__ is str else label(key)))
+        row += 1
+        if value.__class__ is not dict and value.__class__ is not list:
+            append((row, col + 1, value))
+    return cells, row